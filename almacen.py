@@ -0,0 +1,324 @@
+# Almacén columnar de crímenes, inmutable y compartido entre sesiones
+#
+# Cada columna es un arreglo de numpy de solo lectura: las numéricas y fechas tal cual, las
+# de texto como códigos enteros más su lista de categorías, y las coordenadas como dos
+# arreglos float64. Las sesiones no copian los datos: filtrar devuelve los números de fila
+# seleccionados y solo las filas que se muestran se convierten en un GeoDataFrame.
+#
+#     almacen = construir_almacen(gdf)
+#     filas = seleccionar(almacen, filtros)
+#     gdf = materializar(almacen, filas)
+#
+# En disco, el almacén es un directorio con un archivo binario crudo por columna y un
+# esquema JSON. `abrir_almacen` los mapea en memoria: abrir es casi instantáneo sin
+# importar los años de historia, y el sistema operativo lee las páginas a medida que se usan.
+import json
+import os
+import shutil
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from datos import FILTROS_VACIOS, normalizar_crimenes
+
+ESQUEMA = "esquema.json"
+
+
+def solo_lectura(arreglo):
+    arreglo.setflags(write=False)
+    return arreglo
+
+
+def _texto(serie):
+    return serie.dtype == object or pd.api.types.is_string_dtype(serie.dtype)
+
+
+def construir_almacen(gdf):
+    if "fecha_dt" not in gdf.columns:
+        gdf = normalizar_crimenes(gdf)
+    geometria = gdf.geometry
+    almacen = {
+        "n": len(gdf),
+        "crs": gdf.crs,
+        "columnas": [c for c in gdf.columns if c != geometria.name],
+        "valores": {},
+        "categorias": {},
+        "x": solo_lectura(np.ascontiguousarray(geometria.x.to_numpy(dtype=np.float64))),
+        "y": solo_lectura(np.ascontiguousarray(geometria.y.to_numpy(dtype=np.float64))),
+    }
+    for columna in almacen["columnas"]:
+        serie = gdf[columna]
+        if _texto(serie):
+            # Códigos ordenados alfabéticamente; -1 para valores faltantes
+            codigos, categorias = pd.factorize(serie, sort=True)
+            almacen["valores"][columna] = solo_lectura(codigos.astype(np.int32))
+            almacen["categorias"][columna] = solo_lectura(np.asarray(categorias, dtype=object))
+        else:
+            almacen["valores"][columna] = solo_lectura(np.array(serie.to_numpy()))
+    return almacen
+
+
+def categorias(almacen, columna):
+    # Valores distintos de una columna de texto
+    return sorted(almacen["categorias"].get(columna, []))
+
+
+def valores_presentes(almacen, filas, columna):
+    # Valores distintos de una columna de texto entre las filas seleccionadas
+    codigos = np.unique(almacen["valores"][columna][filas])
+    return sorted(almacen["categorias"][columna][codigos[codigos >= 0]])
+
+
+def rango_fechas(almacen):
+    fechas = almacen["valores"]["fecha_dt"]
+    validas = fechas[~np.isnat(fechas)]
+    return pd.Timestamp(validas.min()).date(), pd.Timestamp(validas.max()).date()
+
+
+def _igual(almacen, columna, valor):
+    if columna in almacen["categorias"]:
+        posicion = np.flatnonzero(almacen["categorias"][columna] == valor)
+        if len(posicion) == 0:
+            return np.zeros(almacen["n"], dtype=bool)
+        return almacen["valores"][columna] == posicion[0]
+    return almacen["valores"][columna] == valor
+
+
+def mascara(almacen, filtros):
+    # Mismo criterio que datos.aplicar_filtros, sobre los arreglos
+    filtros = dict(FILTROS_VACIOS, **filtros)
+    valores = almacen["valores"]
+    seleccion = np.ones(almacen["n"], dtype=bool)
+
+    # Como en el cubo, un filtro sobre una columna que el archivo no trae no descarta filas
+    for columna in ("barrio", "tipo_crimen", "sexo"):
+        if filtros[columna] != "Todos" and columna in valores:
+            seleccion &= _igual(almacen, columna, filtros[columna])
+
+    rango_fecha = filtros["rango_fecha"]
+    if rango_fecha is not None:
+        fechas = valores["fecha_dt"]
+        desde = np.datetime64(pd.Timestamp(rango_fecha[0]))
+        hasta = np.datetime64(pd.Timestamp(rango_fecha[1]) + pd.Timedelta(days=1))
+        # NaT no cumple ninguna de las dos comparaciones
+        seleccion &= (fechas >= desde) & (fechas < hasta)
+
+    if "hora_h" in valores:
+        min_hora, max_hora = filtros["horas"]
+        horas = valores["hora_h"].astype(np.float64)
+        seleccion &= (horas >= min_hora) & (horas <= max_hora)
+
+    for grupo, filtro_activo in filtros["sociales"].items():
+        if filtro_activo and grupo in valores:
+            seleccion &= _igual(almacen, grupo, True)
+    return seleccion
+
+
+def seleccionar(almacen, filtros):
+    # Números de fila que cumplen los filtros
+    return np.flatnonzero(mascara(almacen, filtros))
+
+
+def conteo_barrios(almacen, filas):
+    # Igual que datos.conteo_por_barrio sobre las filas seleccionadas, con un bincount
+    codigos = almacen["valores"]["barrio"][filas]
+    nombres = almacen["categorias"]["barrio"]
+    cantidades = np.bincount(codigos[codigos >= 0], minlength=len(nombres))
+    conteo = pd.DataFrame({"barrio": nombres, "cantidad_crimenes": cantidades})
+    conteo = conteo[conteo["cantidad_crimenes"] > 0]
+    return conteo.sort_values("cantidad_crimenes", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def conteo_semana_hora(almacen, filas):
+    # Igual que datos.semana_hora para filas sueltas (p. ej. dentro de un área dibujada)
+    dias = almacen["valores"]["fecha_dt"][filas].astype("datetime64[D]")
+    if "hora_h" in almacen["valores"]:
+        horas = almacen["valores"]["hora_h"][filas].astype(np.float64)
+    else:
+        horas = np.zeros(len(dias))
+    # Horas faltantes: NaN en columnas float y -1 en las enteras (ver _faltante); NaN no
+    # cumple la comparación
+    validas = ~np.isnat(dias) & (horas >= 0)
+    # El 5 de enero de 1970 fue lunes
+    dia_semana = (dias[validas].astype(np.int64) - 4) % 7
+    return np.bincount(dia_semana * 24 + horas[validas].astype(np.int64), minlength=168).reshape(7, 24)
+
+
+def cuadros_tiempo(almacen, filas, granularidad="Diaria"):
+    # Cuadros de la animación: las filas ordenadas por día o semana y, para cada periodo
+    # entre el primero y el último (también los vacíos), su tramo inicios[i]:inicios[i + 1].
+    # Las semanas van de lunes a domingo y se etiquetan con el domingo, como en el cubo.
+    dias = almacen["valores"]["fecha_dt"][filas].astype("datetime64[D]")
+    con_fecha = ~np.isnat(dias)
+    filas, dias = np.asarray(filas)[con_fecha], dias[con_fecha].astype(np.int64)
+    if len(filas) == 0:
+        return {"filas": filas, "inicios": np.zeros(1, dtype=np.int64), "fechas": pd.DatetimeIndex([])}
+    # El 5 de enero de 1970 fue lunes
+    periodos = dias if granularidad == "Diaria" else (dias - 4) // 7
+    primero = periodos.min()
+    periodos = periodos - primero
+    orden = np.argsort(periodos, kind="stable")
+    inicios = np.concatenate([[0], np.cumsum(np.bincount(periodos, minlength=periodos.max() + 1))])
+    if granularidad == "Diaria":
+        fechas = pd.date_range(pd.Timestamp(primero, unit="D"), periods=len(inicios) - 1, freq="D")
+    else:
+        fechas = pd.date_range(pd.Timestamp(primero * 7 + 4 + 6, unit="D"), periods=len(inicios) - 1, freq="W")
+    return {"filas": filas[orden], "inicios": inicios, "fechas": fechas}
+
+
+def tabla(almacen, filas, columnas=None):
+    # DataFrame (sin geometría) con las filas y columnas pedidas, con los textos decodificados
+    columnas = almacen["columnas"] if columnas is None else columnas
+    datos = {}
+    for columna in columnas:
+        valores = almacen["valores"][columna][filas]
+        if columna in almacen["categorias"]:
+            etiquetas = almacen["categorias"][columna]
+            valores = pd.Categorical.from_codes(valores, etiquetas).astype(object)
+        datos[columna] = valores
+    return pd.DataFrame(datos, index=pd.Index(filas))
+
+
+def materializar(almacen, filas, columnas=None):
+    # GeoDataFrame solo con las filas pedidas; el índice son los números de fila
+    geometria = gpd.points_from_xy(almacen["x"][filas], almacen["y"][filas])
+    return gpd.GeoDataFrame(tabla(almacen, filas, columnas), geometry=geometria, crs=almacen["crs"])
+
+
+# --- ALMACÉN EN DISCO ---
+def _archivo_columna(i):
+    return f"columna_{i:03d}.bin"
+
+
+def guardar_almacen(almacen, directorio):
+    # Se escribe en un directorio temporal que luego reemplaza al anterior completo
+    temporal = directorio.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+
+    arreglos = {"x": almacen["x"], "y": almacen["y"]}
+    archivos = {"x": "x.bin", "y": "y.bin"}
+    for i, columna in enumerate(almacen["columnas"]):
+        arreglos[columna] = almacen["valores"][columna]
+        archivos[columna] = _archivo_columna(i)
+    for columna, arreglo in arreglos.items():
+        np.ascontiguousarray(arreglo).tofile(os.path.join(temporal, archivos[columna]))
+
+    esquema = {
+        "n": almacen["n"],
+        "crs": str(almacen["crs"]) if almacen["crs"] is not None else None,
+        "columnas": almacen["columnas"],
+        "archivos": archivos,
+        "tipos": {c: arreglos[c].dtype.str for c in arreglos},
+        "categorias": {c: [v.item() if hasattr(v, "item") else v for v in cats]
+                       for c, cats in almacen["categorias"].items()},
+    }
+    escribir_esquema(temporal, esquema)
+
+    anterior = directorio.rstrip(os.sep) + ".anterior"
+    if os.path.exists(directorio):
+        os.replace(directorio, anterior)
+    os.replace(temporal, directorio)
+    shutil.rmtree(anterior, ignore_errors=True)
+
+
+def _mapear(ruta, tipo, n):
+    if n == 0:
+        # No se puede mapear un archivo vacío
+        return solo_lectura(np.empty(0, dtype=tipo))
+    return np.memmap(ruta, dtype=tipo, mode="r", shape=(n,))
+
+
+def leer_esquema(directorio):
+    try:
+        with open(os.path.join(directorio, ESQUEMA), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def escribir_esquema(directorio, esquema):
+    # El esquema define cuántas filas son válidas: se reemplaza de forma atómica
+    ruta = os.path.join(directorio, ESQUEMA)
+    with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(esquema, f, ensure_ascii=False)
+    os.replace(ruta + ".tmp", ruta)
+
+
+def abrir_almacen(directorio):
+    # Almacén con las columnas mapeadas en memoria (de solo lectura); None si no existe
+    esquema = leer_esquema(directorio)
+    if esquema is None:
+        return None
+
+    n = esquema["n"]
+
+    def columna(nombre):
+        return _mapear(os.path.join(directorio, esquema["archivos"][nombre]),
+                       np.dtype(esquema["tipos"][nombre]), n)
+
+    return {
+        "n": n,
+        "crs": esquema["crs"],
+        "columnas": esquema["columnas"],
+        "valores": {c: columna(c) for c in esquema["columnas"]},
+        "categorias": {c: solo_lectura(np.asarray(v, dtype=object))
+                       for c, v in esquema["categorias"].items()},
+        "x": columna("x"),
+        "y": columna("y"),
+    }
+
+
+def _faltante(tipo):
+    # Valor para columnas que el lote no trae (y NaN en columnas enteras)
+    if tipo.kind == "f":
+        return np.nan
+    if tipo.kind == "M":
+        return np.datetime64("NaT")
+    if tipo.kind == "b":
+        return False
+    return -1
+
+
+def _columna_para_anexar(gdf, columna, tipo, categorias):
+    n = len(gdf)
+    if columna in ("x", "y"):
+        return getattr(gdf.geometry, columna).to_numpy(dtype=np.float64)
+    if categorias is not None:
+        if columna not in gdf.columns:
+            return np.full(n, -1, dtype=tipo)
+        serie = gdf[columna]
+        if not _texto(serie):
+            serie = serie.astype(str).where(serie.notna())
+        conocidas = set(categorias)
+        # Las categorías nuevas se agregan al final para no cambiar los códigos existentes
+        categorias.extend(v for v in pd.unique(serie.dropna()) if v not in conocidas)
+        return pd.Index(categorias).get_indexer(serie).astype(tipo)
+    if columna not in gdf.columns:
+        return np.full(n, _faltante(tipo), dtype=tipo)
+    serie = gdf[columna]
+    if tipo.kind in "iu" and serie.isna().any():
+        serie = serie.fillna(_faltante(tipo))
+    return serie.to_numpy().astype(tipo)
+
+
+def escribir_filas(directorio, gdf):
+    # Escribe las filas de `gdf` después de las que ya tiene cada archivo de columna, sin
+    # reescribir los datos existentes; las columnas que el almacén no tiene se ignoran.
+    # Devuelve el esquema con el nuevo `n` sin guardarlo: hasta que escribir_esquema lo
+    # publique, las filas nuevas no existen para nadie que abra el almacén.
+    esquema = leer_esquema(directorio)
+    n = esquema["n"]
+    for columna, archivo in esquema["archivos"].items():
+        tipo = np.dtype(esquema["tipos"][columna])
+        valores = _columna_para_anexar(gdf, columna, tipo, esquema["categorias"].get(columna))
+        ruta = os.path.join(directorio, archivo)
+        with open(ruta, "r+b" if os.path.exists(ruta) else "wb") as f:
+            # Restos de una escritura interrumpida (más allá de n filas) se descartan
+            f.truncate(n * tipo.itemsize)
+            f.seek(0, os.SEEK_END)
+            np.ascontiguousarray(valores).tofile(f)
+    esquema["n"] = n + len(gdf)
+    return esquema
+
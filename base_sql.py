@@ -0,0 +1,195 @@
+# Base de datos embebida opcional con los crímenes: DuckDB si está instalado, si no SQLite
+#
+# Los filtros de la barra lateral se traducen a una consulta SQL con parámetros y la base
+# devuelve solo lo que la app necesita: los números de fila seleccionados o los conteos
+# por barrio. Los datos viven en un archivo y no tienen que caber en memoria.
+# Cada fila guarda su número de fila del almacén (`fila`), así que los resultados se
+# pueden materializar desde el almacén mapeado en memoria.
+#
+#     crear_base(gdf, "artefactos/crimenes.db")
+#     base = abrir_base("artefactos/crimenes.db")
+#     filas = seleccionar_sql(base, filtros)
+import os
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+
+import numpy as np
+import pandas as pd
+
+from datos import FILTROS_VACIOS, GRUPOS_SOCIALES, normalizar_crimenes
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+MOTOR = "duckdb" if duckdb is not None else "sqlite"
+# Errores de la base que la app trata volviendo a filtrar con el almacén
+ERRORES_BASE = (sqlite3.Error,) + ((duckdb.Error,) if duckdb is not None else ())
+_candado_duckdb = threading.Lock()
+BASE_SQL = "crimenes.db"
+TABLA = "crimenes"
+COLUMNAS_TEXTO = ["id", "fecha", "hora", "barrio", "tipo_crimen", "sexo"]
+COLUMNAS_NUMERO = ["edad", "hora_h"] + GRUPOS_SOCIALES
+# Columnas con índice en SQLite (DuckDB poda por bloques sin índices)
+INDICES = ["barrio", "tipo_crimen", "dia"]
+
+
+def _dia(fecha):
+    # Días desde 1970-01-01
+    return (pd.Timestamp(fecha) - pd.Timestamp("1970-01-01")).days
+
+
+def tabla_sql(gdf, primera_fila=0):
+    # Filas tal como se guardan en la base: texto, enteros y las fechas como número de día
+    if "fecha_dt" not in gdf.columns:
+        gdf = normalizar_crimenes(gdf)
+    df = pd.DataFrame({"fila": np.arange(primera_fila, primera_fila + len(gdf), dtype=np.int64)})
+    for columna in COLUMNAS_TEXTO:
+        if columna in gdf.columns:
+            serie = gdf[columna]
+            if pd.api.types.is_datetime64_any_dtype(serie):
+                serie = serie.dt.strftime("%Y-%m-%d")
+            df[columna] = serie.astype(object).where(serie.notna(), None).to_numpy()
+    for columna in COLUMNAS_NUMERO:
+        if columna in gdf.columns:
+            df[columna] = pd.to_numeric(gdf[columna], errors="coerce").astype("Int64").to_numpy()
+    dia = (gdf["fecha_dt"].dt.normalize() - pd.Timestamp("1970-01-01")).dt.days
+    df["dia"] = dia.astype("Int64").to_numpy()
+    df["x"] = gdf.geometry.x.to_numpy()
+    df["y"] = gdf.geometry.y.to_numpy()
+    return df
+
+
+@contextmanager
+def _conexion(ruta, solo_lectura=True):
+    # Una conexión por consulta. DuckDB no deja abrir el mismo archivo en un proceso con
+    # una conexión de solo lectura y otra de escritura a la vez, así que sus conexiones se
+    # turnan con un candado de proceso (las sesiones de Streamlit y el botón de ingesta
+    # corren en hilos del mismo proceso). Otro proceso que escriba, como `ingesta.py` desde
+    # la consola, igual puede chocar con una lectura: la app atrapa ERRORES_BASE y filtra
+    # con el almacén, y la ingesta falla sin publicar nada. SQLite sí admite lectores y un
+    # escritor a la vez.
+    if MOTOR == "duckdb":
+        with _candado_duckdb, closing(duckdb.connect(ruta, read_only=solo_lectura)) as con:
+            yield con
+            if not solo_lectura:
+                con.commit()
+        return
+    if solo_lectura:
+        con = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True)
+    else:
+        con = sqlite3.connect(ruta)
+    with closing(con):
+        yield con
+        if not solo_lectura:
+            con.commit()
+
+
+def _insertar(con, df, crear):
+    if MOTOR == "duckdb":
+        con.register("lote", df)
+        con.execute(f"CREATE TABLE {TABLA} AS SELECT * FROM lote" if crear
+                    else f"INSERT INTO {TABLA} SELECT * FROM lote")
+        con.unregister("lote")
+        return
+    # SQLite no entiende los enteros con faltantes de pandas
+    df = df.astype(object).where(df.notna(), None)
+    df.to_sql(TABLA, con, if_exists="replace" if crear else "append", index=False, chunksize=50_000)
+
+
+def crear_base(gdf, ruta):
+    # Se escribe en un archivo temporal que luego reemplaza al anterior
+    temporal = ruta + ".tmp"
+    if os.path.exists(temporal):
+        os.remove(temporal)
+    with _conexion(temporal, solo_lectura=False) as con:
+        _insertar(con, tabla_sql(gdf), crear=True)
+        if MOTOR == "sqlite":
+            for columna in INDICES:
+                con.execute(f"CREATE INDEX idx_{columna} ON {TABLA} ({columna})")
+    os.replace(temporal, ruta)
+
+
+def anexar_base(ruta, gdf, primera_fila):
+    # Agrega un lote con los mismos números de fila que recibió en el almacén. Las filas
+    # desde `primera_fila` que hayan quedado de una ingesta fallida se reemplazan.
+    with _conexion(ruta, solo_lectura=False) as con:
+        con.execute(f"DELETE FROM {TABLA} WHERE fila >= ?", [int(primera_fila)])
+        if len(gdf) == 0:
+            return
+        columnas = [c[1] for c in con.execute(f"PRAGMA table_info('{TABLA}')").fetchall()]
+        df = tabla_sql(gdf, primera_fila)
+        _insertar(con, df.reindex(columns=columnas), crear=False)
+
+
+def descartar_filas(ruta, primera_fila):
+    # Deshace un anexar_base cuyas filas no llegaron a publicarse en el almacén
+    with _conexion(ruta, solo_lectura=False) as con:
+        con.execute(f"DELETE FROM {TABLA} WHERE fila >= ?", [int(primera_fila)])
+
+
+def abrir_base(ruta, filas=None):
+    # Descripción de la base (ruta y columnas); None si no existe. Con `filas` (el `n` del
+    # almacén abierto junto con la base) las consultas ignoran filas agregadas después,
+    # p. ej. las de una ingesta que todavía no terminó.
+    if not os.path.exists(ruta):
+        return None
+    with _conexion(ruta) as con:
+        columnas = [c[1] for c in con.execute(f"PRAGMA table_info('{TABLA}')").fetchall()]
+    return {"motor": MOTOR, "ruta": ruta, "columnas": columnas, "filas": filas}
+
+
+def compilar_filtros(base, filtros):
+    # (WHERE, parámetros) con el mismo criterio que almacen.mascara; los valores nunca se
+    # insertan en el texto de la consulta
+    filtros = dict(FILTROS_VACIOS, **filtros)
+    condiciones, parametros = [], []
+    if base.get("filas") is not None:
+        condiciones.append("fila < ?")
+        parametros.append(int(base["filas"]))
+
+    for columna in ("barrio", "tipo_crimen", "sexo"):
+        if filtros[columna] != "Todos":
+            condiciones.append(f"{columna} = ?")
+            parametros.append(filtros[columna])
+
+    rango_fecha = filtros["rango_fecha"]
+    if rango_fecha is not None:
+        condiciones.append("dia BETWEEN ? AND ?")
+        parametros += [_dia(rango_fecha[0]), _dia(rango_fecha[1])]
+
+    if "hora_h" in base["columnas"]:
+        condiciones.append("hora_h BETWEEN ? AND ?")
+        parametros += [int(h) for h in filtros["horas"]]
+
+    for grupo, filtro_activo in filtros["sociales"].items():
+        if filtro_activo and grupo in base["columnas"]:
+            condiciones.append(f"{grupo} = 1")
+    return " AND ".join(condiciones) or "1 = 1", parametros
+
+
+def consultar(base, sql, parametros=()):
+    with _conexion(base["ruta"]) as con:
+        cursor = con.execute(sql, list(parametros))
+        nombres = [d[0] for d in cursor.description]
+        return pd.DataFrame.from_records(cursor.fetchall(), columns=nombres)
+
+
+def seleccionar_sql(base, filtros):
+    # Números de fila (del almacén) que cumplen los filtros
+    where, parametros = compilar_filtros(base, filtros)
+    with _conexion(base["ruta"]) as con:
+        filas = con.execute(f"SELECT fila FROM {TABLA} WHERE {where} ORDER BY fila", parametros).fetchall()
+    return np.fromiter((f[0] for f in filas), dtype=np.int64, count=len(filas))
+
+
+def conteo_barrios_sql(base, filtros):
+    # Igual que almacen.conteo_barrios, calculado dentro de la base
+    where, parametros = compilar_filtros(base, filtros)
+    return consultar(base, f"""
+        SELECT barrio, COUNT(*) AS cantidad_crimenes FROM {TABLA}
+        WHERE {where} AND barrio IS NOT NULL
+        GROUP BY barrio ORDER BY cantidad_crimenes DESC, barrio""", parametros)
+
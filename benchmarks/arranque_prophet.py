@@ -0,0 +1,58 @@
+# Compara el tiempo de reajuste de Prophet en frío y en caliente cuando llega una semana nueva
+#
+# Uso:
+#     python benchmarks/arranque_prophet.py --semanas-entrenamiento 26 --repeticiones 5
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datos import RUTA_CRIMENES, cubo_conteos, leer_crimenes, normalizar_crimenes, serie_filtrada  # noqa: E402
+from pronosticos import ajustar_prophet  # noqa: E402
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Tiempo de reajuste de Prophet en frío y en caliente con una semana nueva.")
+    parser.add_argument("--crimenes", default=RUTA_CRIMENES)
+    parser.add_argument("--semanas-entrenamiento", type=int, default=26)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+    logging.getLogger("prophet").setLevel(logging.WARNING)
+
+    serie = serie_filtrada(cubo_conteos(normalizar_crimenes(leer_crimenes(args.crimenes))), {})
+    n = args.semanas_entrenamiento
+    # Ventana de ayer y ventana de hoy (desplazada una semana, misma longitud)
+    anterior = serie.iloc[-n - 1:-1].reset_index(drop=True)
+    actual = serie.iloc[-n:].reset_index(drop=True)
+
+    modelo_previo, _ = ajustar_prophet(anterior)
+    frio = medir(lambda: ajustar_prophet(actual), args.repeticiones)
+    caliente = medir(lambda: ajustar_prophet(actual, modelo_previo), args.repeticiones)
+    _, usado = ajustar_prophet(actual, modelo_previo)
+
+    print(f"Ventana de {n} semanas, mediana de {args.repeticiones} ajustes")
+    print(f"  en frío:     {frio * 1000:8.1f} ms")
+    print(f"  en caliente: {caliente * 1000:8.1f} ms  ({caliente / frio:.0%} del ajuste en frío)")
+    if not usado:
+        print("  aviso: el arranque en caliente no fue compatible y se ajustó en frío")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+# Prueba de carga local: N sesiones simultáneas de la app, cada una cambiando controles
+# según un guion aleatorio (reproducible por semilla), con `streamlit.testing.v1.AppTest`.
+# Todas las sesiones corren en este proceso y comparten los cachés de Streamlit, como en
+# un servidor real; por cada nivel de concurrencia reporta percentiles de latencia de los
+# reruns, reruns por segundo y memoria residente (RSS) del proceso.
+#
+# Uso:
+#     python benchmarks/carga_sesiones.py --sesiones 1 2 4 8 --pasos 5
+#     python benchmarks/carga_sesiones.py --sesiones 4 --acciones barrio sexo horas --json carga.json
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_APP = os.path.join(RAIZ, "streamlit_app.py")
+sys.path.insert(0, RAIZ)
+# Las trazas de cada rerun no se escriben a disco durante la prueba
+os.environ.setdefault("BARRANQUILLA_TRAZAS", "")
+
+NIVELES = [1, 2, 4, 8]
+PASOS = 5
+TIEMPO_MAXIMO_RERUN = 600
+
+
+# --- GUION DE CADA SESIÓN ---
+def _control(lista, etiqueta):
+    return next(w for w in lista if w.label.startswith(etiqueta))
+
+
+def _elegir(at, etiqueta, rng):
+    control = _control(at.selectbox, etiqueta)
+    valor = rng.choice([o for o in control.options if o != control.value])
+    control.select(valor)
+    return valor
+
+
+def accion_barrio(at, rng):
+    return _elegir(at, "Selecciona un barrio", rng)
+
+
+def accion_tipo_crimen(at, rng):
+    return _elegir(at, "Tipo de Crimen", rng)
+
+
+def accion_sexo(at, rng):
+    return _elegir(at, "Sexo de la víctima", rng)
+
+
+def accion_horas(at, rng):
+    desde = rng.randint(0, 20)
+    hasta = rng.randint(desde + 1, 23)
+    _control(at.slider, "Rango horario").set_value((desde, hasta))
+    return f"{desde}-{hasta}"
+
+
+def accion_social(at, rng):
+    control = rng.choice([c for c in at.sidebar.checkbox if not c.label.startswith("🛠️")])
+    (control.uncheck if control.value else control.check)()
+    return control.label
+
+
+def accion_modelo(at, rng):
+    return _elegir(at, "Selecciona el modelo de predicción", rng)
+
+
+def accion_granularidad(at, rng):
+    control = _control(at.radio, "Granularidad")
+    valor = rng.choice([o for o in control.options if o != control.value])
+    control.set_value(valor)
+    return valor
+
+
+ACCIONES = {
+    "barrio": accion_barrio,
+    "tipo_crimen": accion_tipo_crimen,
+    "sexo": accion_sexo,
+    "horas": accion_horas,
+    "social": accion_social,
+    "modelo": accion_modelo,
+    "granularidad": accion_granularidad,
+}
+
+
+def sesion(numero, pasos, acciones, semilla, sesiones_vivas):
+    # Primer rerun (carga de la página) y luego un rerun por cada cambio de control
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(semilla * 10_000 + numero)
+    at = AppTest.from_file(RUTA_APP, default_timeout=TIEMPO_MAXIMO_RERUN)
+    # Se conserva viva hasta el final del nivel, como una pestaña abierta
+    sesiones_vivas.append(at)
+
+    inicio = time.perf_counter()
+    at.run()
+    primera = time.perf_counter() - inicio
+    latencias, errores = [], len(at.exception)
+
+    for _ in range(pasos):
+        nombre = rng.choice(acciones)
+        ACCIONES[nombre](at, rng)
+        inicio = time.perf_counter()
+        at.run()
+        latencias.append(time.perf_counter() - inicio)
+        errores += len(at.exception)
+    return primera, latencias, errores
+
+
+# --- MEMORIA ---
+def rss_mb():
+    # RSS actual desde /proc; en otros sistemas, el máximo que informa getrusage
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maximo / 2 ** 20 if sys.platform == "darwin" else maximo / 1024
+
+
+class MuestreoRSS:
+    # Hilo que muestrea el RSS mientras corre un nivel para registrar su pico
+    def __init__(self, intervalo=0.2):
+        self.intervalo = intervalo
+        self.pico = rss_mb()
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+
+    def _muestrear(self):
+        while not self._detener.wait(self.intervalo):
+            self.pico = max(self.pico, rss_mb())
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._detener.set()
+        self._hilo.join()
+        self.pico = max(self.pico, rss_mb())
+
+
+# --- REPORTE ---
+def percentil(valores, p):
+    if not valores:
+        return float("nan")
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def correr_nivel(n_sesiones, pasos, acciones, semilla):
+    sesiones_vivas = []
+    rss_inicio = rss_mb()
+    with MuestreoRSS() as muestreo:
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_sesiones) as ejecutor:
+            resultados = list(ejecutor.map(
+                lambda i: sesion(i, pasos, acciones, semilla, sesiones_vivas), range(n_sesiones)))
+        duracion = time.perf_counter() - inicio
+        rss_fin = rss_mb()
+
+    primeras = [r[0] for r in resultados]
+    latencias = [x for r in resultados for x in r[1]]
+    return {
+        "sesiones": n_sesiones,
+        "reruns": len(primeras) + len(latencias),
+        "errores": sum(r[2] for r in resultados),
+        "duracion_s": duracion,
+        "reruns_por_s": (len(primeras) + len(latencias)) / duracion,
+        "primer_rerun_p50_s": statistics.median(primeras),
+        "p50_s": percentil(latencias, 50),
+        "p90_s": percentil(latencias, 90),
+        "p99_s": percentil(latencias, 99),
+        "max_s": max(latencias, default=float("nan")),
+        "rss_inicio_mb": rss_inicio,
+        "rss_fin_mb": rss_fin,
+        "rss_pico_mb": muestreo.pico,
+    }
+
+
+def imprimir(r):
+    print(f"{r['sesiones']:>8d} {r['reruns']:>7d} {r['reruns_por_s']:>8.2f} "
+          f"{r['primer_rerun_p50_s']:>8.2f} {r['p50_s']:>7.2f} {r['p90_s']:>7.2f} {r['p99_s']:>7.2f} "
+          f"{r['rss_fin_mb']:>9.0f} {r['rss_pico_mb']:>9.0f} {r['errores']:>7d}", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Latencia, throughput y memoria de la app con varias sesiones simultáneas.")
+    parser.add_argument("--sesiones", type=int, nargs="+", default=NIVELES,
+                        help="Niveles de concurrencia a probar, en orden")
+    parser.add_argument("--pasos", type=int, default=PASOS, help="Cambios de control por sesión")
+    parser.add_argument("--acciones", nargs="+", default=list(ACCIONES), choices=list(ACCIONES))
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--json", help="Guarda los resultados en este archivo")
+    args = parser.parse_args(argv)
+
+    logging.getLogger("cmdstanpy").disabled = True
+    logging.getLogger("prophet").setLevel(logging.WARNING)
+    warnings.filterwarnings("ignore")
+    # Avisos que Streamlit repite en cada rerun (parámetros obsoletos, hilos sin contexto);
+    # se silencian con un filtro porque Streamlit vuelve a fijar el nivel de sus loggers
+    for nombre in ("streamlit.deprecation_util",
+                   "streamlit.runtime.scriptrunner_utils.script_run_context"):
+        logging.getLogger(nombre).addFilter(lambda registro: False)
+
+    print(f"{'sesiones':>8s} {'reruns':>7s} {'rerun/s':>8s} {'primer':>8s} {'p50':>7s} {'p90':>7s} "
+          f"{'p99':>7s} {'rss_mb':>9s} {'pico_mb':>9s} {'errores':>7s}")
+    resultados = []
+    for n in args.sesiones:
+        resultados.append(correr_nivel(n, args.pasos, args.acciones, args.semilla))
+        imprimir(resultados[-1])
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+    return 1 if any(r["errores"] for r in resultados) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+# Benchmarks de cada etapa de la app (carga, filtros, semaforización, mapas y pronósticos)
+# con datos sintéticos de varios tamaños. Reporta la mediana del tiempo y el pico de memoria
+# de Python (tracemalloc), y guarda o compara contra una base.
+#
+# Uso:
+#     python benchmarks/suite.py --tamanos 1000 10000 100000
+#     python benchmarks/suite.py --guardar-base local        # benchmarks/bases/local.json
+#     python benchmarks/suite.py --comparar local            # sale con 1 si algo empeoró
+#     python benchmarks/suite.py --solo filtrar pronostico   # solo etapas con ese prefijo
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+from shapely.geometry import LineString  # noqa: E402
+
+from almacen import construir_almacen, cuadros_tiempo, seleccionar  # noqa: E402
+from base_sql import MOTOR, abrir_base, conteo_barrios_sql, crear_base, seleccionar_sql  # noqa: E402
+from datos import (aplicar_filtros, cargar_barrios, conteos_horarios, cubo_conteos,  # noqa: E402
+                   leer_crimenes, normalizar_crimenes, semana_hora, serie_filtrada)
+from espacial import (TAMANOS_HEX, construir_arbol, construir_rejilla, conteo_hex,  # noqa: E402
+                      densidad_kde, filas_en_area, filas_en_limites, filas_en_radio, indice_hex,
+                      limites_datos)
+from generar_sintetico import generar, guardar  # noqa: E402
+from mapas import (colores_por_tipo, datos_animacion, mapa_animado, mapa_calor, mapa_puntos,  # noqa: E402
+                   mapa_semaforo, semaforizar_barrios, semaforizar_conteos)
+from pronosticos import MODELOS, _ajustar, predecir  # noqa: E402
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+DIRECTORIO_DATOS = os.path.join(DIRECTORIO, ".datos")
+DIRECTORIO_BASES = os.path.join(DIRECTORIO, "bases")
+
+TAMANOS = [1_000, 10_000, 100_000]
+# El mapa de puntos crea un marcador de folium por fila: por encima de esto tarda minutos
+MAX_PUNTOS_MAPA = 20_000
+UMBRAL_REGRESION = 1.25
+# Diferencias menores a esto son ruido aunque la razón sea grande (etapas muy cortas)
+MINIMO_MS = 1.0
+MINIMO_MB = 1.0
+PALETA = ["#98cfe0", "#2ca6c5", "#032f45", "#f8b909", "#f38e1a"]
+
+
+# --- DATOS ---
+def datos_sinteticos(n, semilla=0):
+    # Los archivos se generan una vez por tamaño y semilla y se reutilizan entre corridas
+    base = os.path.join(DIRECTORIO_DATOS, f"crimenes_{n}_s{semilla}")
+    if not all(os.path.exists(f"{base}.{f}") for f in ("geojson", "csv")):
+        guardar(generar(n, semilla=semilla), base, ["geojson", "csv"])
+    return base
+
+
+def combinaciones_filtros(gdf):
+    # Una combinación por control de la barra lateral, y todas a la vez
+    barrio = gdf["barrio"].value_counts().index[0]
+    tipo = gdf["tipo_crimen"].value_counts().index[0]
+    fin = gdf["fecha_dt"].max().date()
+    rango = ((gdf["fecha_dt"].max() - pd.Timedelta(days=90)).date(), fin)
+    combinaciones = {
+        "sin_filtros": {},
+        "barrio": {"barrio": barrio},
+        "tipo_crimen": {"tipo_crimen": tipo},
+        "sexo": {"sexo": "F"},
+        "rango_fecha": {"rango_fecha": rango},
+        "horas": {"horas": (18, 23)},
+        "sociales": {"sociales": {"habitante_calle": True}},
+    }
+    combinaciones["todos"] = {"tipo_crimen": tipo, "sexo": "F", "rango_fecha": rango,
+                              "horas": (18, 23)}
+    return combinaciones
+
+
+# --- MEDICIÓN ---
+def medir(funcion, repeticiones):
+    # Una ejecución de calentamiento para no medir importaciones perezosas
+    funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        gc.collect()
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+
+    # El pico de memoria se mide aparte porque tracemalloc hace más lenta la ejecución
+    gc.collect()
+    tracemalloc.start()
+    try:
+        funcion()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "segundos": statistics.median(tiempos),
+        "min_segundos": min(tiempos),
+        "pico_mb": pico / 2 ** 20,
+    }
+
+
+def etapas(n, base, gdf_barrios, max_puntos_mapa):
+    # Devuelve (nombre, función) por etapa; las etapas que dependen de otras reutilizan
+    # sus resultados, calculados una sola vez fuera de la medición
+    gdf = normalizar_crimenes(leer_crimenes(f"{base}.csv"))
+
+    yield "carga_geojson", lambda: normalizar_crimenes(leer_crimenes(f"{base}.geojson"))
+    yield "carga_csv", lambda: normalizar_crimenes(leer_crimenes(f"{base}.csv"))
+
+    yield "construir_almacen", lambda: construir_almacen(gdf)
+
+    # filtrar: pandas sobre el GeoDataFrame; seleccionar: lo que usa la app sobre el almacén;
+    # seleccionar_sql: la misma selección dentro de la base embebida (DuckDB o SQLite)
+    almacen = construir_almacen(gdf)
+    ruta_sql = f"{base}.{MOTOR}.db"
+    yield "construir_base_sql", lambda: crear_base(gdf, ruta_sql)
+    if not os.path.exists(ruta_sql):
+        crear_base(gdf, ruta_sql)
+    base_sql = abrir_base(ruta_sql)
+    for nombre, filtros in combinaciones_filtros(gdf).items():
+        yield f"filtrar[{nombre}]", lambda filtros=filtros: aplicar_filtros(gdf, filtros)
+        yield f"seleccionar[{nombre}]", lambda filtros=filtros: seleccionar(almacen, filtros)
+        yield f"seleccionar_sql[{nombre}]", lambda filtros=filtros: seleccionar_sql(base_sql, filtros)
+
+    # Área dibujada: un corredor en diagonal por el área de los datos
+    yield "construir_rejilla", lambda: construir_rejilla(almacen["x"], almacen["y"])
+    rejilla = construir_rejilla(almacen["x"], almacen["y"])
+    xmin, ymin, xmax, ymax = gdf.total_bounds
+    corredor = LineString([(xmin, ymin), (xmax, ymax)]).buffer((xmax - xmin) / 40)
+    yield "filtro_area", lambda: filas_en_area(rejilla, almacen["x"], almacen["y"], corredor)
+    # Vista del mapa: un rectángulo de un cuarto del ancho y el alto de los datos
+    vista = ((3 * xmin + xmax) / 4, (3 * ymin + ymax) / 4, (xmin + xmax) / 2, (ymin + ymax) / 2)
+    yield "filtro_vista", lambda: filas_en_limites(rejilla, almacen["x"], almacen["y"], vista)
+
+    # Búsqueda por radio (500 m) alrededor del centro de los datos
+    yield "construir_arbol", lambda: construir_arbol(almacen["x"], almacen["y"])
+    arbol = construir_arbol(almacen["x"], almacen["y"])
+    yield "busqueda_radio", lambda: filas_en_radio(arbol, (xmin + xmax) / 2, (ymin + ymax) / 2, 500)
+
+    limites = limites_datos(almacen["x"], almacen["y"])
+    yield "densidad_kde", lambda: densidad_kde(almacen["x"], almacen["y"], limites)
+    yield "indice_hex", lambda: indice_hex(almacen["x"], almacen["y"])
+    celdas = indice_hex(almacen["x"], almacen["y"])[TAMANOS_HEX[1]]
+    yield "conteo_hex", lambda: conteo_hex(celdas, seleccionar(almacen, {}))
+
+    todas = seleccionar(almacen, {})
+    yield "cuadros_animacion", lambda: cuadros_tiempo(almacen, todas, "Diaria")
+
+    yield "semaforizacion", lambda: semaforizar_barrios(gdf, gdf_barrios)
+    yield "semaforizacion_sql", lambda: semaforizar_conteos(conteo_barrios_sql(base_sql, {}), gdf_barrios)
+    yield "cubo_conteos", lambda: cubo_conteos(gdf)
+    cubo = cubo_conteos(gdf)
+    yield "semana_hora", lambda: semana_hora(conteos_horarios(cubo, {}), cubo)
+
+    if n <= max_puntos_mapa:
+        color_dict = colores_por_tipo(sorted(gdf["tipo_crimen"].dropna().unique()), PALETA)
+        yield "html_mapa_puntos", lambda: mapa_puntos(gdf, gdf_barrios, color_dict).get_root().render()
+    kde = densidad_kde(almacen["x"], almacen["y"], limites)
+    yield "html_mapa_calor", lambda: mapa_calor(kde, gdf_barrios).get_root().render()
+    cuadros = cuadros_tiempo(almacen, todas, "Diaria")
+    animacion = datos_animacion(cuadros, almacen["x"], almacen["y"], almacen["valores"]["tipo_crimen"],
+                                almacen["categorias"]["tipo_crimen"], {}, cuadros["fechas"].strftime("%Y-%m-%d"))
+    yield "html_mapa_animado", lambda: mapa_animado(animacion, gdf_barrios).get_root().render()
+    semaforo = semaforizar_barrios(gdf, gdf_barrios)
+    yield "html_mapa_semaforo", lambda: mapa_semaforo(semaforo, gdf_barrios).get_root().render()
+
+    # Ajuste y predicción directos, sin pasar por el registro de modelos
+    train = serie_filtrada(cubo_conteos(gdf), {}).tail(12).reset_index(drop=True)
+
+    def pronostico(nombre_modelo):
+        return predecir(nombre_modelo, _ajustar(nombre_modelo, train), train, 4)
+
+    for nombre_modelo in MODELOS:
+        yield f"pronostico[{nombre_modelo}]", lambda m=nombre_modelo: pronostico(m)
+
+
+def correr(tamanos, repeticiones, solo=None, semilla=0, max_puntos_mapa=MAX_PUNTOS_MAPA):
+    gdf_barrios = cargar_barrios()
+    resultados = {}
+    for n in tamanos:
+        base = datos_sinteticos(n, semilla)
+        for nombre, funcion in etapas(n, base, gdf_barrios, max_puntos_mapa):
+            if solo and not any(nombre.startswith(s) for s in solo):
+                continue
+            clave = f"{nombre}@{n}"
+            resultados[clave] = medir(funcion, repeticiones)
+            r = resultados[clave]
+            print(f"{clave:45s} {r['segundos'] * 1000:10.1f} ms {r['pico_mb']:9.1f} MB", flush=True)
+    return resultados
+
+
+# --- BASES ---
+def entorno():
+    import numpy as np
+
+    return {
+        "python": platform.python_version(),
+        "maquina": platform.machine(),
+        "procesador": platform.processor(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def ruta_base(nombre):
+    return os.path.join(DIRECTORIO_BASES, f"{nombre}.json")
+
+
+def guardar_base(nombre, resultados):
+    os.makedirs(DIRECTORIO_BASES, exist_ok=True)
+    with open(ruta_base(nombre), "w", encoding="utf-8") as f:
+        json.dump({"entorno": entorno(), "resultados": resultados}, f, ensure_ascii=False, indent=2)
+
+
+def comparar(resultados, base, umbral=UMBRAL_REGRESION):
+    # Imprime la razón actual / base por etapa y devuelve las que empeoraron más del umbral
+    regresiones = []
+    print(f"\n{'etapa':45s} {'tiempo':>8s} {'memoria':>8s}")
+    for clave, actual in resultados.items():
+        anterior = base.get(clave)
+        if anterior is None:
+            print(f"{clave:45s} {'(nuevo)':>8s}")
+            continue
+        tiempo = actual["segundos"] / max(anterior["segundos"], 1e-9)
+        memoria = actual["pico_mb"] / max(anterior["pico_mb"], 1e-9)
+        peor_tiempo = tiempo > umbral and (actual["segundos"] - anterior["segundos"]) * 1000 > MINIMO_MS
+        peor_memoria = memoria > umbral and actual["pico_mb"] - anterior["pico_mb"] > MINIMO_MB
+        marca = ""
+        if peor_tiempo or peor_memoria:
+            regresiones.append(clave)
+            marca = "  <-- regresión"
+        print(f"{clave:45s} {tiempo:7.2f}x {memoria:7.2f}x{marca}")
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Mide cada etapa de la app con datos sintéticos de varios tamaños.")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--solo", nargs="*", help="Prefijos de las etapas a medir")
+    parser.add_argument("--max-puntos-mapa", type=int, default=MAX_PUNTOS_MAPA)
+    parser.add_argument("--guardar-base", metavar="NOMBRE", help="Guarda los resultados como base")
+    parser.add_argument("--comparar", metavar="NOMBRE", help="Compara contra una base guardada")
+    parser.add_argument("--umbral", type=float, default=UMBRAL_REGRESION,
+                        help="Razón actual/base a partir de la cual se marca una regresión")
+    args = parser.parse_args(argv)
+
+    logging.getLogger("cmdstanpy").disabled = True
+    logging.getLogger("prophet").setLevel(logging.WARNING)
+    # Avisos de folium (teselas) y geopandas (centroides en coordenadas geográficas)
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+    resultados = correr(args.tamanos, args.repeticiones, args.solo, args.semilla, args.max_puntos_mapa)
+
+    if args.guardar_base:
+        guardar_base(args.guardar_base, resultados)
+        print(f"\nBase guardada en {ruta_base(args.guardar_base)}")
+    if args.comparar:
+        with open(ruta_base(args.comparar), encoding="utf-8") as f:
+            base = json.load(f)["resultados"]
+        if comparar(resultados, base, args.umbral):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
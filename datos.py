@@ -0,0 +1,219 @@
+# Carga, normalización y agregados de los datos de crímenes y barrios
+import json
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+RUTA_CRIMENES = "crimenes.geojson"
+RUTA_BARRIOS = "barrios.geojson"
+GRUPOS_SOCIALES = ["habitante_calle", "prostitucion", "lgtbi", "grupo_etnico"]
+
+
+def cargar_barrios(ruta=RUTA_BARRIOS):
+    return gpd.read_file(ruta)
+
+
+def leer_tabla(archivo=RUTA_CRIMENES):
+    # Acepta una ruta o un archivo subido desde Streamlit (.geojson o .csv). Un CSV se
+    # devuelve tal cual, sin geometría, para poder validarlo antes de construirla.
+    nombre = getattr(archivo, "name", archivo)
+    if str(nombre).endswith(".csv"):
+        return pd.read_csv(archivo)
+    return gpd.read_file(archivo)
+
+
+def con_geometria(df):
+    if isinstance(df, gpd.GeoDataFrame):
+        return df
+    geometry = gpd.points_from_xy(df.longitud, df.latitud)
+    return gpd.GeoDataFrame(df, geometry=geometry, crs="EPSG:4326")
+
+
+def leer_crimenes(archivo=RUTA_CRIMENES):
+    return con_geometria(leer_tabla(archivo))
+
+
+def normalizar_crimenes(gdf):
+    # Fecha y hora se interpretan una sola vez aquí y no en cada filtrado
+    gdf = gdf.copy()
+    gdf["fecha_dt"] = pd.to_datetime(gdf["fecha"], errors="coerce")
+    if "hora" in gdf.columns:
+        gdf["hora_h"] = pd.to_datetime(gdf["hora"], format="%H:%M", errors="coerce").dt.hour
+    return gdf
+
+
+def unir_barrios(gdf, gdf_barrios):
+    # Asigna a cada crimen el barrio que lo contiene y completa los que no traen barrio
+    union = gpd.sjoin(
+        gdf[["geometry"]], gdf_barrios[["NOMBRE", "geometry"]].to_crs(gdf.crs),
+        how="left", predicate="within")
+    barrio_geo = union[~union.index.duplicated(keep="first")]["NOMBRE"]
+
+    gdf = gdf.copy()
+    gdf["barrio_geo"] = barrio_geo.reindex(gdf.index)
+    if "barrio" in gdf.columns:
+        gdf["barrio"] = gdf["barrio"].fillna(gdf["barrio_geo"])
+    else:
+        gdf["barrio"] = gdf["barrio_geo"]
+    return gdf
+
+
+def conteo_por_barrio(gdf):
+    crimen_por_barrio = gdf["barrio"].value_counts().reset_index()
+    crimen_por_barrio.columns = ["barrio", "cantidad_crimenes"]
+    return crimen_por_barrio
+
+
+# --- FILTROS ---
+FILTROS_VACIOS = {
+    "barrio": "Todos",
+    "tipo_crimen": "Todos",
+    "sexo": "Todos",
+    "rango_fecha": None,
+    "horas": (0, 23),
+    "sociales": {},
+}
+
+
+def aplicar_filtros(gdf_crimenes, filtros):
+    filtros = dict(FILTROS_VACIOS, **filtros)
+    if "fecha_dt" not in gdf_crimenes.columns:
+        gdf_crimenes = normalizar_crimenes(gdf_crimenes)
+    gdf = gdf_crimenes.copy()
+
+    # Filtros de barrio, tipo de crimen y sexo
+    for columna in ("barrio", "tipo_crimen", "sexo"):
+        if filtros[columna] != "Todos" and columna in gdf.columns:
+            gdf = gdf[gdf[columna] == filtros[columna]]
+
+    rango_fecha = filtros["rango_fecha"]
+    if rango_fecha is not None:
+        gdf = gdf[(gdf['fecha_dt'].dt.date >= rango_fecha[0]) &
+                  (gdf['fecha_dt'].dt.date <= rango_fecha[1])]
+
+    # Filtrar por hora (se descartan horas que no se pudieron interpretar)
+    if "hora_h" in gdf.columns:
+        min_hora, max_hora = filtros["horas"]
+        gdf = gdf[gdf['hora_h'].notna()]
+        gdf = gdf[gdf['hora_h'].between(min_hora, max_hora)]
+
+    # Filtrar por grupos sociales
+    for grupo, filtro_activo in filtros["sociales"].items():
+        if filtro_activo and grupo in gdf.columns:
+            gdf = gdf[gdf[grupo] == True]
+
+    return gdf
+
+
+def id_serie(filtros):
+    # Nombre estable de la serie que corresponde a un conjunto de filtros (sin fechas)
+    filtros = dict(FILTROS_VACIOS, **filtros)
+    activos = {c: filtros[c] for c in ("barrio", "tipo_crimen", "sexo") if filtros[c] != "Todos"}
+    if tuple(filtros["horas"]) != FILTROS_VACIOS["horas"]:
+        activos["horas"] = list(filtros["horas"])
+    sociales = sorted(g for g, activo in filtros["sociales"].items() if activo)
+    if sociales:
+        activos["sociales"] = sociales
+
+    if not activos:
+        return "ciudad"
+    if list(activos) == ["barrio"]:
+        return f"barrio:{activos['barrio']}"
+    if list(activos) == ["tipo_crimen"]:
+        return f"tipo:{activos['tipo_crimen']}"
+    return "filtros:" + json.dumps(activos, sort_keys=True, ensure_ascii=False)
+
+
+# --- CUBO DE CONTEOS ---
+# Cada granularidad: (frecuencia de pandas, horas por periodo). La semana va de lunes a
+# domingo y se etiqueta con el domingo, igual que pd.Grouper(freq="W") sobre las fechas.
+GRANULARIDADES = {
+    "Semanal": ("W", 24 * 7),
+    "Diaria": ("D", 24),
+    "Horaria": ("h", 1),
+}
+
+
+def cubo_conteos(gdf, origen=None):
+    # Conteos por hora absoluta y por cada combinación de las columnas que se pueden filtrar.
+    # Es mucho más pequeño que los datos crudos y de él salen las series filtradas de
+    # cualquier granularidad. La hora se cuenta desde el lunes anterior al primer crimen,
+    # o desde `origen` para que el cubo de un lote nuevo se pueda sumar a uno existente.
+    if "fecha_dt" not in gdf.columns:
+        gdf = normalizar_crimenes(gdf)
+    validos = gdf[gdf["fecha_dt"].notna()]
+    if "hora_h" in validos.columns:
+        validos = validos[validos["hora_h"].notna()]
+        hora_del_dia = validos["hora_h"].astype("int64")
+    else:
+        hora_del_dia = 0
+
+    dias = validos["fecha_dt"].dt.normalize()
+    if origen is None:
+        origen = dias.min() - pd.Timedelta(days=int(dias.min().dayofweek))
+    hora_idx = ((dias - origen).dt.days * 24 + hora_del_dia).rename("hora_idx")
+
+    dimensiones = [c for c in ["barrio", "tipo_crimen", "sexo"] + GRUPOS_SOCIALES
+                   if c in validos.columns]
+    cubo = validos.groupby([hora_idx] + dimensiones, dropna=False).size().rename("y").reset_index()
+    cubo.attrs["origen"] = origen
+    cubo.attrs["n_horas"] = int(hora_idx.max()) + 1 if len(hora_idx) else 0
+    return cubo
+
+
+def mascara_cubo(cubo, filtros):
+    filtros = dict(FILTROS_VACIOS, **filtros)
+    mascara = pd.Series(True, index=cubo.index)
+    for columna in ("barrio", "tipo_crimen", "sexo"):
+        if filtros[columna] != "Todos" and columna in cubo.columns:
+            mascara &= cubo[columna] == filtros[columna]
+    min_hora, max_hora = filtros["horas"]
+    if (min_hora, max_hora) != (0, 23):
+        mascara &= (cubo["hora_idx"] % 24).between(min_hora, max_hora)
+    for grupo, filtro_activo in filtros["sociales"].items():
+        if filtro_activo and grupo in cubo.columns:
+            mascara &= cubo[grupo] == True
+    return mascara
+
+
+def conteos_horarios(cubo, filtros):
+    # Vector de casos por hora para unos filtros; es la base de todas las granularidades
+    sub = cubo[mascara_cubo(cubo, filtros)]
+    return np.bincount(sub["hora_idx"].to_numpy(), weights=sub["y"].to_numpy(),
+                       minlength=cubo.attrs["n_horas"])
+
+
+def rango_periodos(cubo, granularidad="Semanal"):
+    # Primer y último periodo con datos y sus etiquetas de fecha
+    freq, horas = GRANULARIDADES[granularidad]
+    primero = int(cubo["hora_idx"].min()) // horas
+    ultimo = (cubo.attrs["n_horas"] - 1) // horas
+    inicio = cubo.attrs["origen"] + pd.Timedelta(hours=primero * horas)
+    if granularidad == "Semanal":
+        inicio += pd.Timedelta(days=6)
+    return primero, pd.date_range(inicio, periods=ultimo - primero + 1, freq=freq)
+
+
+def remuestrear(conteos, cubo, granularidad="Semanal"):
+    # Suma por bloques del vector horario: sin volver a agrupar filas
+    _, horas = GRANULARIDADES[granularidad]
+    primero, fechas = rango_periodos(cubo, granularidad)
+    relleno = (-len(conteos)) % horas
+    por_periodo = np.pad(conteos, (0, relleno)).reshape(-1, horas).sum(axis=1)
+    return pd.DataFrame({"ds": fechas, "y": por_periodo[primero:primero + len(fechas)]})
+
+
+def serie_filtrada(cubo, filtros, granularidad="Semanal"):
+    return remuestrear(conteos_horarios(cubo, filtros), cubo, granularidad)
+
+
+def semana_hora(conteos, cubo, rango_fecha=None):
+    # Matriz 7 × 24 (lunes a domingo × hora del día) del vector horario, con un solo bincount:
+    # el cubo empieza en lunes, así que hora_idx % 168 es dia_semana * 24 + hora
+    inicio, fin = 0, len(conteos)
+    if rango_fecha is not None:
+        inicio = max(0, (pd.Timestamp(rango_fecha[0]) - cubo.attrs["origen"]).days * 24)
+        fin = min(fin, ((pd.Timestamp(rango_fecha[1]) - cubo.attrs["origen"]).days + 1) * 24)
+    horas = np.arange(inicio, max(inicio, fin))
+    return np.bincount(horas % 168, weights=conteos[horas], minlength=168).reshape(7, 24)
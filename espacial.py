@@ -0,0 +1,262 @@
+# Índices espaciales sobre las coordenadas del almacén de crímenes
+#
+# La rejilla divide el área de los datos en celdas de tamaño fijo y guarda los números de
+# fila ordenados por celda, de modo que los puntos de un rectángulo salen de unos pocos
+# tramos contiguos del arreglo. Una consulta por área revisa solo los candidatos de las
+# celdas que toca su rectángulo envolvente, no todos los crímenes.
+#
+#     rejilla = construir_rejilla(almacen["x"], almacen["y"])
+#     filas = filas_en_area(rejilla, almacen["x"], almacen["y"], poligono)
+#
+# Para las búsquedas por radio se usa un BallTree con distancia haversine: cada consulta
+# visita O(log n) nodos más los puntos que devuelve, en lugar de medir todas las distancias.
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from sklearn.neighbors import BallTree
+
+# Unos 220 m en Barranquilla
+TAMANO_CELDA = 0.002
+MAX_CELDAS_EJE = 4096
+# Tipos de figura del plugin Draw que definen un área
+TIPOS_AREA = ("Polygon", "MultiPolygon")
+RADIO_TIERRA_M = 6_371_000
+METROS_POR_GRADO = 111_320
+# Mapa de calor: celdas de 50 m, núcleo de 250 m y como máximo 1024 celdas por eje
+CELDA_KDE_M = 50
+ANCHO_BANDA_M = 250
+MAX_CELDAS_KDE = 1024
+# Radios de los hexágonos (metros), de la resolución más fina a la más gruesa
+TAMANOS_HEX = [250, 500, 1000]
+
+
+# --- REJILLA ---
+def construir_rejilla(x, y, tamano_celda=TAMANO_CELDA):
+    validos = ~(np.isnan(x) | np.isnan(y))
+    if not validos.any():
+        return {"x0": 0.0, "y0": 0.0, "tamano": tamano_celda, "nx": 1, "ny": 1,
+                "orden": np.empty(0, dtype=np.int64), "inicios": np.zeros(2, dtype=np.int64)}
+    x0, y0 = float(x[validos].min()), float(y[validos].min())
+    # Con datos muy dispersos las celdas crecen para no pasar de MAX_CELDAS_EJE por eje
+    extension = max(float(x[validos].max()) - x0, float(y[validos].max()) - y0)
+    tamano = max(tamano_celda, extension / (MAX_CELDAS_EJE - 1))
+    nx = int((float(x[validos].max()) - x0) // tamano) + 1
+    ny = int((float(y[validos].max()) - y0) // tamano) + 1
+
+    filas = np.flatnonzero(validos)
+    celdas = _celda(x[filas], x0, tamano, nx) + _celda(y[filas], y0, tamano, ny) * nx
+    orden = np.argsort(celdas, kind="stable")
+    # inicios[c]:inicios[c + 1] es el tramo de `orden` con las filas de la celda c
+    inicios = np.zeros(nx * ny + 1, dtype=np.int64)
+    np.cumsum(np.bincount(celdas, minlength=nx * ny), out=inicios[1:])
+    return {"x0": x0, "y0": y0, "tamano": tamano, "nx": nx, "ny": ny,
+            "orden": filas[orden], "inicios": inicios}
+
+
+def _celda(valores, origen, tamano, n):
+    return np.clip(((valores - origen) // tamano).astype(np.int64), 0, n - 1)
+
+
+def filas_en_rectangulo(rejilla, xmin, ymin, xmax, ymax):
+    # Filas de las celdas que tocan el rectángulo (candidatos: pueden quedar un poco afuera)
+    x0, y0, tamano = rejilla["x0"], rejilla["y0"], rejilla["tamano"]
+    nx, ny = rejilla["nx"], rejilla["ny"]
+    if (xmax < x0 or ymax < y0 or xmin > x0 + nx * tamano or ymin > y0 + ny * tamano
+            or len(rejilla["orden"]) == 0):
+        return np.empty(0, dtype=np.int64)
+    ix0, ix1 = _celda(np.array([xmin, xmax]), x0, tamano, nx)
+    iy0, iy1 = _celda(np.array([ymin, ymax]), y0, tamano, ny)
+    inicios = rejilla["inicios"]
+    # Las celdas de una fila de la rejilla son contiguas: un tramo por fila
+    tramos = [rejilla["orden"][inicios[iy * nx + ix0]:inicios[iy * nx + ix1 + 1]]
+              for iy in range(iy0, iy1 + 1)]
+    return np.concatenate(tramos)
+
+
+def filas_en_area(rejilla, x, y, geometria):
+    # Filas cuyos puntos caen dentro (o en el borde) de la geometría, ordenadas
+    candidatas = filas_en_rectangulo(rejilla, *geometria.bounds)
+    if len(candidatas) == 0:
+        return candidatas
+    shapely.prepare(geometria)
+    dentro = shapely.intersects_xy(geometria, x[candidatas], y[candidatas])
+    return np.sort(candidatas[dentro])
+
+
+def filas_en_limites(rejilla, x, y, limites):
+    # Filas dentro del rectángulo (xmin, ymin, xmax, ymax), ordenadas
+    candidatas = filas_en_rectangulo(rejilla, *limites)
+    xmin, ymin, xmax, ymax = limites
+    xs, ys = x[candidatas], y[candidatas]
+    return np.sort(candidatas[(xs >= xmin) & (xs <= xmax) & (ys >= ymin) & (ys <= ymax)])
+
+
+def limites_mapa(bounds):
+    # (xmin, ymin, xmax, ymax) desde los `bounds` que devuelve st_folium; None si aún no hay
+    try:
+        so, ne = bounds["_southWest"], bounds["_northEast"]
+        limites = (float(so["lng"]), float(so["lat"]), float(ne["lng"]), float(ne["lat"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+    return limites if limites[0] < limites[2] and limites[1] < limites[3] else None
+
+
+def ampliar(limites, margen):
+    # Agrega `margen` veces el ancho y el alto a cada lado
+    xmin, ymin, xmax, ymax = limites
+    dx, dy = (xmax - xmin) * margen, (ymax - ymin) * margen
+    return (xmin - dx, ymin - dy, xmax + dx, ymax + dy)
+
+
+def contiene(exterior, interior):
+    return (exterior[0] <= interior[0] and exterior[1] <= interior[1]
+            and exterior[2] >= interior[2] and exterior[3] >= interior[3])
+
+
+def area_dibujada(dibujos):
+    # Unión de las figuras con área devueltas por el plugin Draw (GeoJSON); None si no hay
+    figuras = [shape(d["geometry"]) for d in dibujos or []
+               if d.get("geometry", {}).get("type") in TIPOS_AREA]
+    if not figuras:
+        return None
+    return shapely.union_all(shapely.make_valid(np.array(figuras, dtype=object)))
+
+
+# --- BÚSQUEDA POR RADIO ---
+def construir_arbol(x, y):
+    # BallTree con distancia haversine sobre (lat, lon) en radianes; guarda a qué fila
+    # corresponde cada punto porque las coordenadas faltantes se dejan afuera
+    validos = ~(np.isnan(x) | np.isnan(y))
+    filas = np.flatnonzero(validos)
+    puntos = np.radians(np.column_stack([y[filas], x[filas]]))
+    return {"arbol": BallTree(puntos, metric="haversine") if len(filas) else None, "filas": filas}
+
+
+def filas_en_radio(arbol, lon, lat, radio_m):
+    # Filas a `radio_m` metros o menos del punto, ordenadas, con sus distancias en metros
+    if arbol["arbol"] is None:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    centro = np.radians([[lat, lon]])
+    indices, distancias = arbol["arbol"].query_radius(centro, r=radio_m / RADIO_TIERRA_M,
+                                                      return_distance=True)
+    filas = arbol["filas"][indices[0]]
+    orden = np.argsort(filas)
+    return filas[orden], distancias[0][orden] * RADIO_TIERRA_M
+
+
+# --- DENSIDAD (KDE) ---
+def limites_datos(x, y):
+    validos = ~(np.isnan(x) | np.isnan(y))
+    if not validos.any():
+        return None
+    return (float(x[validos].min()), float(y[validos].min()),
+            float(x[validos].max()), float(y[validos].max()))
+
+
+def densidad_kde(x, y, limites, ancho_banda_m=ANCHO_BANDA_M, celda_m=CELDA_KDE_M):
+    # Densidad gaussiana en crímenes por km² sobre una rejilla regular: los puntos se cuentan
+    # por celda y la rejilla de conteos se convoluciona con el núcleo por FFT, así que el
+    # costo depende del tamaño de la rejilla y no de la cantidad de puntos. `limites` fija
+    # la extensión (la de todos los datos) para que la rejilla no cambie con los filtros.
+    xmin, ymin, xmax, ymax = limites
+    metros_lat = METROS_POR_GRADO
+    metros_lon = METROS_POR_GRADO * np.cos(np.radians((ymin + ymax) / 2))
+    # Margen de tres anchos de banda para que la densidad no se corte en el borde
+    radio = 3 * ancho_banda_m
+    xmin, xmax = xmin - radio / metros_lon, xmax + radio / metros_lon
+    ymin, ymax = ymin - radio / metros_lat, ymax + radio / metros_lat
+    celda_m = max(celda_m, max((xmax - xmin) * metros_lon, (ymax - ymin) * metros_lat) / MAX_CELDAS_KDE)
+    tam_x, tam_y = celda_m / metros_lon, celda_m / metros_lat
+    nx, ny = int(np.ceil((xmax - xmin) / tam_x)), int(np.ceil((ymax - ymin) / tam_y))
+
+    ix = np.floor((x - xmin) / tam_x)
+    iy = np.floor((y - ymin) / tam_y)
+    dentro = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+    conteos = np.bincount(iy[dentro].astype(np.int64) * nx + ix[dentro].astype(np.int64),
+                          minlength=nx * ny).reshape(ny, nx).astype(np.float64)
+
+    sigma = ancho_banda_m / celda_m
+    r = int(np.ceil(3 * sigma))
+    eje = np.arange(-r, r + 1)
+    campana = np.exp(-0.5 * (eje / sigma) ** 2)
+    nucleo = np.outer(campana, campana)
+    nucleo /= nucleo.sum()
+
+    # Convolución lineal (sin que los bordes den la vuelta) con relleno de r celdas
+    forma = (ny + 2 * r, nx + 2 * r)
+    suavizado = np.fft.irfft2(np.fft.rfft2(conteos, forma) * np.fft.rfft2(nucleo, forma), forma)
+    suavizado = np.clip(suavizado[r:r + ny, r:r + nx], 0, None)
+    return {
+        "densidad": (suavizado / (celda_m / 1000) ** 2).astype(np.float32),
+        "limites": (xmin, ymin, xmin + nx * tam_x, ymin + ny * tam_y),
+        "celda_m": celda_m,
+    }
+
+
+# --- HEXÁGONOS ---
+def _plano(x, y, origen):
+    # Proyección equirectangular en metros alrededor de `origen` (suficiente a escala de ciudad)
+    lon0, lat0 = origen
+    metros_lon = METROS_POR_GRADO * np.cos(np.radians(lat0))
+    return (x - lon0) * metros_lon, (y - lat0) * METROS_POR_GRADO, metros_lon
+
+
+def _redondear_hex(q, r):
+    # Redondeo en coordenadas cúbicas: se corrige la coordenada con mayor error
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    corregir_q = (dq > dr) & (dq > ds)
+    corregir_r = ~corregir_q & (dr > ds)
+    rq = np.where(corregir_q, -rr - rs, rq)
+    rr = np.where(corregir_r, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+
+def celdas_hex(x, y, tamano_m, origen):
+    # Hexágonos con punta arriba de `tamano_m` metros de radio. Devuelve el código de celda
+    # de cada punto (-1 sin coordenadas) y las coordenadas axiales (q, r) de las celdas
+    # ocupadas, numeradas de 0 en adelante.
+    px, py, _ = _plano(x, y, origen)
+    validos = ~(np.isnan(px) | np.isnan(py))
+    q, r = _redondear_hex((np.sqrt(3) / 3 * px[validos] - py[validos] / 3) / tamano_m,
+                          (2 / 3 * py[validos]) / tamano_m)
+    codigos = np.full(len(x), -1, dtype=np.int32)
+    if len(q) == 0:
+        return codigos, q, r
+    # Una clave entera por celda para numerar las ocupadas con un solo np.unique
+    q0, r0 = q.min(), r.min()
+    ancho = r.max() - r0 + 1
+    claves, inversa = np.unique((q - q0) * ancho + (r - r0), return_inverse=True)
+    codigos[validos] = inversa
+    return codigos, claves // ancho + q0, claves % ancho + r0
+
+
+def poligonos_hex(q, r, tamano_m, origen):
+    # Geometrías GeoJSON (lon, lat) de las celdas
+    lon0, lat0 = origen
+    metros_lon = METROS_POR_GRADO * np.cos(np.radians(lat0))
+    cx = tamano_m * np.sqrt(3) * (q + r / 2)
+    cy = tamano_m * 1.5 * r
+    angulos = np.radians(30 + 60 * np.arange(7))
+    lon = lon0 + (cx[:, None] + tamano_m * np.cos(angulos)) / metros_lon
+    lat = lat0 + (cy[:, None] + tamano_m * np.sin(angulos)) / METROS_POR_GRADO
+    anillos = np.round(np.stack([lon, lat], axis=-1), 6).tolist()
+    return [{"type": "Polygon", "coordinates": [anillo]} for anillo in anillos]
+
+
+def indice_hex(x, y, tamanos=TAMANOS_HEX):
+    # Celdas de cada punto en varias resoluciones y la geometría de las celdas ocupadas;
+    # se calcula una vez por versión de los datos y los conteos salen de un bincount
+    limites = limites_datos(x, y)
+    origen = ((limites[0] + limites[2]) / 2, (limites[1] + limites[3]) / 2) if limites else (0.0, 0.0)
+    indice = {}
+    for tamano in tamanos:
+        codigos, q, r = celdas_hex(x, y, tamano, origen)
+        indice[tamano] = {"codigos": codigos, "geometrias": poligonos_hex(q, r, tamano, origen)}
+    return indice
+
+
+def conteo_hex(celdas, filas):
+    codigos = celdas["codigos"][filas]
+    return np.bincount(codigos[codigos >= 0], minlength=len(celdas["geometrias"]))
@@ -0,0 +1,277 @@
+# Generador determinista de crímenes sintéticos para pruebas de escala
+#
+# Produce N crímenes con el mismo esquema que crimenes.geojson, ubicados dentro de los
+# polígonos reales de barrios.geojson, con concentración espacial (barrios y focos con
+# más casos) y temporal (día de la semana, estacionalidad, rachas y horas pico).
+#
+# Uso:
+#     python generar_sintetico.py 1000000 --salida sintetico/crimenes_1m --formatos csv parquet
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from datos import GRUPOS_SOCIALES, RUTA_BARRIOS, RUTA_CRIMENES, cargar_barrios, leer_crimenes
+
+COLUMNAS = ["id", "latitud", "longitud", "fecha", "hora", "dia_semana", "edad", "sexo",
+            "tipo_crimen", "barrio"] + GRUPOS_SOCIALES
+FORMATOS = ["geojson", "csv", "parquet", "feather"]
+TAMANO_BLOQUE = 500_000
+FOCOS_POR_BARRIO = 3
+
+
+def perfil_referencia(gdf_crimenes):
+    # Distribuciones marginales tomadas de un archivo real (tipos, sexo, edad, horas, grupos)
+    tipos = gdf_crimenes["tipo_crimen"].value_counts(normalize=True)
+    sexo = gdf_crimenes["sexo"].value_counts(normalize=True)
+    horas = pd.to_datetime(gdf_crimenes["hora"], format="%H:%M", errors="coerce").dt.hour
+    # +1 para que ninguna hora quede con probabilidad cero
+    por_hora = np.bincount(horas.dropna().astype(int), minlength=24) + 1.0
+    return {
+        "tipos": (tipos.index.to_numpy(), tipos.to_numpy()),
+        "sexo": (sexo.index.to_numpy(), sexo.to_numpy()),
+        "edades": gdf_crimenes["edad"].dropna().astype(int).to_numpy(),
+        "horas": por_hora / por_hora.sum(),
+        "sociales": {g: float(gdf_crimenes[g].astype(float).mean())
+                     for g in GRUPOS_SOCIALES if g in gdf_crimenes.columns},
+    }
+
+
+def modelo_espacial(gdf_barrios, rng):
+    # Peso de cada barrio (cola pesada: pocos barrios concentran muchos casos) y unos
+    # pocos focos por barrio alrededor de los cuales se agrupan los puntos
+    barrios = gdf_barrios[gdf_barrios.geometry.notna() & gdf_barrios["NOMBRE"].notna()].reset_index(drop=True)
+    if "AREA_M2" in barrios.columns:
+        area = barrios["AREA_M2"].fillna(barrios["AREA_M2"].median()).to_numpy()
+    else:
+        area = barrios.to_crs(barrios.estimate_utm_crs()).geometry.area.to_numpy()
+    pesos = area ** 0.5 * rng.pareto(1.5, len(barrios))
+    pesos = pesos / pesos.sum()
+
+    focos = []
+    for geometria in barrios.geometry:
+        focos.append(_puntos_en_poligono(geometria, FOCOS_POR_BARRIO, rng))
+    return barrios, pesos, np.stack(focos)
+
+
+def _puntos_en_poligono(geometria, n, rng):
+    # Muestreo por rechazo uniforme dentro del polígono, vectorizado por lotes
+    minx, miny, maxx, maxy = geometria.bounds
+    puntos = np.empty((0, 2))
+    while len(puntos) < n:
+        faltan = n - len(puntos)
+        x = rng.uniform(minx, maxx, faltan * 4 + 8)
+        y = rng.uniform(miny, maxy, faltan * 4 + 8)
+        dentro = shapely.contains_xy(geometria, x, y)
+        puntos = np.vstack([puntos, np.column_stack([x[dentro], y[dentro]])])
+    return puntos[:n]
+
+
+def _ubicar(barrios, focos, idx_barrio, rng):
+    # Cada crimen cae cerca de uno de los focos de su barrio; los que quedan fuera del
+    # polígono se vuelven a sortear y, tras varios intentos, se ubican uniformemente
+    lon = np.empty(len(idx_barrio))
+    lat = np.empty(len(idx_barrio))
+    for b in np.unique(idx_barrio):
+        filas = np.flatnonzero(idx_barrio == b)
+        geometria = barrios.geometry.iloc[b]
+        minx, miny, maxx, maxy = geometria.bounds
+        escala = 0.15 * max(maxx - minx, maxy - miny)
+        pendientes = filas
+        for _ in range(5):
+            foco = focos[b, rng.integers(0, FOCOS_POR_BARRIO, len(pendientes))]
+            x = foco[:, 0] + rng.normal(0, escala, len(pendientes))
+            y = foco[:, 1] + rng.normal(0, escala, len(pendientes))
+            dentro = shapely.contains_xy(geometria, x, y)
+            lon[pendientes[dentro]] = x[dentro]
+            lat[pendientes[dentro]] = y[dentro]
+            pendientes = pendientes[~dentro]
+            if len(pendientes) == 0:
+                break
+        if len(pendientes):
+            resto = _puntos_en_poligono(geometria, len(pendientes), rng)
+            lon[pendientes], lat[pendientes] = resto[:, 0], resto[:, 1]
+    return lon, lat
+
+
+def pesos_diarios(desde, hasta, rng):
+    # Intensidad de cada día: más casos en fin de semana, ciclo anual y algunas rachas
+    dias = pd.date_range(desde, hasta, freq="D")
+    por_dia_semana = np.array([0.9, 0.9, 0.95, 1.0, 1.15, 1.3, 1.2])
+    estacional = 1 + 0.15 * np.sin(2 * np.pi * dias.dayofyear.to_numpy() / 365.25)
+    rachas = np.ones(len(dias))
+    for inicio in rng.choice(len(dias), size=max(1, len(dias) // 30), replace=False):
+        rachas[inicio:inicio + rng.integers(2, 6)] *= rng.uniform(1.5, 3.0)
+    pesos = por_dia_semana[dias.dayofweek] * estacional * rachas
+    return dias, pesos / pesos.sum()
+
+
+def generar_bloque(n, primer_id, perfil, espacial, dias, pesos_dias, rng):
+    barrios, pesos_barrios, focos = espacial
+    idx_barrio = rng.choice(len(barrios), size=n, p=pesos_barrios)
+    lon, lat = _ubicar(barrios, focos, idx_barrio, rng)
+
+    fechas = dias[rng.choice(len(dias), size=n, p=pesos_dias)]
+    horas = rng.choice(24, size=n, p=perfil["horas"])
+    minutos = rng.integers(0, 60, n)
+    tipos, p_tipos = perfil["tipos"]
+    sexos, p_sexos = perfil["sexo"]
+
+    datos = {
+        "id": np.arange(primer_id, primer_id + n, dtype=np.int64),
+        "latitud": lat,
+        "longitud": lon,
+        "fecha": fechas.strftime("%Y-%m-%d"),
+        # Mismo formato que el archivo original: hora sin cero a la izquierda ("8:05")
+        "hora": (pd.Series(horas).astype(str) + ":" +
+                 pd.Series(minutos).astype(str).str.zfill(2)).to_numpy(),
+        "dia_semana": fechas.dayofweek.to_numpy(),
+        "edad": rng.choice(perfil["edades"], size=n),
+        "sexo": rng.choice(sexos, size=n, p=p_sexos),
+        "tipo_crimen": rng.choice(tipos, size=n, p=p_tipos),
+        "barrio": barrios["NOMBRE"].to_numpy()[idx_barrio],
+    }
+    for grupo in GRUPOS_SOCIALES:
+        datos[grupo] = (rng.random(n) < perfil["sociales"].get(grupo, 0.0)).astype(np.int64)
+    return pd.DataFrame(datos, columns=COLUMNAS)
+
+
+def generar(n, semilla=0, ruta_barrios=RUTA_BARRIOS, ruta_referencia=RUTA_CRIMENES,
+            desde="2024-05-08", hasta="2025-05-08", tamano_bloque=TAMANO_BLOQUE):
+    # Genera los crímenes por bloques (DataFrames) para no tener todo en memoria a la vez
+    raiz = np.random.SeedSequence(semilla)
+    semilla_modelo, semilla_bloques = raiz.spawn(2)
+    rng = np.random.default_rng(semilla_modelo)
+
+    perfil = perfil_referencia(leer_crimenes(ruta_referencia))
+    espacial = modelo_espacial(cargar_barrios(ruta_barrios), rng)
+    dias, pesos_dias = pesos_diarios(desde, hasta, rng)
+
+    n_bloques = -(-n // tamano_bloque) if n else 0
+    for i, semilla_bloque in enumerate(semilla_bloques.spawn(n_bloques)):
+        tamano = min(tamano_bloque, n - i * tamano_bloque)
+        yield generar_bloque(tamano, i * tamano_bloque + 1, perfil, espacial, dias,
+                             pesos_dias, np.random.default_rng(semilla_bloque))
+
+
+# --- ESCRITURA ---
+class _EscritorGeoJSON:
+    # Escribe la FeatureCollection por partes, sin construir geometrías de shapely
+    def __init__(self, ruta):
+        self.archivo = open(ruta, "w", encoding="utf-8")
+        self.archivo.write('{"type": "FeatureCollection", "name": "crimenes", "crs": '
+                           '{"type": "name", "properties": {"name": "urn:ogc:def:crs:OGC:1.3:CRS84"}},'
+                           '\n"features": [\n')
+        self.primero = True
+
+    def escribir(self, bloque):
+        lineas = []
+        for fila in bloque.to_dict("records"):
+            propiedades = {k: (v.item() if hasattr(v, "item") else v) for k, v in fila.items()}
+            lineas.append(json.dumps({
+                "type": "Feature",
+                "properties": propiedades,
+                "geometry": {"type": "Point",
+                             "coordinates": [propiedades["longitud"], propiedades["latitud"]]},
+            }, ensure_ascii=False))
+        if lineas:
+            self.archivo.write(("" if self.primero else ",\n") + ",\n".join(lineas))
+            self.primero = False
+
+    def cerrar(self):
+        self.archivo.write("\n]}\n")
+        self.archivo.close()
+
+
+class _EscritorCSV:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.encabezado = True
+
+    def escribir(self, bloque):
+        bloque.to_csv(self.ruta, mode="w" if self.encabezado else "a",
+                      header=self.encabezado, index=False)
+        self.encabezado = False
+
+    def cerrar(self):
+        pass
+
+
+class _EscritorArrow:
+    # Parquet o Feather (Arrow IPC), escritos por lotes
+    def __init__(self, ruta, formato):
+        self.ruta = ruta
+        self.formato = formato
+        self.escritor = None
+
+    def escribir(self, bloque):
+        import pyarrow as pa
+
+        tabla = pa.Table.from_pandas(bloque, preserve_index=False)
+        if self.escritor is None:
+            if self.formato == "parquet":
+                import pyarrow.parquet as pq
+                self.escritor = pq.ParquetWriter(self.ruta, tabla.schema)
+            else:
+                self.escritor = pa.ipc.new_file(self.ruta, tabla.schema)
+        self.escritor.write_table(tabla)
+
+    def cerrar(self):
+        if self.escritor is not None:
+            self.escritor.close()
+
+
+def _escritor(base, formato):
+    ruta = f"{base}.{formato}"
+    if formato == "geojson":
+        return _EscritorGeoJSON(ruta)
+    if formato == "csv":
+        return _EscritorCSV(ruta)
+    return _EscritorArrow(ruta, formato)
+
+
+def guardar(bloques, base, formatos):
+    directorio = os.path.dirname(base)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    escritores = [_escritor(base, f) for f in formatos]
+    total = 0
+    try:
+        for bloque in bloques:
+            for escritor in escritores:
+                escritor.escribir(bloque)
+            total += len(bloque)
+    finally:
+        for escritor in escritores:
+            escritor.cerrar()
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Genera crímenes sintéticos con el esquema de crimenes.geojson.")
+    parser.add_argument("n", type=int, help="Número de crímenes (p. ej. 1000 a 10000000)")
+    parser.add_argument("--salida", default="sintetico/crimenes",
+                        help="Ruta base de salida, sin extensión")
+    parser.add_argument("--formatos", nargs="+", default=["geojson", "csv", "parquet"], choices=FORMATOS)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--barrios", default=RUTA_BARRIOS)
+    parser.add_argument("--referencia", default=RUTA_CRIMENES,
+                        help="Archivo real del que se toman las distribuciones de atributos")
+    parser.add_argument("--desde", default="2024-05-08")
+    parser.add_argument("--hasta", default="2025-05-08")
+    args = parser.parse_args(argv)
+
+    bloques = generar(args.n, semilla=args.semilla, ruta_barrios=args.barrios,
+                      ruta_referencia=args.referencia, desde=args.desde, hasta=args.hasta)
+    total = guardar(bloques, args.salida, args.formatos)
+    print(f"{total} crímenes sintéticos -> {', '.join(f'{args.salida}.{f}' for f in args.formatos)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
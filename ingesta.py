@@ -0,0 +1,356 @@
+# Ingesta incremental: agrega un lote de crímenes al almacén persistente de artefactos/
+#
+# Cada lote se deduplica contra lo ya cargado con dos índices hash en disco, uno por `id` y
+# otro por huella de contenido (fecha, hora, coordenadas, tipo, sexo y edad). Un crimen es
+# duplicado si su id ya existe con la misma huella; si el id existe con otro contenido
+# (ids que chocan entre fuentes), decide la huella. Después se actualizan el cubo de
+# conteos y los modelos del registro solo de las series que el lote toca, así que el costo
+# depende del tamaño del lote y no del historial.
+#
+# Uso:
+#     python ingesta.py nuevos.csv --artefactos artefactos
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import suppress
+
+import numpy as np
+import pandas as pd
+
+from almacen import abrir_almacen, escribir_esquema, escribir_filas, leer_esquema, tabla
+from base_sql import BASE_SQL, anexar_base, descartar_filas
+from datos import (RUTA_BARRIOS, cargar_barrios, con_geometria, cubo_conteos, leer_tabla,
+                   normalizar_crimenes, unir_barrios)
+from precomputar import (ALMACEN, CUBO, DIRECTORIO_ARTEFACTOS, INCREMENTOS_CUBO, MANIFIESTO,
+                         bloqueo_artefactos, cargar_cubo, precalcular_pronosticos)
+from validacion import validar
+
+INDICES = "indices.json"
+HUELLAS = "huellas.bin"
+VACIO = -1
+# Multiplicador de Fibonacci: reparte bien claves consecutivas como los ids
+MULTIPLICADOR = np.uint64(0x9E3779B97F4A7C15)
+
+
+# --- HUELLAS ---
+def huellas(df, x, y):
+    # Hash de 64 bits del contenido de cada crimen; las columnas que falten cuentan como vacías
+    def columna(nombre):
+        return df[nombre] if nombre in df.columns else pd.Series(np.nan, index=df.index)
+
+    partes = pd.DataFrame({
+        "fecha": pd.to_datetime(columna("fecha_dt"), errors="coerce").dt.normalize().astype("datetime64[ns]"),
+        "hora": columna("hora").astype(str).str.strip(),
+        "tipo_crimen": columna("tipo_crimen").astype(str),
+        "sexo": columna("sexo").astype(str),
+        "edad": pd.to_numeric(columna("edad"), errors="coerce").astype(np.float64),
+        "x": np.round(np.asarray(x, dtype=np.float64), 6),
+        "y": np.round(np.asarray(y, dtype=np.float64), 6),
+    }, index=df.index)
+    return pd.util.hash_pandas_object(partes, index=False).to_numpy()
+
+
+def _claves_id(ids):
+    return pd.to_numeric(pd.Series(ids), errors="coerce").fillna(-1).to_numpy().astype(np.int64).view(np.uint64)
+
+
+# --- ÍNDICE HASH ---
+# Direccionamiento abierto con sondeo lineal, vectorizado sobre lotes de claves. Se guarda
+# como dos archivos (claves y filas) que se mapean en memoria y se modifican en el lugar:
+# insertar un lote solo toca las páginas de sus ranuras.
+def crear_indice(capacidad):
+    capacidad = 1 << max(4, int(np.ceil(np.log2(max(capacidad, 1)))))
+    return {"claves": np.zeros(capacidad, dtype=np.uint64),
+            "filas": np.full(capacidad, VACIO, dtype=np.int64), "n": 0}
+
+
+def _ranuras(claves, capacidad):
+    bits = capacidad.bit_length() - 1
+    return ((claves * MULTIPLICADOR) >> np.uint64(64 - bits)).astype(np.int64)
+
+
+def buscar(indice, claves):
+    # Fila de cada clave, o VACIO si no está
+    claves = np.asarray(claves, dtype=np.uint64)
+    mascara_capacidad = len(indice["filas"]) - 1
+    resultado = np.full(len(claves), VACIO, dtype=np.int64)
+    pendientes = np.arange(len(claves))
+    ranuras = _ranuras(claves, len(indice["filas"]))
+    while len(pendientes):
+        filas = indice["filas"][ranuras]
+        vacias = filas == VACIO
+        halladas = ~vacias & (indice["claves"][ranuras] == claves[pendientes])
+        resultado[pendientes[halladas]] = filas[halladas]
+        siguen = ~vacias & ~halladas
+        pendientes = pendientes[siguen]
+        ranuras = (ranuras[siguen] + 1) & mascara_capacidad
+    return resultado
+
+
+def insertar(indice, claves, filas):
+    # Inserta claves distintas entre sí y que no estén en el índice. Si el índice pasa de
+    # la mitad de su capacidad se reconstruye más grande (devuelve el índice a usar).
+    claves = np.asarray(claves, dtype=np.uint64)
+    filas = np.asarray(filas, dtype=np.int64)
+    if (indice["n"] + len(claves)) * 2 > len(indice["filas"]):
+        ocupadas = indice["filas"] != VACIO
+        nuevo = crear_indice(4 * (indice["n"] + len(claves)))
+        indice = insertar(nuevo, np.asarray(indice["claves"][ocupadas]), np.asarray(indice["filas"][ocupadas]))
+
+    mascara_capacidad = len(indice["filas"]) - 1
+    pendientes = np.arange(len(claves))
+    ranuras = _ranuras(claves, len(indice["filas"]))
+    while len(pendientes):
+        libres = indice["filas"][ranuras] == VACIO
+        # Si varias claves caen en la misma ranura libre, se la queda la primera
+        _, primeras = np.unique(ranuras[libres], return_index=True)
+        ganan = np.flatnonzero(libres)[primeras]
+        indice["claves"][ranuras[ganan]] = claves[pendientes[ganan]]
+        indice["filas"][ranuras[ganan]] = filas[pendientes[ganan]]
+
+        # Las que encontraron la ranura ocupada siguen a la próxima; las que perdieron la
+        # reintentan y en la siguiente vuelta la verán ocupada
+        ranuras = np.where(libres, ranuras, (ranuras + 1) & mascara_capacidad)
+        resto = np.ones(len(pendientes), dtype=bool)
+        resto[ganan] = False
+        pendientes, ranuras = pendientes[resto], ranuras[resto]
+    indice["n"] += len(claves)
+    return indice
+
+
+def _rutas_indice(directorio, nombre):
+    return (os.path.join(directorio, f"indice_{nombre}_claves.bin"),
+            os.path.join(directorio, f"indice_{nombre}_filas.bin"))
+
+
+def abrir_indice(directorio, nombre, n):
+    ruta_claves, ruta_filas = _rutas_indice(directorio, nombre)
+    return {"claves": np.memmap(ruta_claves, dtype=np.uint64, mode="r+"),
+            "filas": np.memmap(ruta_filas, dtype=np.int64, mode="r+"), "n": n}
+
+
+def guardar_indice(directorio, nombre, indice):
+    if isinstance(indice["filas"], np.memmap):
+        indice["claves"].flush()
+        indice["filas"].flush()
+        return
+    # Índice nuevo o reconstruido: se escriben los archivos completos
+    for ruta, arreglo in zip(_rutas_indice(directorio, nombre), (indice["claves"], indice["filas"])):
+        arreglo.tofile(ruta + ".tmp")
+        os.replace(ruta + ".tmp", ruta)
+
+
+def _primeras(claves):
+    # Posición de la primera aparición de cada clave distinta, en orden de aparición
+    _, primeras = np.unique(claves, return_index=True)
+    return np.sort(primeras)
+
+
+def preparar_indices(directorio_almacen):
+    # Abre los índices del almacén o los construye la primera vez (una pasada completa).
+    # También se reconstruyen si no corresponden al `n` publicado del almacén: una ingesta
+    # se cortó después de tocarlos y antes de publicar sus filas.
+    almacen = abrir_almacen(directorio_almacen)
+    try:
+        with open(os.path.join(directorio_almacen, INDICES), encoding="utf-8") as f:
+            conteos = json.load(f)
+    except (OSError, ValueError):
+        conteos = {}
+    if conteos.pop("filas_almacen", None) == almacen["n"]:
+        return {nombre: abrir_indice(directorio_almacen, nombre, n) for nombre, n in conteos.items()}
+
+    filas = np.arange(almacen["n"])
+    valores_huella = huellas(tabla(almacen, filas, [c for c in ("fecha_dt", "hora", "tipo_crimen", "sexo", "edad")
+                                                   if c in almacen["columnas"]]),
+                             almacen["x"], almacen["y"])
+    valores_huella.tofile(os.path.join(directorio_almacen, HUELLAS))
+
+    indices = {}
+    for nombre, claves in (("id", _claves_id(almacen["valores"]["id"])), ("huella", valores_huella)):
+        primeras = _primeras(claves)
+        indices[nombre] = insertar(crear_indice(4 * len(primeras)), claves[primeras], primeras)
+        guardar_indice(directorio_almacen, nombre, indices[nombre])
+    _guardar_conteos(directorio_almacen, indices, almacen["n"])
+    return indices
+
+
+def _guardar_conteos(directorio_almacen, indices, filas_almacen):
+    ruta = os.path.join(directorio_almacen, INDICES)
+    conteos = {nombre: indice["n"] for nombre, indice in indices.items()}
+    conteos["filas_almacen"] = int(filas_almacen)
+    with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(conteos, f)
+    os.replace(ruta + ".tmp", ruta)
+
+
+# --- DEDUPLICACIÓN ---
+def separar_duplicados(gdf, indices, huellas_almacen):
+    # Devuelve (nuevos, huellas de los nuevos, duplicados, colisiones de id)
+    h = huellas(gdf, gdf.geometry.x, gdf.geometry.y)
+    ids = _claves_id(gdf["id"])
+
+    # Repetidos dentro del mismo lote (mismo id y mismo contenido)
+    unicos = ~pd.DataFrame({"id": ids, "h": h}).duplicated().to_numpy()
+    fila_id = buscar(indices["id"], ids)
+    existe_id = fila_id != VACIO
+    mismo_contenido = np.zeros(len(gdf), dtype=bool)
+    mismo_contenido[existe_id] = huellas_almacen[fila_id[existe_id]] == h[existe_id]
+    # Si el id choca con otro crimen, decide la huella
+    colision = existe_id & ~mismo_contenido
+    huella_conocida = buscar(indices["huella"], h) != VACIO
+
+    nuevos = unicos & ~mismo_contenido & ~(colision & huella_conocida)
+    # Un mismo contenido repetido en el lote con ids que chocan se agrega una sola vez
+    nuevos &= ~(colision & pd.Series(h).duplicated().to_numpy())
+    return gdf[nuevos], h[nuevos], int((~nuevos).sum()), int((colision & nuevos).sum())
+
+
+# --- CUBO Y PRONÓSTICOS ---
+def actualizar_cubo(directorio, nuevos):
+    # El cubo del lote se guarda como un incremento con el mismo origen que el cubo base;
+    # si el lote trae fechas anteriores a ese origen, se reconstruye desde el almacén
+    cubo = pd.read_pickle(os.path.join(directorio, CUBO))
+    origen = cubo.attrs["origen"]
+    if nuevos["fecha_dt"].min() >= origen:
+        carpeta = os.path.join(directorio, INCREMENTOS_CUBO)
+        os.makedirs(carpeta, exist_ok=True)
+        numero = len([a for a in os.listdir(carpeta) if a.endswith(".pkl")])
+        cubo_conteos(nuevos, origen=origen).to_pickle(os.path.join(carpeta, f"{numero:06d}.pkl"))
+        return False
+
+    almacen = abrir_almacen(os.path.join(directorio, ALMACEN))
+    columnas = [c for c in almacen["columnas"] if c not in ("geometry",)]
+    todos = tabla(almacen, np.arange(almacen["n"]), columnas)
+    if "hora_h" in todos.columns:
+        # Las horas faltantes de filas agregadas se guardan como -1
+        todos["hora_h"] = todos["hora_h"].where(todos["hora_h"] >= 0)
+    cubo_conteos(todos).to_pickle(os.path.join(directorio, CUBO))
+    carpeta = os.path.join(directorio, INCREMENTOS_CUBO)
+    if os.path.isdir(carpeta):
+        for archivo in os.listdir(carpeta):
+            os.remove(os.path.join(carpeta, archivo))
+    return True
+
+
+def actualizar_pronosticos(directorio, nuevos, manifiesto):
+    # Solo se reajustan en el registro la serie de la ciudad y las de los barrios y tipos
+    # del lote, con las semanas que usó el precálculo
+    modelos = manifiesto.get("modelos") or []
+    if not modelos:
+        return []
+    recalculados = precalcular_pronosticos(nuevos, cargar_cubo(directorio), modelos,
+                                           manifiesto["semanas_entrenamiento"],
+                                           manifiesto["semanas_prediccion"])
+    return sorted(recalculados["serie"].unique())
+
+
+# --- INGESTA ---
+def ingerir(archivo, directorio=DIRECTORIO_ARTEFACTOS, ruta_barrios=RUTA_BARRIOS):
+    # Todo bajo el bloqueo de los artefactos: el almacén, los índices hash, el cubo y el
+    # manifiesto se modifican en el lugar y dos ingestas a la vez los corromperían
+    with bloqueo_artefactos(directorio):
+        return _ingerir(archivo, directorio, ruta_barrios)
+
+
+def _ingerir(archivo, directorio, ruta_barrios):
+    inicio = time.time()
+    ruta_manifiesto = os.path.join(directorio, MANIFIESTO)
+    with open(ruta_manifiesto, encoding="utf-8") as f:
+        manifiesto = json.load(f)
+    directorio_almacen = os.path.join(directorio, ALMACEN)
+
+    # Las filas con errores de validación no entran al histórico
+    tabla_lote = leer_tabla(archivo)
+    tipos = (leer_esquema(directorio_almacen) or {}).get("categorias", {}).get("tipo_crimen")
+    informe, validas = validar(tabla_lote, tipos)
+    if (informe["regla"] == "columna_faltante").any():
+        raise ValueError("Faltan columnas en el lote: " + informe["columna"].iloc[0])
+    gdf = normalizar_crimenes(con_geometria(tabla_lote[validas]))
+    gdf = unir_barrios(gdf, cargar_barrios(ruta_barrios)).reset_index(drop=True)
+
+    indices = preparar_indices(directorio_almacen)
+    ruta_huellas = os.path.join(directorio_almacen, HUELLAS)
+    huellas_almacen = np.memmap(ruta_huellas, dtype=np.uint64, mode="r") \
+        if os.path.getsize(ruta_huellas) else np.empty(0, dtype=np.uint64)
+    nuevos, huellas_nuevas, duplicados, colisiones = separar_duplicados(gdf, indices, huellas_almacen)
+    del huellas_almacen
+
+    resumen = {
+        "archivo": str(getattr(archivo, "name", archivo)),
+        "fecha": time.time(),
+        "recibidos": len(tabla_lote),
+        "invalidos": int((~validas).sum()),
+        "nuevos": len(nuevos),
+        "duplicados": duplicados,
+        "colisiones_id": colisiones,
+        "cubo_reconstruido": False,
+        "series_actualizadas": [],
+        "validacion": informe.to_dict("records"),
+    }
+    if len(nuevos):
+        # Las filas se escriben más allá del `n` del almacén y `n` se publica al final: si
+        # algo falla antes, el almacén no cambia y reintentar no duplica nada
+        esquema = escribir_filas(directorio_almacen, nuevos)
+        primera = esquema["n"] - len(nuevos)
+        filas = np.arange(primera, primera + len(nuevos))
+        ruta_sql = os.path.join(directorio, BASE_SQL) if manifiesto.get("base_sql") else None
+        try:
+            # Los índices se marcan con el `n` que tendrá el almacén antes de tocarlos; si
+            # la ingesta se corta, no coincide con el publicado y la próxima los reconstruye
+            _guardar_conteos(directorio_almacen, indices, esquema["n"])
+            with open(ruta_huellas, "r+b") as f:
+                f.truncate(primera * huellas_nuevas.itemsize)
+                f.seek(0, os.SEEK_END)
+                huellas_nuevas.tofile(f)
+
+            # Índices: el id (o la huella) apunta a la primera fila que lo tuvo
+            for nombre, claves in (("id", _claves_id(nuevos["id"])), ("huella", huellas_nuevas)):
+                primeras = _primeras(claves)
+                ausentes = buscar(indices[nombre], claves[primeras]) == VACIO
+                primeras = primeras[ausentes]
+                indices[nombre] = insertar(indices[nombre], claves[primeras], filas[primeras])
+                guardar_indice(directorio_almacen, nombre, indices[nombre])
+            _guardar_conteos(directorio_almacen, indices, esquema["n"])
+
+            if ruta_sql:
+                anexar_base(ruta_sql, nuevos, primera)
+            escribir_esquema(directorio_almacen, esquema)
+        except Exception:
+            if ruta_sql:
+                # Si tampoco se puede, las consultas de la app ignoran filas desde el `n`
+                # del almacén y la próxima ingesta las reemplaza
+                with suppress(Exception):
+                    descartar_filas(ruta_sql, primera)
+            raise
+
+        resumen["cubo_reconstruido"] = actualizar_cubo(directorio, nuevos)
+        resumen["series_actualizadas"] = actualizar_pronosticos(directorio, nuevos, manifiesto)
+
+    resumen["duracion_s"] = round(time.time() - inicio, 2)
+    # El manifiesto se reescribe al final: la app recarga los artefactos cuando cambia
+    manifiesto["filas"] = manifiesto.get("filas", 0) + len(nuevos)
+    manifiesto["ingestas"] = manifiesto.get("ingestas", []) + [resumen]
+    with open(ruta_manifiesto + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=2)
+    os.replace(ruta_manifiesto + ".tmp", ruta_manifiesto)
+    return resumen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Agrega un lote de crímenes al almacén de artefactos, sin duplicados.")
+    parser.add_argument("archivo", help="Lote de crímenes (.geojson o .csv)")
+    parser.add_argument("--artefactos", default=DIRECTORIO_ARTEFACTOS)
+    parser.add_argument("--barrios", default=RUTA_BARRIOS)
+    args = parser.parse_args(argv)
+
+    resumen = ingerir(args.archivo, args.artefactos, args.barrios)
+    print(f"{resumen['nuevos']} nuevos, {resumen['invalidos']} inválidos, {resumen['duplicados']} duplicados "
+          f"({resumen['colisiones_id']} con id repetido y otro contenido) en {resumen['duracion_s']} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
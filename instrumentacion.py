@@ -0,0 +1,97 @@
+# Medición de tiempos por etapa de cada ejecución (rerun) de la app
+#
+#     traza = iniciar_traza(sesion_id)
+#     with medir("filtrar_datos"):
+#         ...
+#     finalizar_traza()   # agrega una línea al archivo JSONL de trazas
+#
+# El archivo rota al pasar de MAX_BYTES_TRAZAS: el actual pasa a `<ruta>.1` (reemplazando
+# al anterior) y se empieza uno nuevo, así que en disco nunca hay más del doble.
+# Fuera de una traza activa, `medir` y `medido` no registran nada, así que los módulos
+# pueden instrumentarse sin depender de que se ejecuten dentro de Streamlit.
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+RUTA_TRAZAS = os.environ.get("BARRANQUILLA_TRAZAS", "trazas.jsonl")
+MAX_BYTES_TRAZAS = 20 * 1024 * 1024
+
+# Cada sesión de Streamlit ejecuta su script en su propio hilo, con su propia traza
+_traza_actual = ContextVar("traza_actual", default=None)
+_bloqueo_archivo = threading.Lock()
+
+
+def iniciar_traza(sesion_id=None, rerun_id=None):
+    traza = {
+        "rerun_id": rerun_id or uuid.uuid4().hex[:12],
+        "sesion_id": sesion_id,
+        "inicio": time.time(),
+        "_inicio_perf": time.perf_counter(),
+        "etapas": [],
+    }
+    _traza_actual.set(traza)
+    return traza
+
+
+def traza_actual():
+    return _traza_actual.get()
+
+
+@contextmanager
+def medir(etapa, **detalles):
+    traza = _traza_actual.get()
+    if traza is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registro = {"etapa": etapa, "ms": round((time.perf_counter() - inicio) * 1000, 2)}
+        if detalles:
+            registro.update(detalles)
+        traza["etapas"].append(registro)
+
+
+def medido(etapa):
+    # Versión decorador de `medir`
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with medir(etapa):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def finalizar_traza(ruta=None):
+    # Cierra la traza actual y la agrega al archivo JSONL (ruta vacía para no escribir)
+    traza = _traza_actual.get()
+    if traza is None:
+        return None
+    _traza_actual.set(None)
+
+    registro = {k: v for k, v in traza.items() if not k.startswith("_")}
+    registro["total_ms"] = round((time.perf_counter() - traza["_inicio_perf"]) * 1000, 2)
+
+    ruta = RUTA_TRAZAS if ruta is None else ruta
+    if ruta:
+        linea = json.dumps(registro, ensure_ascii=False, default=str) + "\n"
+        with _bloqueo_archivo:
+            _rotar(ruta)
+            with open(ruta, "a", encoding="utf-8") as f:
+                f.write(linea)
+    return registro
+
+
+def _rotar(ruta):
+    try:
+        if os.path.getsize(ruta) >= MAX_BYTES_TRAZAS:
+            os.replace(ruta, ruta + ".1")
+    except OSError:
+        pass
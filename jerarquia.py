@@ -0,0 +1,164 @@
+# Pronóstico jerárquico (ciudad → zona → barrio y ciudad → tipo de crimen) con reconciliación
+#
+# Las series del nivel inferior son barrio × tipo de crimen; todas las demás se obtienen
+# sumándolas con una matriz dispersa S (una fila por serie, una columna por serie inferior).
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import LinearOperator, cg
+
+from datos import GRANULARIDADES, mascara_cubo, rango_periodos
+
+NIVELES = ["ciudad", "zona", "barrio", "tipo", "barrio_tipo"]
+METODOS_BASE = ["Tendencia lineal", "Promedio"]
+SIN_ZONA = "Sin zona"
+
+
+def zonas_de_barrios(gdf_barrios, n_zonas=5):
+    # Usa LOCALIDAD si viene en el archivo; si no, agrupa los barrios por cercanía
+    if "LOCALIDAD" in gdf_barrios.columns and gdf_barrios["LOCALIDAD"].notna().any():
+        zonas = gdf_barrios["LOCALIDAD"].fillna(SIN_ZONA)
+    else:
+        from sklearn.cluster import KMeans
+
+        puntos = gdf_barrios.geometry.representative_point()
+        X = np.column_stack([puntos.x, puntos.y])
+        modelo = KMeans(n_clusters=min(n_zonas, len(X)), n_init=10, random_state=0).fit(X)
+        # Zonas numeradas de occidente a oriente para que los nombres sean estables
+        orden = np.argsort(np.argsort(modelo.cluster_centers_[:, 0]))
+        zonas = pd.Series([f"Zona {orden[e] + 1}" for e in modelo.labels_], index=gdf_barrios.index)
+    return dict(zip(gdf_barrios["NOMBRE"], zonas))
+
+
+def construir_jerarquia(barrios, tipos, zona_de):
+    # Devuelve la matriz de suma S (dispersa) y una tabla con el nivel y nombre de cada fila
+    B, T = len(barrios), len(tipos)
+    zonas = sorted({zona_de.get(b, SIN_ZONA) for b in barrios})
+    indice_zona = {z: i for i, z in enumerate(zonas)}
+    Z = len(zonas)
+
+    inferior = np.arange(B * T)
+    b_idx, t_idx = np.divmod(inferior, T)
+    z_de_b = np.array([indice_zona[zona_de.get(b, SIN_ZONA)] for b in barrios], dtype=np.int64)
+
+    filas = np.concatenate([
+        np.zeros(B * T, dtype=np.int64),     # ciudad
+        1 + z_de_b[b_idx],                   # zona
+        1 + Z + b_idx,                       # barrio
+        1 + Z + B + t_idx,                   # tipo de crimen
+        1 + Z + B + T + inferior,            # barrio × tipo
+    ])
+    columnas = np.tile(inferior, 5)
+    n_total = 1 + Z + B + T + B * T
+    S = sparse.csr_matrix((np.ones(len(filas)), (filas, columnas)), shape=(n_total, B * T))
+
+    barrios_arr = np.asarray(barrios, dtype=object)
+    tipos_arr = np.asarray(tipos, dtype=object)
+    etiquetas = pd.DataFrame({
+        "nivel": (["ciudad"] + ["zona"] * Z + ["barrio"] * B + ["tipo"] * T + ["barrio_tipo"] * (B * T)),
+        "nombre": np.concatenate([
+            ["Barranquilla"], zonas, barrios_arr, tipos_arr,
+            barrios_arr[b_idx] + " | " + tipos_arr[t_idx],
+        ]),
+    })
+    return S, etiquetas
+
+
+def matriz_inferior(cubo, filtros, barrios, tipos, granularidad="Semanal", ultimos=None):
+    # Conteos por periodo de cada serie barrio × tipo, respetando el resto de filtros.
+    # Con `ultimos` solo se construyen los últimos periodos (la ventana de entrenamiento).
+    filtros = dict(filtros, barrio="Todos", tipo_crimen="Todos")
+    sub = cubo[mascara_cubo(cubo, filtros)]
+    primero, periodos = rango_periodos(cubo, granularidad)
+    if ultimos is not None:
+        primero += max(len(periodos) - ultimos, 0)
+        periodos = periodos[-ultimos:]
+    P, T = len(periodos), len(tipos)
+
+    p = sub["hora_idx"].to_numpy() // GRANULARIDADES[granularidad][1] - primero
+    b = pd.Index(barrios).get_indexer(sub["barrio"])
+    t = pd.Index(tipos).get_indexer(sub["tipo_crimen"])
+    validos = (p >= 0) & (p < P) & (b >= 0) & (t >= 0)
+
+    plano = ((b * T + t) * P + p)[validos]
+    Y = np.bincount(plano, weights=sub["y"].to_numpy()[validos], minlength=len(barrios) * T * P)
+    return Y.reshape(len(barrios) * T, P), periodos
+
+
+def pronosticos_base(Y, periodos, metodo="Tendencia lineal"):
+    # Pronóstico de todas las series a la vez (una fila por serie) y sus residuos en muestra
+    n = Y.shape[1]
+    if metodo == "Promedio":
+        media = Y.mean(axis=1, keepdims=True)
+        return np.repeat(media, periodos, axis=1), Y - media
+
+    # Mínimos cuadrados de una recta por serie, resuelto en forma cerrada para todas
+    x = np.arange(n, dtype=np.float64)
+    xc = x - x.mean()
+    media = Y.mean(axis=1)
+    pendiente = (Y - media[:, None]) @ xc / max((xc ** 2).sum(), 1e-12)
+    intercepto = media - pendiente * x.mean()
+    ajuste = intercepto[:, None] + pendiente[:, None] * x
+    futuro = intercepto[:, None] + pendiente[:, None] * np.arange(n, n + periodos)
+    return futuro, Y - ajuste
+
+
+def reconciliar_bottom_up(S, base):
+    # Las series inferiores son las últimas filas; el resto se obtiene sumándolas
+    return S @ base[-S.shape[1]:]
+
+
+def reconciliar_mint(S, base, residuos, piso=1e-3):
+    # MinT con W diagonal (varianza de los residuos de cada serie):
+    #     ỹ = S (SᵀW⁻¹S)⁻¹ SᵀW⁻¹ ŷ
+    # SᵀW⁻¹S nunca se forma: la fila de la ciudad la volvería densa. Se resuelve con
+    # gradiente conjugado usando solo productos por S, que tiene 5 no ceros por columna.
+    varianzas = residuos.var(axis=1)
+    w_inv = 1.0 / np.maximum(varianzas, piso * max(varianzas.mean(), piso))
+    St = S.T.tocsr()
+    n_inf = S.shape[1]
+
+    A = LinearOperator((n_inf, n_inf), dtype=np.float64,
+                       matvec=lambda v: St @ (w_inv * (S @ v)))
+    diagonal = St @ w_inv
+    M = LinearOperator((n_inf, n_inf), dtype=np.float64, matvec=lambda v: v / diagonal)
+
+    lado_derecho = St @ (w_inv[:, None] * base)
+    inferior = np.empty((n_inf, base.shape[1]))
+    for h in range(base.shape[1]):
+        inferior[:, h], _ = cg(A, lado_derecho[:, h], x0=base[-n_inf:, h], rtol=1e-10, M=M)
+    return S @ inferior
+
+
+def pronostico_jerarquico(cubo, filtros, gdf_barrios, periodos_entrenamiento, periodos,
+                          metodo="Tendencia lineal", n_zonas=5, granularidad="Semanal"):
+    # Tabla larga (nivel, nombre, ds, base, bottom_up, mint) para todas las series
+    zona_de = zonas_de_barrios(gdf_barrios, n_zonas=n_zonas)
+    barrios = sorted(set(gdf_barrios["NOMBRE"].dropna()) | set(cubo["barrio"].dropna()))
+    tipos = sorted(cubo["tipo_crimen"].dropna().unique())
+
+    S, etiquetas = construir_jerarquia(barrios, tipos, zona_de)
+    Y_inf, fechas = matriz_inferior(cubo, filtros, barrios, tipos, granularidad,
+                                    ultimos=periodos_entrenamiento)
+    Y = S @ Y_inf
+
+    base, residuos = pronosticos_base(Y, periodos, metodo)
+    # Son conteos: una tendencia que cae bajo cero se corta en cero en cada serie, y por
+    # eso los pronósticos base de distintos niveles dejan de sumar entre sí
+    base = np.maximum(base, 0)
+
+    bottom_up = reconciliar_bottom_up(S, base)
+    # MinT puede dejar series inferiores negativas; se cortan en cero y se vuelven a sumar,
+    # así el resultado sigue siendo coherente y ningún nivel muestra conteos negativos
+    mint = reconciliar_bottom_up(S, np.maximum(reconciliar_mint(S, base, residuos), 0))
+
+    futuras = pd.date_range(fechas[-1], periods=periodos + 1, freq=GRANULARIDADES[granularidad][0])[1:]
+    n = len(etiquetas)
+    return pd.DataFrame({
+        "nivel": np.repeat(etiquetas["nivel"].to_numpy(), periodos),
+        "nombre": np.repeat(etiquetas["nombre"].to_numpy(), periodos),
+        "ds": np.tile(futuras.to_numpy(), n),
+        "base": base.ravel(),
+        "bottom_up": bottom_up.ravel(),
+        "mint": mint.ravel(),
+    })
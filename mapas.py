@@ -0,0 +1,359 @@
+# Construcción de los mapas de folium de la app (puntos, animación y semaforización de barrios)
+#
+# Separado de streamlit_app.py para poder generar el HTML de los mapas fuera de
+# Streamlit, p. ej. desde los benchmarks.
+import hashlib
+import json
+
+import folium
+import numpy as np
+from branca.element import MacroElement
+from folium.plugins import Draw, VectorGridProtobuf
+from folium.raster_layers import ImageOverlay
+from jinja2 import Template
+from matplotlib import colormaps
+from matplotlib.colors import ListedColormap, to_hex
+
+from datos import conteo_por_barrio
+from instrumentacion import medir
+
+# Límites superiores (inclusive) de cada color del semáforo
+SEMAFORO = [(0, "#5cba47"), (5, "#ffda33"), (15, "#ff9c33"), (float("inf"), "#ff3333")]
+
+LEYENDA_SEMAFORO = """
+    <div style="position: fixed; bottom: 50px; right: 50px; background-color: rgba(0, 0, 0, 0.7);
+                padding: 10px; border-radius: 5px; z-index: 900; color: white;">
+      <h4>Semaforización de Crímenes</h4>
+      <p><i class="fa fa-square" style="color:#5cba47;"></i> Sin crímenes</p>
+      <p><i class="fa fa-square" style="color:#ffda33;"></i> 1-5 crímenes</p>
+      <p><i class="fa fa-square" style="color:#ff9c33;"></i> 6-15 crímenes</p>
+      <p><i class="fa fa-square" style="color:#ff3333;"></i> >15 crímenes</p>
+    </div>
+    """
+# La animación lleva todas las coordenadas en el HTML: por encima de esto se envía una muestra
+MAX_PUNTOS_ANIMACION = 200_000
+# Las coordenadas viajan como enteros en unidades de 1e-5 grados (~1 m)
+ESCALA_ANIMACION = 100_000
+
+
+def centro_barrios(gdf_barrios):
+    return [gdf_barrios.geometry.centroid.y.mean(), gdf_barrios.geometry.centroid.x.mean()]
+
+
+def colores_por_tipo(categorias, paleta):
+    cmap = ListedColormap(paleta)
+    return {cat: to_hex(cmap(i / max(1, len(categorias) - 1)))
+            for i, cat in enumerate(categorias)}
+
+
+def color_semaforo(cantidad):
+    for limite, color in SEMAFORO:
+        if cantidad <= limite:
+            return color
+
+
+def semaforizar_conteos(crimen_por_barrio, gdf_barrios):
+    # Conteo de crímenes por barrio (barrio, cantidad_crimenes) unido a los polígonos,
+    # con su color de semáforo
+    gdf_barrios_semaforo = gdf_barrios.merge(
+        crimen_por_barrio, how='left',
+        left_on='NOMBRE', right_on='barrio'
+    )
+    # Barrios sin crímenes quedan en 0
+    gdf_barrios_semaforo['cantidad_crimenes'] = gdf_barrios_semaforo['cantidad_crimenes'].fillna(0)
+    gdf_barrios_semaforo['color_semaforo'] = gdf_barrios_semaforo['cantidad_crimenes'].apply(color_semaforo)
+    return gdf_barrios_semaforo
+
+
+def semaforizar_barrios(gdf, gdf_barrios):
+    return semaforizar_conteos(conteo_por_barrio(gdf), gdf_barrios)
+
+
+def clave_semaforo(gdf_barrios_semaforo, origen=None, teselas=False):
+    # Huella de un mapa de semáforo: el vector de conteos por barrio, el esquema de colores,
+    # la marca de los datos (`origen`) y el modo (documento HTML o capa de teselas). Dos
+    # selecciones con los mismos conteos sobre los mismos datos producen el mismo mapa.
+    conteos = gdf_barrios_semaforo["cantidad_crimenes"].to_numpy(dtype=np.float64)
+    huella = hashlib.sha1(np.ascontiguousarray(conteos).tobytes())
+    huella.update(json.dumps({"semaforo": SEMAFORO, "origen": origen, "teselas": teselas},
+                             default=str).encode("utf-8"))
+    return huella.hexdigest()
+
+
+def popup_crimen(row):
+    return folium.Popup(f"""
+        <b>ID:</b> {row['id']}<br>
+        <b>Tipo:</b> {row['tipo_crimen']}<br>
+        <b>Fecha:</b> {row['fecha']}<br>
+        <b>Hora:</b> {row.get('hora', 'N/A')}<br>
+        <b>Barrio:</b> {row.get('barrio', 'N/A')}<br>
+        <b>Edad:</b> {row.get('edad', 'N/A')}<br>
+        <b>Sexo:</b> {row.get('sexo', 'N/A')}<br>
+        <b>Sociales:</b><br>
+        {'✔️' if row.get('habitante_calle', False) else '❌'} Habitante calle<br>
+        {'✔️' if row.get('prostitucion', False) else '❌'} Prostitución<br>
+        {'✔️' if row.get('lgtbi', False) else '❌'} LGTBI<br>
+        {'✔️' if row.get('grupo_etnico', False) else '❌'} Grupo étnico
+    """, max_width=300)
+
+
+def herramienta_dibujo():
+    # Solo figuras con área: polígonos libres y rectángulos
+    return Draw(draw_options={"polyline": False, "circle": False, "circlemarker": False, "marker": False},
+                edit_options={"edit": False})
+
+
+def mapa_puntos(gdf, gdf_barrios, color_dict, area=None, busqueda=None):
+    # Pestaña 1: un marcador por crimen sobre los contornos de los barrios, con la
+    # herramienta para dibujar un área de filtro y el área activa, si hay una. `busqueda`
+    # ({"centro": (lat, lon), "radio": metros, "filas": ...}) dibuja el círculo de la
+    # búsqueda por radio y resalta los crímenes encontrados (por número de fila).
+    # Sin puntos (p. ej. fuera del área visible) se centra en los barrios
+    puntos = gdf if len(gdf) else gdf_barrios.geometry.centroid
+    centro = [puntos.geometry.y.mean(), puntos.geometry.x.mean()]
+    m = folium.Map(location=centro, zoom_start=13, tiles="CartoDB dark_matter")
+
+    folium.GeoJson(gdf_barrios, name="Barrios",
+                   style_function=lambda x: {"fillOpacity": 0, "color": "white", "weight": 1}).add_to(m)
+    if area is not None:
+        folium.GeoJson(area.__geo_interface__, name="Área dibujada",
+                       style_function=lambda x: {"fillOpacity": 0.05, "color": "#2ca6c5", "weight": 2,
+                                                 "dashArray": "5, 5"}).add_to(m)
+    herramienta_dibujo().add_to(m)
+    resaltadas = set()
+    if busqueda is not None:
+        folium.Circle(location=busqueda["centro"], radius=busqueda["radio"], color="#ffffff",
+                      weight=1, fill=True, fill_opacity=0.08).add_to(m)
+        resaltadas = set(busqueda["filas"].tolist())
+
+    with medir("marcadores", puntos=len(gdf)):
+        for fila, row in gdf.iterrows():
+            color = color_dict.get(row['tipo_crimen'], "#ffffff")
+            resaltada = fila in resaltadas
+            folium.CircleMarker(
+                location=[row.geometry.y, row.geometry.x],
+                radius=7 if resaltada else 4,
+                color="#ffffff" if resaltada else color,
+                fill=True,
+                fill_color=color,
+                fill_opacity=0.85,
+                popup=popup_crimen(row)
+            ).add_to(m)
+    return m
+
+
+def imagen_calor(densidad, percentil=99.5):
+    # RGBA de la densidad: la escala de color satura en un percentil alto de las celdas con
+    # datos y las celdas casi vacías quedan transparentes
+    con_datos = densidad[densidad > 0]
+    tope = np.percentile(con_datos, percentil) if len(con_datos) else 1.0
+    nivel = np.clip(densidad / max(tope, 1e-12), 0, 1)
+    imagen = colormaps["inferno"](nivel)
+    imagen[..., 3] = np.where(nivel < 0.02, 0, 0.25 + 0.6 * np.sqrt(nivel))
+    return imagen
+
+
+def mapa_calor(kde, gdf_barrios):
+    # Pestaña 1, capa de densidad: una imagen sobre los contornos de los barrios
+    centro = centro_barrios(gdf_barrios)
+    m = folium.Map(location=centro, zoom_start=13, tiles="CartoDB dark_matter")
+    xmin, ymin, xmax, ymax = kde["limites"]
+    ImageOverlay(imagen_calor(kde["densidad"]), bounds=[[ymin, xmin], [ymax, xmax]], origin="lower",
+                 mercator_project=True, pixelated=False, name="Densidad").add_to(m)
+    folium.GeoJson(gdf_barrios, name="Barrios",
+                   style_function=lambda x: {"fillOpacity": 0, "color": "white", "weight": 1},
+                   tooltip=folium.GeoJsonTooltip(fields=["NOMBRE"], aliases=["Barrio:"])).add_to(m)
+    return m
+
+
+def mapa_hexagonos(celdas, conteos, gdf_barrios):
+    # Pestaña 1, capa de hexágonos: una sola capa GeoJSON con las celdas que tienen
+    # crímenes; las geometrías vienen ya armadas en el índice y solo cambian los conteos
+    centro = centro_barrios(gdf_barrios)
+    m = folium.Map(location=centro, zoom_start=13, tiles="CartoDB dark_matter")
+    folium.GeoJson(gdf_barrios, name="Barrios",
+                   style_function=lambda x: {"fillOpacity": 0, "color": "white", "weight": 0.5}).add_to(m)
+
+    ocupadas = np.flatnonzero(conteos)
+    if len(ocupadas):
+        # Escala logarítmica: unas pocas celdas muy cargadas no apagan al resto
+        nivel = np.log1p(conteos[ocupadas]) / np.log1p(conteos[ocupadas].max())
+        colores = [to_hex(c) for c in colormaps["YlOrRd"](0.15 + 0.85 * nivel)]
+        celdas_geojson = {"type": "FeatureCollection", "features": [
+            {"type": "Feature", "geometry": celdas["geometrias"][i],
+             "properties": {"cantidad_crimenes": int(conteos[i]), "color": color}}
+            for i, color in zip(ocupadas, colores)]}
+        folium.GeoJson(
+            celdas_geojson,
+            name="Hexágonos",
+            style_function=lambda x: {"fillColor": x["properties"]["color"], "color": "#032f45",
+                                      "weight": 0.5, "fillOpacity": 0.7},
+            tooltip=folium.GeoJsonTooltip(fields=["cantidad_crimenes"], aliases=["Crímenes:"]),
+        ).add_to(m)
+    return m
+
+
+class Animacion(MacroElement):
+    # Reproductor de los cuadros de tiempo: un solo arreglo de coordenadas ordenado por
+    # periodo y los inicios de cada cuadro; el navegador dibuja el tramo del cuadro actual
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var mapa = {{ this._parent.get_name() }};
+            var datos = {{ this.datos }};
+            var render = L.canvas();
+            var capa = L.layerGroup().addTo(mapa);
+            var control = L.control({position: "bottomleft"});
+            var actual = 0, reloj = null, boton, deslizador, etiqueta;
+            control.onAdd = function() {
+                var div = L.DomUtil.create("div");
+                div.style.cssText = "background: rgba(0, 0, 0, 0.7); color: white; padding: 8px 10px;"
+                    + "border-radius: 5px; font: 13px sans-serif;";
+                div.innerHTML = '<button style="width: 32px;">▶</button> '
+                    + '<input type="range" min="0" max="' + (datos.etiquetas.length - 1)
+                    + '" value="0" style="width: 320px; vertical-align: middle;"> <span></span>';
+                boton = div.querySelector("button");
+                deslizador = div.querySelector("input");
+                etiqueta = div.querySelector("span");
+                boton.onclick = function() { reloj ? detener() : reproducir(); };
+                deslizador.oninput = function() { detener(); mostrar(+deslizador.value); };
+                L.DomEvent.disableClickPropagation(div);
+                return div;
+            };
+            control.addTo(mapa);
+
+            function mostrar(i) {
+                actual = i;
+                capa.clearLayers();
+                var desde = datos.inicios[i], hasta = datos.inicios[i + 1];
+                for (var k = desde; k < hasta; k++) {
+                    var color = datos.colores[datos.codigos[k]] || "#ffffff";
+                    L.circleMarker([datos.lat0 + datos.y[k] / datos.escala, datos.lon0 + datos.x[k] / datos.escala],
+                                   {renderer: render, radius: 4, weight: 0, fill: true,
+                                    fillColor: color, fillOpacity: 0.85, interactive: false}).addTo(capa);
+                }
+                deslizador.value = i;
+                etiqueta.textContent = datos.etiquetas[i] + " · " + (hasta - desde) + " crímenes";
+            }
+            function reproducir() {
+                boton.textContent = "⏸";
+                reloj = setInterval(function() { mostrar((actual + 1) % datos.etiquetas.length); },
+                                    {{ this.intervalo }});
+            }
+            function detener() {
+                clearInterval(reloj);
+                reloj = null;
+                boton.textContent = "▶";
+            }
+            mostrar(0);
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, datos, intervalo=400):
+        super().__init__()
+        self._name = "Animacion"
+        self.datos = json.dumps(datos, separators=(",", ":"))
+        self.intervalo = int(intervalo)
+
+
+def datos_animacion(cuadros, x, y, codigos, categorias, color_dict, etiquetas):
+    # Carga de la animación: coordenadas enteras relativas a la esquina de los datos, el
+    # código de tipo de cada punto y los inicios de cada cuadro (sin repetir puntos)
+    filas, inicios = cuadros["filas"], cuadros["inicios"]
+    if len(filas) > MAX_PUNTOS_ANIMACION:
+        # Muestra regular: se conservan las proporciones entre cuadros
+        paso = int(np.ceil(len(filas) / MAX_PUNTOS_ANIMACION))
+        filas = filas[::paso]
+        inicios = (inicios + paso - 1) // paso
+    lon, lat = x[filas], y[filas]
+    lon0 = float(lon.min()) if len(filas) else 0.0
+    lat0 = float(lat.min()) if len(filas) else 0.0
+    return {
+        "lon0": lon0,
+        "lat0": lat0,
+        "escala": ESCALA_ANIMACION,
+        "x": np.round((lon - lon0) * ESCALA_ANIMACION).astype(np.int64).tolist(),
+        "y": np.round((lat - lat0) * ESCALA_ANIMACION).astype(np.int64).tolist(),
+        "codigos": codigos[filas].astype(np.int64).tolist(),
+        "colores": [color_dict.get(c, "#ffffff") for c in categorias],
+        "inicios": inicios.tolist(),
+        "etiquetas": list(etiquetas),
+    }
+
+
+def mapa_animado(datos, gdf_barrios, intervalo=400):
+    # Pestaña 1, animación en el tiempo sobre los contornos de los barrios
+    centro = centro_barrios(gdf_barrios)
+    m = folium.Map(location=centro, zoom_start=13, tiles="CartoDB dark_matter")
+    folium.GeoJson(gdf_barrios, name="Barrios",
+                   style_function=lambda x: {"fillOpacity": 0, "color": "white", "weight": 1}).add_to(m)
+    Animacion(datos, intervalo).add_to(m)
+    return m
+
+
+def capa_teselas(url, nombre, estilo_js):
+    # Capa de teselas vectoriales del servidor local; `estilo_js` es una función de
+    # JavaScript (propiedades, zoom) -> estilo de Leaflet para la capa "capa" de cada tesela
+    opciones = '{"vectorTileLayerStyles": {"capa": %s}, "maxNativeZoom": 18}' % estilo_js
+    return VectorGridProtobuf(url, nombre, opciones)
+
+
+def mapa_teselas_puntos(url_crimenes, url_barrios, color_dict, centro, area=None, busqueda=None):
+    # Pestaña 1 con teselas vectoriales: el navegador pide solo las teselas a la vista
+    m = folium.Map(location=centro, zoom_start=13, tiles="CartoDB dark_matter")
+    capa_teselas(url_barrios, "Barrios",
+                 'function(p, z) { return {fill: false, color: "white", weight: 1}; }').add_to(m)
+    capa_teselas(url_crimenes, "Crímenes", """function(p, z) {
+        var c = (%s)[p.categoria] || "#ffffff";
+        return {radius: z >= 15 ? 4 : 2, fill: true, fillColor: c, color: c, weight: 0, fillOpacity: 0.85};
+    }""" % json.dumps(color_dict)).add_to(m)
+    if area is not None:
+        folium.GeoJson(area.__geo_interface__, name="Área dibujada",
+                       style_function=lambda x: {"fillOpacity": 0.05, "color": "#2ca6c5", "weight": 2,
+                                                 "dashArray": "5, 5"}).add_to(m)
+    if busqueda is not None:
+        folium.Circle(location=busqueda["centro"], radius=busqueda["radio"], color="#ffffff",
+                      weight=1, fill=True, fill_opacity=0.08).add_to(m)
+    herramienta_dibujo().add_to(m)
+    return m
+
+
+def mapa_teselas_semaforo(url_semaforo, centro):
+    # Pestaña 2 con teselas vectoriales: cada barrio trae su color de semáforo
+    m = folium.Map(location=centro, zoom_start=13, tiles="CartoDB dark_matter")
+    m.get_root().html.add_child(folium.Element(LEYENDA_SEMAFORO))
+    capa_teselas(url_semaforo, "Semaforización", """function(p, z) {
+        return {fill: true, fillColor: p.color_semaforo || "#5cba47", fillOpacity: 0.6,
+                color: "white", weight: 1};
+    }""").add_to(m)
+    return m
+
+
+def mapa_semaforo(gdf_barrios_semaforo, gdf_barrios):
+    # Pestaña 2: barrios coloreados según su cantidad de crímenes
+    centro = centro_barrios(gdf_barrios)
+    m = folium.Map(location=centro, zoom_start=13, tiles="CartoDB dark_matter")
+    m.get_root().html.add_child(folium.Element(LEYENDA_SEMAFORO))
+
+    folium.GeoJson(
+        gdf_barrios_semaforo,
+        name="Semaforización",
+        style_function=lambda x: {
+            'fillColor': x['properties'].get('color_semaforo', '#5cba47'),
+            'color': 'white',
+            'weight': 1,
+            'fillOpacity': 0.6
+        },
+        tooltip=folium.GeoJsonTooltip(
+            fields=['NOMBRE', 'cantidad_crimenes'],
+            aliases=['Barrio:', 'Total crímenes:'],
+            style="background-color: white; color: #333333;"
+        )
+    ).add_to(m)
+    return m
+
+
+def html_semaforo(gdf_barrios_semaforo, gdf_barrios):
+    # Documento HTML completo del mapa de semaforización, para cachearlo ya serializado
+    return mapa_semaforo(gdf_barrios_semaforo, gdf_barrios).get_root().render()
@@ -0,0 +1,272 @@
+# Trabajo por lotes que precalcula los datos y pronósticos que la app carga al iniciar
+#
+# Uso (por ejemplo, cada noche desde cron):
+#     python precomputar.py --crimenes crimenes.geojson --barrios barrios.geojson
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from almacen import abrir_almacen, construir_almacen, guardar_almacen, materializar
+from base_sql import BASE_SQL, MOTOR, abrir_base, crear_base
+from datos import (RUTA_BARRIOS, RUTA_CRIMENES, cargar_barrios, cubo_conteos, id_serie,
+                   leer_crimenes, normalizar_crimenes, serie_filtrada, unir_barrios)
+from pronosticos import MODELOS, pronosticar
+
+DIRECTORIO_ARTEFACTOS = os.environ.get("BARRANQUILLA_ARTEFACTOS", "artefactos")
+MANIFIESTO = "manifiesto.json"
+ALMACEN = "almacen"
+CUBO = "cubo_conteos.pkl"
+# Cubos de los lotes agregados con ingesta.py, con el mismo origen que el cubo base
+INCREMENTOS_CUBO = "cubo_incrementos"
+BLOQUEO = ".bloqueo"
+
+# Mismos valores por defecto que los controles de la pestaña de predicción, para que
+# los modelos que deja este trabajo en el registro sean los que la app va a pedir
+SEMANAS_ENTRENAMIENTO = 12
+SEMANAS_PREDICCION = 4
+
+
+@contextmanager
+def bloqueo_artefactos(directorio=DIRECTORIO_ARTEFACTOS):
+    # Bloqueo exclusivo sobre los artefactos: un solo precálculo o ingesta a la vez, sean de
+    # otro proceso (cron) o de otra sesión de la app. Sin fcntl (Windows) no se bloquea.
+    os.makedirs(directorio, exist_ok=True)
+    with open(os.path.join(directorio, BLOQUEO), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def hash_archivo(ruta):
+    sha = hashlib.sha1()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def firma_archivo(ruta):
+    # Tamaño y fecha de modificación: comparar esto es instantáneo, a diferencia del hash
+    estado = os.stat(ruta)
+    return {"tamano": estado.st_size, "modificado": estado.st_mtime_ns}
+
+
+def _filtros_series(gdf):
+    # Serie de la ciudad y una por cada barrio y tipo de crimen, con los mismos filtros
+    # que arma la barra lateral para que la app encuentre estos modelos en el registro
+    yield {}
+    for columna in ("barrio", "tipo_crimen"):
+        for valor in sorted(gdf[columna].dropna().unique()):
+            yield {columna: valor}
+
+
+def precalcular_pronosticos(gdf, cubo, modelos, semanas_entrenamiento, semanas_prediccion):
+    filas = []
+    for filtros in _filtros_series(gdf):
+        serie_id = id_serie(filtros)
+        serie = serie_filtrada(cubo, filtros)
+        train = serie.tail(semanas_entrenamiento)
+        # Series casi vacías no aportan un pronóstico útil
+        if len(train) < 4 or train["y"].sum() == 0:
+            continue
+        for nombre_modelo in modelos:
+            pred_dates, pred_values = pronosticar(
+                nombre_modelo, train, semanas_prediccion, freq="W", serie=serie_id)
+            filas.append(pd.DataFrame({
+                "serie": serie_id,
+                "modelo": nombre_modelo,
+                "ds": pd.to_datetime(pred_dates).to_numpy(),
+                "yhat": pd.Series(pred_values).to_numpy(),
+            }))
+    if not filas:
+        return pd.DataFrame(columns=["serie", "modelo", "ds", "yhat"])
+    return pd.concat(filas, ignore_index=True)
+
+
+def leer_manifiesto(directorio):
+    try:
+        with open(os.path.join(directorio, MANIFIESTO), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def filas_ingeridas(directorio, manifiesto):
+    # Crímenes que agregó ingesta.py: van al final del almacén, después de los del archivo
+    almacen = abrir_almacen(os.path.join(directorio, ALMACEN))
+    if manifiesto is None or almacen is None:
+        return None
+    ingestas = manifiesto.get("ingestas", [])
+    origen = manifiesto.get("filas_origen", manifiesto.get("filas", 0) - sum(i["nuevos"] for i in ingestas))
+    if origen >= almacen["n"]:
+        return None
+    gdf = materializar(almacen, np.arange(origen, almacen["n"])).reset_index(drop=True)
+    if "hora_h" in gdf.columns:
+        # Las horas faltantes de filas agregadas se guardan como -1
+        gdf["hora_h"] = gdf["hora_h"].where(gdf["hora_h"] >= 0)
+    return gdf
+
+
+def _sin_repetidos(gdf, ingeridos):
+    # Si el archivo ya trae crímenes de un lote (p. ej. se incorporaron a mano), no se duplican
+    columnas = [c for c in ("id", "fecha_dt", "hora_h", "tipo_crimen") if c in gdf.columns and c in ingeridos.columns]
+
+    def claves(df):
+        # Coordenadas redondeadas a ~1 cm: el GeoJSON no siempre conserva todos los decimales
+        claves = pd.DataFrame({"x": df.geometry.x.round(7).to_numpy(), "y": df.geometry.y.round(7).to_numpy()})
+        for columna in columnas:
+            claves[columna] = df[columna].to_numpy()
+        for columna in ("id", "hora_h"):
+            if columna in claves:
+                claves[columna] = pd.to_numeric(claves[columna], errors="coerce").astype(np.float64)
+        return claves
+
+    union = claves(ingeridos).merge(claves(gdf).drop_duplicates(), how="left", indicator=True)
+    return ingeridos[(union["_merge"] == "left_only").to_numpy()]
+
+
+def precalcular(ruta_crimenes, ruta_barrios, directorio, modelos,
+                semanas_entrenamiento=SEMANAS_ENTRENAMIENTO, semanas_prediccion=SEMANAS_PREDICCION,
+                sql=False, conservar_ingestas=True):
+    with bloqueo_artefactos(directorio):
+        return _precalcular(ruta_crimenes, ruta_barrios, directorio, modelos, semanas_entrenamiento,
+                            semanas_prediccion, sql, conservar_ingestas)
+
+
+def _precalcular(ruta_crimenes, ruta_barrios, directorio, modelos, semanas_entrenamiento,
+                 semanas_prediccion, sql, conservar_ingestas):
+    inicio = time.time()
+
+    gdf_barrios = cargar_barrios(ruta_barrios)
+    gdf = normalizar_crimenes(leer_crimenes(ruta_crimenes))
+    gdf = unir_barrios(gdf, gdf_barrios)
+    filas_origen = len(gdf)
+
+    # Los lotes ingeridos solo viven en el almacén: se leen antes de reemplazarlo y se
+    # vuelven a agregar al final, para que la reconstrucción nocturna no los pierda
+    anterior = leer_manifiesto(directorio) if conservar_ingestas else None
+    ingeridos = filas_ingeridas(directorio, anterior)
+    if ingeridos is not None:
+        ingeridos = _sin_repetidos(gdf, ingeridos.to_crs(gdf.crs))
+        gdf = pd.concat([gdf, ingeridos[[c for c in ingeridos.columns if c in gdf.columns]]],
+                        ignore_index=True)
+
+    guardar_almacen(construir_almacen(gdf), os.path.join(directorio, ALMACEN))
+    # Base SQL opcional para filtrar y contar dentro de la base, con los mismos números de fila
+    ruta_sql = os.path.join(directorio, BASE_SQL)
+    if sql:
+        crear_base(gdf, ruta_sql)
+    elif os.path.exists(ruta_sql):
+        os.remove(ruta_sql)
+    cubo = cubo_conteos(gdf)
+    cubo.to_pickle(os.path.join(directorio, CUBO))
+    shutil.rmtree(os.path.join(directorio, INCREMENTOS_CUBO), ignore_errors=True)
+
+    # Los pronósticos no se guardan aparte: ajustar los modelos deja el registro listo y la
+    # app los sirve desde ahí (los agregados los calcula del cubo y del almacén)
+    series = []
+    if modelos:
+        pronosticos = precalcular_pronosticos(gdf, cubo, modelos, semanas_entrenamiento, semanas_prediccion)
+        series = sorted(pronosticos["serie"].unique())
+
+    # El manifiesto se escribe al final: si existe, los artefactos están completos
+    manifiesto = {
+        "generado": time.time(),
+        "crimenes": os.path.abspath(ruta_crimenes),
+        "hash_crimenes": hash_archivo(ruta_crimenes),
+        "firma_crimenes": firma_archivo(ruta_crimenes),
+        "filas": len(gdf),
+        "filas_origen": filas_origen,
+        "ingestas": anterior.get("ingestas", []) if ingeridos is not None else [],
+        "modelos": modelos,
+        "semanas_entrenamiento": semanas_entrenamiento,
+        "semanas_prediccion": semanas_prediccion,
+        "series_pronosticadas": len(series),
+        "base_sql": MOTOR if sql else None,
+        "duracion_s": round(time.time() - inicio, 2),
+    }
+    with open(os.path.join(directorio, MANIFIESTO), "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=2)
+    return manifiesto
+
+
+def cargar_cubo(directorio=DIRECTORIO_ARTEFACTOS):
+    # Cubo base más los incrementos de las ingestas (las filas repetidas se suman al usarlo)
+    cubo = pd.read_pickle(os.path.join(directorio, CUBO))
+    carpeta = os.path.join(directorio, INCREMENTOS_CUBO)
+    if not os.path.isdir(carpeta):
+        return cubo
+    partes = [pd.read_pickle(os.path.join(carpeta, a)) for a in sorted(os.listdir(carpeta)) if a.endswith(".pkl")]
+    if not partes:
+        return cubo
+    total = pd.concat([cubo] + partes, ignore_index=True)
+    total.attrs["origen"] = cubo.attrs["origen"]
+    total.attrs["n_horas"] = max(p.attrs["n_horas"] for p in [cubo] + partes)
+    return total
+
+
+def cargar_artefactos(ruta_crimenes=RUTA_CRIMENES, directorio=DIRECTORIO_ARTEFACTOS):
+    # Devuelve los artefactos si existen y corresponden al archivo de crímenes actual
+    manifiesto = leer_manifiesto(directorio)
+    if manifiesto is None:
+        return None
+    # El hash del archivo lo calcula una sola vez el trabajo por lotes; al abrir basta con
+    # la firma. Solo si la firma cambió (p. ej. el archivo se copió) se vuelve a leer entero.
+    try:
+        misma_firma = manifiesto.get("firma_crimenes") == firma_archivo(ruta_crimenes)
+    except OSError:
+        return None
+    if not misma_firma and manifiesto.get("hash_crimenes") != hash_archivo(ruta_crimenes):
+        return None
+
+    # El almacén de crímenes se mapea en memoria: no se lee completo al abrirlo
+    almacen = abrir_almacen(os.path.join(directorio, ALMACEN))
+    if almacen is None:
+        return None
+    return {
+        "manifiesto": manifiesto,
+        "almacen": almacen,
+        "cubo_conteos": cargar_cubo(directorio),
+        "base_sql": (abrir_base(os.path.join(directorio, BASE_SQL), almacen["n"])
+                     if manifiesto.get("base_sql") == MOTOR else None),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Precalcula el almacén, el cubo de conteos y los modelos de pronóstico para la app.")
+    parser.add_argument("--crimenes", default=RUTA_CRIMENES, help="Archivo de crímenes (.geojson o .csv)")
+    parser.add_argument("--barrios", default=RUTA_BARRIOS, help="Archivo de barrios (.geojson)")
+    parser.add_argument("--salida", default=DIRECTORIO_ARTEFACTOS, help="Directorio de artefactos")
+    parser.add_argument("--modelos", nargs="*", default=MODELOS, choices=MODELOS,
+                        help="Modelos a ajustar por serie (vacío para omitir pronósticos)")
+    parser.add_argument("--semanas-entrenamiento", type=int, default=SEMANAS_ENTRENAMIENTO)
+    parser.add_argument("--semanas-prediccion", type=int, default=SEMANAS_PREDICCION)
+    parser.add_argument("--sql", action="store_true",
+                        help=f"Crea también la base embebida ({MOTOR}) para filtrar con SQL")
+    parser.add_argument("--descartar-ingestas", action="store_true",
+                        help="No conserva los lotes agregados con ingesta.py desde el último precálculo")
+    args = parser.parse_args(argv)
+
+    manifiesto = precalcular(args.crimenes, args.barrios, args.salida, args.modelos,
+                             args.semanas_entrenamiento, args.semanas_prediccion, args.sql,
+                             not args.descartar_ingestas)
+    print(f"{manifiesto['filas']} crímenes procesados en {manifiesto['duracion_s']} s -> {args.salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
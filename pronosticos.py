@@ -0,0 +1,273 @@
+# Ajuste y predicción de los modelos de la pestaña de predicción
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from instrumentacion import medir
+from registro_modelos import cargar_modelo, clave_modelo, guardar_modelo, hash_datos, ultimo_modelo
+
+MODELOS = ["Prophet", "Regresión lineal", "Árbol de decisión"]
+
+
+def _importar_prophet():
+    try:
+        from prophet import Prophet
+    except ImportError:
+        from fbprophet import Prophet
+    return Prophet
+
+
+def parametros_iniciales(model):
+    # Parámetros ajustados de un Prophet previo en el formato que espera `fit(init=...)`
+    if model.mcmc_samples == 0:
+        escalares = {p: float(model.params[p][0][0]) for p in ("k", "m", "sigma_obs")}
+        vectores = {p: model.params[p][0] for p in ("delta", "beta")}
+    else:
+        escalares = {p: float(np.mean(model.params[p])) for p in ("k", "m", "sigma_obs")}
+        vectores = {p: np.mean(model.params[p], axis=0) for p in ("delta", "beta")}
+    return dict(escalares, **vectores)
+
+
+def ajustar_prophet(train, modelo_previo=None):
+    # Devuelve (modelo, si se usó arranque en caliente)
+    Prophet = _importar_prophet()
+    if modelo_previo is not None:
+        # Arranque en caliente: la optimización de Stan parte de los parámetros previos
+        try:
+            model = Prophet()
+            model.fit(train, init=parametros_iniciales(modelo_previo))
+            return model, True
+        except Exception:
+            # Dimensiones incompatibles (otros puntos de cambio o estacionalidades)
+            pass
+    model = Prophet()
+    model.fit(train)
+    return model, False
+
+
+def _ajustar(nombre_modelo, train):
+    if nombre_modelo == "Prophet":
+        return ajustar_prophet(train)[0]
+
+    if nombre_modelo == "Regresión lineal":
+        from sklearn.linear_model import LinearRegression
+        model = LinearRegression()
+    elif nombre_modelo == "Árbol de decisión":
+        from sklearn.tree import DecisionTreeRegressor
+        model = DecisionTreeRegressor()
+    else:
+        raise ValueError(f"Modelo desconocido: {nombre_modelo}")
+
+    # Los modelos de sklearn usan el número de periodo como única variable
+    X_train = np.arange(len(train)).reshape(-1, 1)
+    model.fit(X_train, train["y"].to_numpy())
+    return model
+
+
+def _ajuste_en_muestra(nombre_modelo, model, train):
+    if nombre_modelo == "Prophet":
+        return model.predict(train[["ds"]])["yhat"].to_numpy()
+    return model.predict(np.arange(len(train)).reshape(-1, 1))
+
+
+def _metricas(nombre_modelo, model, train):
+    errores = train["y"].to_numpy() - _ajuste_en_muestra(nombre_modelo, model, train)
+    return {
+        "mae": float(np.mean(np.abs(errores))),
+        "rmse": float(np.sqrt(np.mean(errores ** 2))),
+    }
+
+
+def _canonico(train):
+    # Los tipos se fijan antes del hash para que la misma serie leída de CSV o calculada coincida
+    return pd.DataFrame({
+        "ds": pd.to_datetime(train["ds"]).astype("datetime64[ns]").to_numpy(),
+        "y": train["y"].astype("float64").to_numpy(),
+    })
+
+
+def clave_ajuste(nombre_modelo, train, serie="ciudad"):
+    return clave_modelo(nombre_modelo, serie, hash_datos(_canonico(train)))
+
+
+def ajustar_modelo(nombre_modelo, train, serie="ciudad"):
+    # Reutiliza el modelo del registro si ya se ajustó con exactamente estos datos
+    train = _canonico(train)
+    huella = hash_datos(train)
+    clave = clave_modelo(nombre_modelo, serie, huella)
+
+    registro = cargar_modelo(clave)
+    if registro is not None:
+        return registro[0]
+
+    # Si la serie ya tenía un Prophet con la misma ventana (p. ej. antes de llegar la última
+    # semana de datos), el reajuste arranca desde sus parámetros en vez de en frío
+    modelo_previo = None
+    if nombre_modelo == "Prophet":
+        previo = ultimo_modelo(serie, nombre_modelo,
+                               filtro=lambda m: m.get("ventana", {}).get("periodos") == len(train))
+        if previo is not None:
+            modelo_previo = previo[0]
+
+    inicio = time.perf_counter()
+    en_caliente = False
+    with medir("ajuste_modelo", modelo=nombre_modelo):
+        if modelo_previo is not None:
+            model, en_caliente = ajustar_prophet(train, modelo_previo)
+        else:
+            model = _ajustar(nombre_modelo, train)
+    segundos_ajuste = time.perf_counter() - inicio
+
+    guardar_modelo(clave, model, {
+        "modelo": nombre_modelo,
+        "serie": serie,
+        "hash_datos": huella,
+        "arranque": "caliente" if en_caliente else "frio",
+        "segundos_ajuste": round(segundos_ajuste, 4),
+        "ventana": {
+            "inicio": str(train["ds"].iloc[0]),
+            "fin": str(train["ds"].iloc[-1]),
+            "periodos": len(train),
+        },
+        "metricas": _metricas(nombre_modelo, model, train),
+    })
+    return model
+
+
+def _sin_muestras(model):
+    # Copia superficial con `uncertainty_samples` = 0, para que `predict` omita la simulación
+    # de intervalos sin tocar el modelo cacheado, que comparten los hilos de las sesiones
+    copia = copy.copy(model)
+    copia.uncertainty_samples = 0
+    return copia
+
+
+def predecir(nombre_modelo, model, train, periodos, freq="W"):
+    if nombre_modelo == "Prophet":
+        future = model.make_future_dataframe(periods=periodos, freq=freq)
+        # Solo se usa yhat: se omite la simulación de intervalos
+        forecast = _sin_muestras(model).predict(future)
+        return forecast["ds"], forecast["yhat"]
+
+    X_future = np.arange(len(train), len(train) + periodos).reshape(-1, 1)
+    pred_values = model.predict(X_future)
+    pred_dates = pd.date_range(start=train["ds"].iloc[-1], periods=periodos + 1, freq=freq)[1:]
+    return pred_dates, pred_values
+
+
+def pronosticar(nombre_modelo, train, periodos, freq="W", serie="ciudad"):
+    model = ajustar_modelo(nombre_modelo, train, serie=serie)
+    return predecir(nombre_modelo, model, train, periodos, freq=freq)
+
+
+# --- PRONÓSTICOS POR CUANTILES ---
+CUANTILES_DEFECTO = (0.1, 0.5, 0.9)
+MUESTRAS_DEFECTO = 300
+MAX_BANDAS_EN_MEMORIA = 256
+
+# Bandas ya calculadas por ajuste (clave del modelo, cuantiles, muestras, horizonte); las
+# sesiones de Streamlit lo comparten desde hilos distintos
+_bandas_en_memoria = OrderedDict()
+_candado_bandas = threading.Lock()
+
+
+def columna_cuantil(q):
+    # Nombre de la columna de un cuantil en las bandas (0.1 -> "q10")
+    return f"q{round(q * 100):02d}"
+
+
+def _muestras_predictivas(model, future, n_muestras, rng):
+    # Lo mismo que Prophet.predictive_samples para un ajuste MAP con tendencia lineal (como
+    # los de ajustar_prophet), pero con un generador propio: Prophet sortea con el estado
+    # global de numpy, que comparten los hilos de las sesiones. Devuelve (periodos, muestras).
+    df = model.setup_dataframe(future.copy())
+    estacionales, _, componentes, _ = model.make_all_seasonality_features(df)
+    beta = model.params["beta"][0]
+    aditivo = estacionales.to_numpy() @ (beta * componentes["additive_terms"].to_numpy()) * model.y_scale
+    multiplicativo = estacionales.to_numpy() @ (beta * componentes["multiplicative_terms"].to_numpy())
+
+    delta = model.params["delta"][0]
+    t = df["t"].to_numpy()
+    esperada = model.piecewise_linear(t, delta, model.params["k"][0], model.params["m"][0],
+                                      model.changepoints_t)
+    # Cambios de pendiente futuros con la frecuencia y el tamaño medio de los del ajuste
+    futuros = t > 1
+    n_futuros = int(futuros.sum())
+    incertidumbre = np.zeros((n_muestras, len(t)))
+    if n_futuros:
+        paso = np.diff(t[futuros]).mean() if n_futuros > 1 else np.diff(model.history["t"]).mean()
+        probabilidad = len(model.changepoints_t) * paso
+        tamano = np.mean(np.abs(delta)) + 1e-8
+        cambios = (rng.uniform(size=(n_muestras, n_futuros)) < probabilidad) \
+            * rng.laplace(0, tamano, size=(n_muestras, n_futuros))
+        cambios = (cambios + np.hstack([np.zeros((n_muestras, 1)), cambios[:, :-1]])) / 2
+        incertidumbre[:, futuros] = cambios.cumsum(axis=1).cumsum(axis=1) * paso
+
+    tendencia = (esperada + incertidumbre) * model.y_scale + df["floor"].to_numpy()
+    ruido = rng.normal(0, np.ravel(model.params["sigma_obs"][0])[0], tendencia.shape) * model.y_scale
+    return (tendencia * (1 + multiplicativo) + aditivo + ruido).T
+
+
+def _cuantiles_prophet(model, periodos, freq, cuantiles, n_muestras, semilla):
+    # Muestras de la distribución predictiva, generadas de forma vectorizada
+    future = model.make_future_dataframe(periods=periodos, freq=freq, include_history=False)
+    muestras = _muestras_predictivas(model, future, n_muestras, np.random.default_rng(semilla))
+    return future["ds"], np.quantile(muestras, cuantiles, axis=1)
+
+
+def _cuantiles_regresion(nombre_modelo, train, periodos, freq, cuantiles, semilla):
+    # Un modelo de regresión cuantílica por cuantil, con el periodo como variable
+    if nombre_modelo == "Regresión lineal":
+        from sklearn.linear_model import QuantileRegressor
+
+        def crear(q):
+            return QuantileRegressor(quantile=q, alpha=0.0, solver="highs")
+    else:
+        from sklearn.ensemble import GradientBoostingRegressor
+
+        def crear(q):
+            return GradientBoostingRegressor(loss="quantile", alpha=q, max_depth=2,
+                                             n_estimators=100, random_state=semilla)
+
+    X_train = np.arange(len(train)).reshape(-1, 1)
+    X_future = np.arange(len(train), len(train) + periodos).reshape(-1, 1)
+    valores = np.vstack([crear(q).fit(X_train, train["y"].to_numpy()).predict(X_future)
+                         for q in cuantiles])
+    fechas = pd.date_range(start=train["ds"].iloc[-1], periods=periodos + 1, freq=freq)[1:]
+    return fechas, valores
+
+
+def pronosticar_cuantiles(nombre_modelo, train, periodos, freq="W", serie="ciudad",
+                          cuantiles=CUANTILES_DEFECTO, n_muestras=MUESTRAS_DEFECTO, semilla=0):
+    # Tabla con ds y una columna por cuantil (p. ej. q10, q50, q90) para los periodos futuros
+    cuantiles = tuple(sorted(cuantiles))
+    clave = (clave_ajuste(nombre_modelo, train, serie), cuantiles,
+             n_muestras if nombre_modelo == "Prophet" else None, periodos, freq, semilla)
+    with _candado_bandas:
+        bandas = _bandas_en_memoria.get(clave)
+        if bandas is not None:
+            _bandas_en_memoria.move_to_end(clave)
+    if bandas is not None:
+        return bandas
+
+    if nombre_modelo == "Prophet":
+        model = ajustar_modelo(nombre_modelo, train, serie=serie)
+        fechas, valores = _cuantiles_prophet(model, periodos, freq, cuantiles, n_muestras, semilla)
+    else:
+        fechas, valores = _cuantiles_regresion(nombre_modelo, _canonico(train), periodos, freq,
+                                               cuantiles, semilla)
+
+    bandas = pd.DataFrame({"ds": pd.to_datetime(fechas).to_numpy()})
+    for q, fila in zip(cuantiles, valores):
+        bandas[columna_cuantil(q)] = fila
+
+    with _candado_bandas:
+        _bandas_en_memoria[clave] = bandas
+        _bandas_en_memoria.move_to_end(clave)
+        if len(_bandas_en_memoria) > MAX_BANDAS_EN_MEMORIA:
+            _bandas_en_memoria.popitem(last=False)
+    return bandas
@@ -0,0 +1,266 @@
+# Registro en disco de modelos ajustados para que los pronósticos sobrevivan reinicios
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import joblib
+import pandas as pd
+
+# --- CONFIGURACIÓN DEL REGISTRO ---
+DIRECTORIO_MODELOS = os.environ.get("BARRANQUILLA_MODELOS", "modelos")
+MAX_EDAD_DIAS = 30
+MAX_BYTES = 200 * 1024 * 1024
+MAX_MODELOS_EN_MEMORIA = 128
+# Por serie y tipo de modelo, la metadata de sus modelos guardados (para ultimo_modelo)
+INDICE_SERIES = "series"
+
+# Modelos ya deserializados en este proceso (clave -> (modelo, metadata)), del menos al más
+# recientemente usado; las sesiones de Streamlit lo comparten desde hilos distintos
+_en_memoria = OrderedDict()
+_candado = threading.Lock()
+
+
+def hash_datos(df):
+    # Huella estable del contenido (no del índice) de los datos de entrenamiento
+    valores = pd.util.hash_pandas_object(df, index=False).values
+    return hashlib.sha1(valores.tobytes()).hexdigest()
+
+
+def clave_modelo(nombre_modelo, serie, hash_df, **parametros):
+    contenido = json.dumps({
+        "modelo": nombre_modelo,
+        "serie": serie,
+        "datos": hash_df,
+        "parametros": parametros,
+    }, sort_keys=True, default=str)
+    return hashlib.sha1(contenido.encode("utf-8")).hexdigest()[:24]
+
+
+def _rutas(clave, directorio):
+    base = os.path.join(directorio, clave)
+    return base + ".json", base + ".modelo"
+
+
+def _escribir_atomico(ruta, escribir):
+    # Se escribe en un temporal y se renombra para no dejar archivos a medias
+    temporal = ruta + ".tmp"
+    escribir(temporal)
+    os.replace(temporal, ruta)
+
+
+def _recordar(clave, registro):
+    with _candado:
+        _en_memoria[clave] = registro
+        _en_memoria.move_to_end(clave)
+        if len(_en_memoria) > MAX_MODELOS_EN_MEMORIA:
+            _en_memoria.popitem(last=False)
+
+
+def _marcar_uso(ruta_modelo):
+    # La fecha de modificación sirve como "último uso" para la política de desalojo
+    try:
+        os.utime(ruta_modelo)
+    except OSError:
+        pass
+
+
+def _ruta_indice_serie(serie, nombre_modelo, directorio):
+    nombre = hashlib.sha1(json.dumps([serie, nombre_modelo]).encode("utf-8")).hexdigest()[:24]
+    return os.path.join(directorio, INDICE_SERIES, nombre + ".json")
+
+
+def _leer_indice_serie(ruta):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _indexar(metadata, directorio):
+    # Agrega el modelo al índice de su serie; las entradas de modelos ya borrados se
+    # descartan aquí. Si dos procesos escriben a la vez puede perderse una entrada: el
+    # índice solo sirve para el arranque en caliente, que en el peor caso arranca en frío.
+    ruta = _ruta_indice_serie(metadata.get("serie"), metadata.get("modelo"), directorio)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    entradas = [m for m in _leer_indice_serie(ruta)
+                if m.get("clave") != metadata["clave"]
+                and os.path.exists(_rutas(m.get("clave", ""), directorio)[1])]
+
+    def escribir(ruta_temporal):
+        with open(ruta_temporal, "w", encoding="utf-8") as f:
+            json.dump(entradas + [metadata], f, ensure_ascii=False, default=str)
+
+    _escribir_atomico(ruta, escribir)
+
+
+def _es_prophet(modelo):
+    return type(modelo).__name__ == "Prophet"
+
+
+def guardar_modelo(clave, modelo, metadata, directorio=None):
+    directorio = directorio or DIRECTORIO_MODELOS
+    os.makedirs(directorio, exist_ok=True)
+    ruta_meta, ruta_modelo = _rutas(clave, directorio)
+
+    if _es_prophet(modelo):
+        from prophet.serialize import model_to_json
+
+        formato = "prophet"
+        contenido = model_to_json(modelo)
+
+        def escribir(ruta):
+            with open(ruta, "w", encoding="utf-8") as f:
+                f.write(contenido)
+    else:
+        formato = "joblib"
+
+        def escribir(ruta):
+            joblib.dump(modelo, ruta)
+
+    _escribir_atomico(ruta_modelo, escribir)
+
+    metadata = dict(metadata, clave=clave, formato=formato, creado=time.time())
+
+    def escribir_meta(ruta):
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False, default=str)
+
+    _escribir_atomico(ruta_meta, escribir_meta)
+    _indexar(metadata, directorio)
+    _recordar(clave, (modelo, metadata))
+
+    purgar_registro(directorio)
+    return metadata
+
+
+def leer_metadata(clave, directorio=None):
+    ruta_meta, _ = _rutas(clave, directorio or DIRECTORIO_MODELOS)
+    try:
+        with open(ruta_meta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def cargar_modelo(clave, directorio=None):
+    # Devuelve (modelo, metadata) o None; el archivo solo se lee la primera vez que se pide
+    directorio = directorio or DIRECTORIO_MODELOS
+    _, ruta_modelo = _rutas(clave, directorio)
+    with _candado:
+        registro = _en_memoria.get(clave)
+        if registro is not None:
+            _en_memoria.move_to_end(clave)
+    if registro is not None:
+        # También los usos desde memoria cuentan para la política de desalojo en disco
+        _marcar_uso(ruta_modelo)
+        return registro
+
+    metadata = leer_metadata(clave, directorio)
+    if metadata is None:
+        return None
+
+    try:
+        if metadata.get("formato") == "prophet":
+            from prophet.serialize import model_from_json
+
+            with open(ruta_modelo, encoding="utf-8") as f:
+                modelo = model_from_json(f.read())
+        else:
+            modelo = joblib.load(ruta_modelo)
+    except Exception:
+        # Entrada corrupta o de una versión incompatible: se descarta y se reajusta
+        eliminar_modelo(clave, directorio)
+        return None
+
+    _marcar_uso(ruta_modelo)
+    _recordar(clave, (modelo, metadata))
+    return modelo, metadata
+
+
+def eliminar_modelo(clave, directorio=None):
+    with _candado:
+        _en_memoria.pop(clave, None)
+    for ruta in _rutas(clave, directorio or DIRECTORIO_MODELOS):
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+
+def listar_modelos(directorio=None):
+    # Solo lee los metadatos, nunca deserializa modelos
+    directorio = directorio or DIRECTORIO_MODELOS
+    if not os.path.isdir(directorio):
+        return []
+    entradas = []
+    for nombre in os.listdir(directorio):
+        if nombre.endswith(".json"):
+            metadata = leer_metadata(nombre[:-len(".json")], directorio)
+            if metadata is not None:
+                entradas.append(metadata)
+    return entradas
+
+
+def ultimo_modelo(serie, nombre_modelo, directorio=None, filtro=None):
+    # Modelo más reciente de la misma serie y tipo, p. ej. para arrancar un reajuste desde él.
+    # Solo se lee el índice de la serie, no la metadata de todo el registro.
+    directorio = directorio or DIRECTORIO_MODELOS
+    candidatos = [
+        m for m in _leer_indice_serie(_ruta_indice_serie(serie, nombre_modelo, directorio))
+        if filtro is None or filtro(m)
+    ]
+    # Los modelos del índice pueden haber sido desalojados: se prueba del más reciente atrás
+    for metadata in sorted(candidatos, key=lambda m: m.get("creado", 0), reverse=True):
+        registro = cargar_modelo(metadata["clave"], directorio)
+        if registro is not None:
+            return registro
+    return None
+
+
+def purgar_registro(directorio=None, max_edad_dias=MAX_EDAD_DIAS, max_bytes=MAX_BYTES):
+    directorio = directorio or DIRECTORIO_MODELOS
+    if not os.path.isdir(directorio):
+        return []
+
+    entradas = []
+    for nombre in os.listdir(directorio):
+        if not nombre.endswith(".modelo"):
+            continue
+        clave = nombre[:-len(".modelo")]
+        ruta_meta, ruta_modelo = _rutas(clave, directorio)
+        try:
+            tamano = os.path.getsize(ruta_modelo)
+            if os.path.exists(ruta_meta):
+                tamano += os.path.getsize(ruta_meta)
+            usado = os.path.getmtime(ruta_modelo)
+        except OSError:
+            continue
+        entradas.append((usado, tamano, clave))
+
+    eliminados = []
+    limite_edad = time.time() - max_edad_dias * 86400
+    entradas.sort()
+
+    # Primero por antigüedad...
+    vigentes = []
+    for usado, tamano, clave in entradas:
+        if usado < limite_edad:
+            eliminar_modelo(clave, directorio)
+            eliminados.append(clave)
+        else:
+            vigentes.append((usado, tamano, clave))
+
+    # ...y luego los menos usados recientemente hasta caber en el tamaño máximo
+    total = sum(tamano for _, tamano, _ in vigentes)
+    for usado, tamano, clave in vigentes:
+        if total <= max_bytes:
+            break
+        eliminar_modelo(clave, directorio)
+        eliminados.append(clave)
+        total -= tamano
+
+    return eliminados
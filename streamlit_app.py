@@ -1,19 +1,46 @@
 # Versión actualizada de streamlit_app.py con semaforización
-from prophet import Prophet
+import hashlib
+import json
+import os
+
 import streamlit as st
-import geopandas as gpd
+import streamlit.components.v1 as components
+import numpy as np
 import pandas as pd
-import folium
 from streamlit_folium import st_folium
 import matplotlib.pyplot as plt
-from matplotlib.colors import ListedColormap, to_hex
-from datetime import datetime
 import plotly.graph_objects as go
 
+from datos import (GRANULARIDADES, RUTA_CRIMENES, cargar_barrios, con_geometria, conteos_horarios,
+                   cubo_conteos, id_serie, leer_crimenes, leer_tabla, normalizar_crimenes, remuestrear,
+                   semana_hora, unir_barrios)
+from almacen import (categorias, conteo_barrios, conteo_semana_hora, construir_almacen, cuadros_tiempo,
+                     materializar, rango_fechas, seleccionar, tabla, valores_presentes)
+from precomputar import DIRECTORIO_ARTEFACTOS, MANIFIESTO, cargar_artefactos
+from base_sql import ERRORES_BASE, conteo_barrios_sql, seleccionar_sql
+from espacial import (ANCHO_BANDA_M, TAMANOS_HEX, ampliar, area_dibujada, construir_arbol, construir_rejilla,
+                      conteo_hex, contiene, densidad_kde, filas_en_area, filas_en_limites, filas_en_radio,
+                      indice_hex, limites_datos, limites_mapa)
+from ingesta import ingerir
+from validacion import validar
+from jerarquia import METODOS_BASE, pronostico_jerarquico
+from mapas import (MAX_PUNTOS_ANIMACION, centro_barrios, clave_semaforo, colores_por_tipo, datos_animacion,
+                   html_semaforo, mapa_animado, mapa_calor, mapa_hexagonos, mapa_puntos, mapa_teselas_puntos,
+                   mapa_teselas_semaforo, semaforizar_conteos)
+from teselas import DISPONIBLE as TESELAS_DISPONIBLES
+from teselas import iniciar_servidor, registrar_poligonos, registrar_puntos, url_capa
+from instrumentacion import finalizar_traza, iniciar_traza, medido, medir
+from pronosticos import MODELOS, MUESTRAS_DEFECTO, columna_cuantil, pronosticar, pronosticar_cuantiles
+
 # --- CONFIGURACIÓN GLOBAL ---
 custom_palette = ["#98cfe0", "#2ca6c5", "#032f45", "#f8b909", "#f38e1a"]
 custom_font = "'Segoe UI', sans-serif"
 
+# Por granularidad: (periodos de entrenamiento por defecto, máximo a predecir, a predecir por defecto)
+UNIDADES_GRANULARIDAD = {"Semanal": "Semanas", "Diaria": "Días", "Horaria": "Horas"}
+PERIODOS_GRANULARIDAD = {"Semanal": (12, 12, 4), "Diaria": (60, 30, 7), "Horaria": (24 * 14, 72, 24)}
+DIAS_SEMANA = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+
 st.set_page_config(layout="wide", page_title="Crímenes en Barranquilla")
 st.markdown(f"""
     <style>
@@ -53,6 +80,17 @@ st.markdown(f"""
 
 st.title(" Mapa Interactivo de Crímenes en Barranquilla")
 
+# --- INSTRUMENTACIÓN ---
+def sesion_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+# Cada rerun abre una traza; las etapas se miden con `medir`/`medido` y al final del
+# script la traza se agrega a trazas.jsonl y, si se pide, se muestra en la barra lateral
+iniciar_traza(sesion_id())
+
 #   Esto es para mostrar en otra tab la semaforización 
 tab1, tab2, tab3 = st.tabs(["Mapa de Puntos", "Semaforización de Barrios", "Predicción de Crímenes"])
 
@@ -61,26 +99,99 @@ archivo = st.sidebar.file_uploader(
     "Sube tu archivo de crímenes (.geojson o .csv)", type=["geojson", "csv"])
 
 
-@st.cache_data
+# Los datos de crímenes y barrios se guardan una sola vez por proceso con cache_resource
+# (cache_data devolvería una copia a cada sesión). Son de solo lectura: los arreglos del
+# almacén no se pueden escribir y los GeoDataFrames nunca se modifican en el lugar.
+@st.cache_resource
 def cargar_datos():
-    gdf_barrios = gpd.read_file("barrios.geojson")
+    gdf_barrios = cargar_barrios()
     return gdf_barrios
 
 
-gdf_barrios = cargar_datos()
+@st.cache_resource
+def cargar_crimenes_base(marca_artefactos):
+    # Usa el resultado de precomputar.py si corresponde al archivo actual; con
+    # `precomputar.py --sql` los filtros y conteos se resuelven en la base embebida
+    artefactos = cargar_artefactos()
+    if artefactos is not None:
+        return artefactos["almacen"], artefactos["cubo_conteos"], artefactos["base_sql"]
+    gdf_base = normalizar_crimenes(leer_crimenes(RUTA_CRIMENES))
+    return construir_almacen(gdf_base), cubo_conteos(gdf_base), None
+
+
+@st.cache_resource(max_entries=8)
+def cargar_crimenes_subida(_archivo, origen, tipos_validos):
+    # Un archivo subido se lee y valida una vez por archivo, no en cada cambio de filtro.
+    # Las filas con errores se descartan; el informe se muestra en la barra lateral.
+    tabla_subida = leer_tabla(_archivo)
+    informe, validas = validar(tabla_subida, tipos_validos)
+    if not validas.any():
+        return None, None, informe
+    # Como en precomputar.py: el barrio sale del polígono que contiene cada crimen
+    gdf_subida = normalizar_crimenes(unir_barrios(con_geometria(tabla_subida[validas]), cargar_datos()))
+    return construir_almacen(gdf_subida), cubo_conteos(gdf_subida), informe
+
+
+@st.cache_data
+def pronostico_jerarquico_cacheado(_cubo, origen, clave_filtros, periodos_entrenamiento,
+                                   periodos_prediccion, metodo, granularidad):
+    return pronostico_jerarquico(_cubo, json.loads(clave_filtros), cargar_datos(),
+                                 periodos_entrenamiento, periodos_prediccion, metodo=metodo,
+                                 granularidad=granularidad)
+
+
+@st.cache_data
+def conteos_horarios_cacheado(_cubo, origen, clave_filtros):
+    # Un vector horario por origen de datos y conjunto de filtros
+    return conteos_horarios(_cubo, json.loads(clave_filtros))
+
+
+def marca_artefactos():
+    # Cambia cada vez que el trabajo por lotes vuelve a escribir los artefactos
+    try:
+        return os.path.getmtime(os.path.join(DIRECTORIO_ARTEFACTOS, MANIFIESTO))
+    except OSError:
+        return None
 
+
+with medir("carga_datos"):
+    gdf_barrios = cargar_datos()
+    almacen_base, cubo_base, base_sql_base = cargar_crimenes_base(marca_artefactos())
+
+almacen = None
+base_sql = None
 if archivo is not None:
+    origen_datos = f"subida:{archivo.file_id}"
+    with medir("lectura_subida"):
+        almacen, cubo, informe = cargar_crimenes_subida(
+            archivo, origen_datos, tuple(categorias(almacen_base, "tipo_crimen")))
+    if not informe.empty:
+        descartadas = informe.loc[informe["severidad"] == "error", "filas"].max()
+        titulo = (f"⚠️ Validación: hasta {descartadas} filas descartadas" if pd.notna(descartadas)
+                  else "⚠️ Validación: advertencias")
+        with st.sidebar.expander(titulo, expanded=almacen is None):
+            st.dataframe(informe, use_container_width=True, hide_index=True)
+
+if almacen is None and archivo is not None:
+    st.sidebar.error("El archivo no tiene filas válidas; se muestran los datos base.")
+elif archivo is not None:
     if archivo.name.endswith(".geojson"):
-        gdf_crimenes = gpd.read_file(archivo)
-        print(gdf_crimenes.columns)
-        st.sidebar.write("🧾 Columnas cargadas:", gdf_crimenes.columns.tolist())
-    elif archivo.name.endswith(".csv"):
-        df = pd.read_csv(archivo)
-        geometry = gpd.points_from_xy(df.longitud, df.latitud)
-        gdf_crimenes = gpd.GeoDataFrame(df, geometry=geometry, crs="EPSG:4326")
+        st.sidebar.write("🧾 Columnas cargadas:", almacen["columnas"])
     st.sidebar.success("Archivo cargado correctamente")
-else:
-    gdf_crimenes = gpd.read_file("crimenes.geojson")
+    # Agrega el lote al histórico precalculado (sin duplicados) para todas las sesiones
+    if os.path.exists(os.path.join(DIRECTORIO_ARTEFACTOS, MANIFIESTO)):
+        if st.sidebar.button("➕ Agregar al histórico"):
+            archivo.seek(0)
+            with st.spinner("Agregando crímenes al histórico..."):
+                resumen = ingerir(archivo)
+            cargar_crimenes_base.clear()
+            st.sidebar.info(f"{resumen['nuevos']} crímenes nuevos, {resumen['duplicados']} duplicados "
+                            f"({resumen['colisiones_id']} con id repetido y otro contenido).")
+if almacen is None:
+    almacen = almacen_base
+    base_sql = base_sql_base
+    origen_datos = f"base:{marca_artefactos()}"
+    cubo = cubo_base
 
 # --- SIDEBAR DE FILTROS ---
 st.sidebar.header("Filtros")
@@ -88,15 +199,15 @@ barrios_opciones = sorted(gdf_barrios.NOMBRE.dropna().unique())
 barrios = st.sidebar.selectbox("Selecciona un barrio:", options=[
                                "Todos"] + barrios_opciones)
 
-tipos_opciones = sorted(gdf_crimenes.tipo_crimen.dropna().unique())
+tipos_opciones = categorias(almacen, "tipo_crimen")
 tipo_crimen = st.sidebar.selectbox("Tipo de Crimen", options=[
                                    "Todos"] + list(tipos_opciones))
 
-sexo = st.sidebar.selectbox("Sexo de la víctima", options=["Todos", "M", "F"])
+sexo = st.sidebar.selectbox(
+    "Sexo de la víctima", options=["Todos", "M", "F"], disabled="sexo" not in almacen["valores"],
+    help=None if "sexo" in almacen["valores"] else "El archivo cargado no tiene la columna sexo.")
 
-rango_fecha = st.sidebar.date_input("Rango de fechas", value=(
-    pd.to_datetime(gdf_crimenes['fecha'].min()).date(), 
-    pd.to_datetime(gdf_crimenes['fecha'].max()).date()))
+rango_fecha = st.sidebar.date_input("Rango de fechas", value=rango_fechas(almacen))
 min_hora, max_hora = st.sidebar.slider(
     "Rango horario (hora del día)", 0, 23, (0, 23))
 
@@ -104,165 +215,293 @@ grupos = ["habitante_calle", "prostitucion", "lgtbi", "grupo_etnico"]
 filtros_sociales = {g: st.sidebar.checkbox(
     f"{g.replace('_', ' ').title()}", value=False) for g in grupos}
 
+# --- ÁREA DIBUJADA EN EL MAPA ---
+@st.cache_resource(max_entries=4)
+def rejilla_cacheada(_almacen, origen):
+    # Índice espacial de los crímenes, uno por versión de los datos y compartido entre sesiones
+    return construir_rejilla(_almacen["x"], _almacen["y"])
+
+
+def area_actual():
+    # El mapa de puntos devuelve las figuras dibujadas en su valor (clave "mapa_puntos").
+    # El área se guarda en la sesión porque el mapa se vuelve a crear al cambiar los datos
+    # y entonces el plugin Draw devuelve una lista vacía.
+    dibujos = (st.session_state.get("mapa_puntos") or {}).get("all_drawings") or []
+    clave = json.dumps(dibujos, sort_keys=True)
+    if dibujos and clave != st.session_state.get("dibujos_descartados"):
+        st.session_state["area_dibujada"] = dibujos
+    if st.session_state.get("area_dibujada") and st.sidebar.button("🗑️ Quitar área dibujada"):
+        st.session_state["dibujos_descartados"] = clave
+        st.session_state["area_dibujada"] = None
+    return area_dibujada(st.session_state.get("area_dibujada"))
+
+
+area = area_actual()
+if area is not None:
+    st.sidebar.caption("Filtrando por el área dibujada en el mapa de puntos.")
+
+# --- BÚSQUEDA POR RADIO ---
+@st.cache_resource(max_entries=4)
+def arbol_cacheado(_almacen, origen):
+    # BallTree de los crímenes, uno por versión de los datos
+    return construir_arbol(_almacen["x"], _almacen["y"])
+
+
+# --- VISTA DEL MAPA ---
+# Con el modo de vista, el mapa de puntos recibe solo los crímenes del área visible más un
+# margen; mientras la vista no salga de esa área ampliada, el mapa no se vuelve a armar
+MARGEN_VISTA = 0.5
+solo_visible = st.sidebar.toggle("🔭 Enviar solo los puntos del área visible")
+
+
+def vista_actual():
+    limites = limites_mapa((st.session_state.get("mapa_puntos") or {}).get("bounds"))
+    if not solo_visible or limites is None:
+        st.session_state["vista_ampliada"] = None
+        return None
+    anterior = st.session_state.get("vista_ampliada")
+    if anterior is None or not contiene(anterior, limites):
+        st.session_state["vista_ampliada"] = ampliar(limites, MARGEN_VISTA)
+    return st.session_state["vista_ampliada"]
+
+
+buscar_radio = st.sidebar.toggle("📍 Crímenes alrededor de un clic en el mapa")
+radio_m = st.sidebar.slider("Radio de búsqueda (metros)", 100, 3000, 500, step=100) if buscar_radio else None
+
+# --- TESELAS VECTORIALES ---
+# Los mapas de puntos y de semaforización piden al servidor local solo las teselas a la vista
+usar_teselas = st.sidebar.toggle(
+    "🧩 Teselas vectoriales (servidor local)", disabled=not TESELAS_DISPONIBLES,
+    help=None if TESELAS_DISPONIBLES else "Requiere el paquete opcional mapbox-vector-tile.")
+
+
+@st.cache_resource
+def servidor_teselas():
+    # Un servidor por proceso, compartido por todas las sesiones
+    return iniciar_servidor()
+
+
+def clave_teselas(*partes):
+    return hashlib.sha1("|".join(map(str, partes)).encode("utf-8")).hexdigest()[:16]
+
 #aca comienza la semaforizacion
-def agregar_semaforizacion(gdf_crimenes, gdf_barrios, filtrado=True):
-    # Si estamos usando datos filtrados, aplicamos el filtrado
-    if filtrado:
-        gdf = filtrar_datos(gdf_crimenes)
-    else:
-        gdf = gdf_crimenes
-        
-    # Contar crímenes por barrio
-    crimen_por_barrio = gdf['barrio'].value_counts().reset_index()
-    crimen_por_barrio.columns = ['barrio', 'cantidad_crimenes']
-    
-    # Merge con el GeoDataFrame de barrios
-    gdf_barrios_semaforo = gdf_barrios.merge(
-        crimen_por_barrio, how='left', 
-        left_on='NOMBRE', right_on='barrio'
-    )
-    
-    # Rellenar NaN con 0 para barrios sin crímenes
-    gdf_barrios_semaforo['cantidad_crimenes'] = gdf_barrios_semaforo['cantidad_crimenes'].fillna(0)
-    
-    # Colores para semaforización
-    def asignar_color(cantidad):
-        if cantidad == 0:
-            return '#5cba47'  # Verde para barrios sin crímenes
-        elif cantidad <= 5:
-            return '#ffda33'  # Amarillo para barrios con pocos crímenes
-        elif cantidad <= 15:
-            return '#ff9c33'  # Naranja para barrios con crímenes moderados
-        else:
-            return '#ff3333'  # Rojo para barrios con muchos crímenes
-    
-    # Aplicar función para asignar colores
-    gdf_barrios_semaforo['color_semaforo'] = gdf_barrios_semaforo['cantidad_crimenes'].apply(asignar_color)
-    
-    return gdf_barrios_semaforo
+@medido("agregar_semaforizacion")
+def agregar_semaforizacion(almacen, filas, gdf_barrios):
+    # Conteo por barrio de las filas ya filtradas, sin materializar los crímenes
+    if base_sql is not None and area is None:
+        try:
+            return semaforizar_conteos(conteo_barrios_sql(base_sql, filtros_actuales()), gdf_barrios)
+        except ERRORES_BASE:
+            # La base está ocupada (p. ej. una ingesta desde otro proceso): cuenta el almacén
+            pass
+    return semaforizar_conteos(conteo_barrios(almacen, filas), gdf_barrios)
 
 # --- FILTRADO DE DATOS ---
-def filtrar_datos(gdf_crimenes):
-    gdf = gdf_crimenes.copy()
-    
-    # Filtros de barrio, tipo de crimen y sexo
-    if barrios != "Todos":
-        gdf = gdf[gdf['barrio'] == barrios]
-    if tipo_crimen != "Todos":
-        gdf = gdf[gdf['tipo_crimen'] == tipo_crimen]
-    if sexo != "Todos":
-        gdf = gdf[gdf['sexo'] == sexo]
-
-    # Validar columnas de fecha y hora
-    gdf['fecha_dt'] = pd.to_datetime(gdf['fecha'], errors='coerce')
-    gdf = gdf[(gdf['fecha_dt'].dt.date >= rango_fecha[0]) &
-            (gdf['fecha_dt'].dt.date <= rango_fecha[1])]
-
-    # Validar y filtrar por hora
-    if 'hora' in gdf.columns:
+def filtros_actuales(con_fechas=True):
+    return {
+        "barrio": barrios,
+        "tipo_crimen": tipo_crimen,
+        "sexo": sexo,
+        "rango_fecha": rango_fecha if con_fechas else None,
+        "horas": (min_hora, max_hora),
+        "sociales": filtros_sociales,
+    }
+
+
+@medido("filtrar_datos")
+def filtrar_datos(almacen):
+    # La sesión solo guarda los números de fila seleccionados
+    if base_sql is not None:
         try:
-            gdf['hora_h'] = pd.to_datetime(
-                gdf['hora'], format='%H:%M', errors='coerce').dt.hour
-            gdf = gdf[gdf['hora_h'].notna()]
-            gdf = gdf[gdf['hora_h'].between(min_hora, max_hora)]
-        except Exception as e:
-            st.warning(f"⚠️ Error al procesar la columna 'hora': {e}")
-
-    # Filtrar por grupos sociales
-    for grupo, filtro_activo in filtros_sociales.items():
-        if filtro_activo and grupo in gdf.columns:
-            gdf = gdf[gdf[grupo] == True]
-            
-    return gdf
-
-# Aplicar filtros a los datos
-gdf = filtrar_datos(gdf_crimenes)
+            filas = seleccionar_sql(base_sql, filtros_actuales())
+        except ERRORES_BASE:
+            # La base está ocupada (p. ej. una ingesta desde otro proceso): filtra el almacén
+            filas = seleccionar(almacen, filtros_actuales())
+    else:
+        filas = seleccionar(almacen, filtros_actuales())
+    if area is not None:
+        with medir("filtro_area"):
+            en_area = filas_en_area(rejilla_cacheada(almacen, origen_datos), almacen["x"], almacen["y"], area)
+            filas = np.intersect1d(filas, en_area, assume_unique=True)
+    return filas
+
+# Aplicar filtros a los datos; solo el mapa de puntos arma un GeoDataFrame, y solo con las
+# filas que dibuja. Las demás capas trabajan sobre las columnas del almacén.
+filas = filtrar_datos(almacen)
+
+# El último clic en el mapa de puntos llega en su valor, igual que las figuras dibujadas
+busqueda = None
+clic = (st.session_state.get("mapa_puntos") or {}).get("last_clicked")
+if buscar_radio and clic:
+    with medir("busqueda_radio"):
+        cercanas, _ = filas_en_radio(arbol_cacheado(almacen, origen_datos), clic["lng"], clic["lat"], radio_m)
+        cercanas = np.intersect1d(cercanas, filas, assume_unique=True)
+    busqueda = {"centro": (clic["lat"], clic["lng"]), "radio": radio_m, "filas": cercanas}
 
 # --- PESTAÑA 1: MAPA DE PUNTOS ---
+CAPAS_MAPA = ["Puntos", "Mapa de calor", "Hexágonos", "Animación"]
+# Clave de los filtros del mapa (sidebar y área dibujada) para cachear sus capas agregadas
+clave_mapa = json.dumps({"filtros": filtros_actuales(), "area": area.wkt if area is not None else None},
+                        sort_keys=True, default=str)
+
+
+@st.cache_data(max_entries=32)
+def kde_cacheado(_almacen, _filas, origen, clave_filtros):
+    # Una densidad por origen de datos y conjunto de filtros; la extensión es la de todos
+    # los datos para que la rejilla sea la misma con cualquier filtro
+    limites = limites_datos(_almacen["x"], _almacen["y"])
+    return densidad_kde(_almacen["x"][_filas], _almacen["y"][_filas], limites)
+
+
+@st.cache_data(max_entries=16)
+def animacion_cacheada(_almacen, _filas, origen, clave_filtros, granularidad, color_dict):
+    # Cuadros de la animación por origen de datos, filtros y granularidad
+    cuadros = cuadros_tiempo(_almacen, _filas, granularidad)
+    formato = "%Y-%m-%d" if granularidad == "Diaria" else "Semana al %Y-%m-%d"
+    return datos_animacion(cuadros, _almacen["x"], _almacen["y"], _almacen["valores"]["tipo_crimen"],
+                           _almacen["categorias"]["tipo_crimen"], color_dict, cuadros["fechas"].strftime(formato))
+
+
+@st.cache_resource(max_entries=4)
+def hexagonos_cacheados(_almacen, origen):
+    # Celda de cada crimen en todas las resoluciones, una vez por versión de los datos
+    return indice_hex(_almacen["x"], _almacen["y"])
+
+
 with tab1:
-    # --- PALETA DE COLORES ---
-    categorias = sorted(gdf['tipo_crimen'].dropna().unique())
-    cmap = ListedColormap(custom_palette)
-    color_dict = {cat: to_hex(cmap(i / max(1, len(categorias)-1)))
-                for i, cat in enumerate(categorias)}
-
-    # --- MAPA DE PUNTOS ---
-    if not gdf.empty:
-        centro = [gdf.geometry.y.mean(), gdf.geometry.x.mean()]
-        m = folium.Map(location=centro, zoom_start=13, tiles="CartoDB dark_matter")
-
-        folium.GeoJson(gdf_barrios, name="Barrios",
-                    style_function=lambda x: {"fillOpacity": 0, "color": "white", "weight": 1}).add_to(m)
-
-        for _, row in gdf.iterrows():
-            folium.CircleMarker(
-                location=[row.geometry.y, row.geometry.x],
-                radius=4,
-                color=color_dict.get(row['tipo_crimen'], "#ffffff"),
-                fill=True,
-                fill_color=color_dict.get(row['tipo_crimen'], "#ffffff"),
-                fill_opacity=0.85,
-                popup=folium.Popup(f"""
-                    <b>ID:</b> {row['id']}<br>
-                    <b>Tipo:</b> {row['tipo_crimen']}<br>
-                    <b>Fecha:</b> {row['fecha']}<br>
-                    <b>Hora:</b> {row.get('hora', 'N/A')}<br>
-                    <b>Barrio:</b> {row['barrio']}<br>
-                    <b>Edad:</b> {row['edad']}<br>
-                    <b>Sexo:</b> {row['sexo']}<br>
-                    <b>Sociales:</b><br>
-                    {'✔️' if row.get('habitante_calle', False) else '❌'} Habitante calle<br>
-                    {'✔️' if row.get('prostitucion', False) else '❌'} Prostitución<br>
-                    {'✔️' if row.get('lgtbi', False) else '❌'} LGTBI<br>
-                    {'✔️' if row.get('grupo_etnico', False) else '❌'} Grupo étnico
-                """, max_width=300)
-            ).add_to(m)
-
-        st_data = st_folium(m, width=1200, height=600)
+    capa = st.radio("Capa del mapa", CAPAS_MAPA, horizontal=True)
+
+    if capa == "Mapa de calor":
+        if len(filas) == 0:
+            st.warning("⚠️ No hay datos disponibles con los filtros seleccionados.")
+        else:
+            with medir("densidad_kde", filas=len(filas)):
+                kde = kde_cacheado(almacen, filas, origen_datos, clave_mapa)
+            with medir("st_folium_calor"):
+                st_folium(mapa_calor(kde, gdf_barrios), width=1200, height=600, key="mapa_calor")
+            st.caption(f"Densidad de crímenes por km² (núcleo gaussiano de {ANCHO_BANDA_M} m, "
+                       f"celdas de {kde['celda_m']:.0f} m).")
+    elif capa == "Hexágonos":
+        tamano_hex = st.select_slider("Radio de los hexágonos (metros)", options=TAMANOS_HEX,
+                                      value=TAMANOS_HEX[1])
+        if len(filas) == 0:
+            st.warning("⚠️ No hay datos disponibles con los filtros seleccionados.")
+        else:
+            celdas = hexagonos_cacheados(almacen, origen_datos)[tamano_hex]
+            with medir("conteo_hex", filas=len(filas)):
+                conteos_hex = conteo_hex(celdas, filas)
+            with medir("st_folium_hexagonos"):
+                st_folium(mapa_hexagonos(celdas, conteos_hex, gdf_barrios), width=1200, height=600,
+                          key="mapa_hexagonos")
+            st.caption(f"{int((conteos_hex > 0).sum())} hexágonos con crímenes; "
+                       f"máximo {int(conteos_hex.max())} en un hexágono.")
+    elif capa == "Animación":
+        col_animacion, col_velocidad = st.columns(2)
+        granularidad_animacion = col_animacion.radio("Cuadros", ["Diaria", "Semanal"], horizontal=True)
+        intervalo = col_velocidad.slider("Milisegundos por cuadro", 100, 2000, 400, step=100)
+        if len(filas) == 0:
+            st.warning("⚠️ No hay datos disponibles con los filtros seleccionados.")
+        else:
+            color_dict = colores_por_tipo(valores_presentes(almacen, filas, "tipo_crimen"), custom_palette)
+            with medir("cuadros_animacion", filas=len(filas)):
+                datos_mapa = animacion_cacheada(almacen, filas, origen_datos, clave_mapa,
+                                                granularidad_animacion, color_dict)
+            with medir("st_folium_animacion"):
+                st_folium(mapa_animado(datos_mapa, gdf_barrios, intervalo), width=1200, height=600,
+                          key="mapa_animacion")
+            st.caption(f"{len(datos_mapa['etiquetas'])} cuadros con {len(datos_mapa['x'])} crímenes"
+                       + (f" (muestra de {len(filas)})" if len(filas) > MAX_PUNTOS_ANIMACION else "") + ".")
     else:
-        st.warning("⚠️ No hay datos disponibles con los filtros seleccionados.")
+        # --- PALETA DE COLORES ---
+        tipos_presentes = valores_presentes(almacen, filas, "tipo_crimen")
+        color_dict = colores_por_tipo(tipos_presentes, custom_palette)
+
+        # --- MAPA DE PUNTOS ---
+        vista = None if usar_teselas else vista_actual()
+        filas_mapa = filas
+        vista_mapa = {}
+        if vista is not None:
+            with medir("filtro_vista"):
+                visibles = filas_en_limites(rejilla_cacheada(almacen, origen_datos),
+                                            almacen["x"], almacen["y"], vista)
+                filas_mapa = np.intersect1d(filas, visibles, assume_unique=True)
+            st.caption(f"Mostrando {len(filas_mapa)} de {len(filas)} crímenes: los del área visible y sus alrededores.")
+            # El mapa se vuelve a armar con otros puntos: se conserva la vista del usuario
+            salida_mapa = st.session_state.get("mapa_puntos") or {}
+            if salida_mapa.get("center") and salida_mapa.get("zoom"):
+                vista_mapa = {"center": (salida_mapa["center"]["lat"], salida_mapa["center"]["lng"]),
+                              "zoom": salida_mapa["zoom"]}
+
+        if len(filas):
+            if usar_teselas:
+                servidor = servidor_teselas()
+                with medir("registrar_teselas", filas=len(filas)):
+                    capa_crimenes = registrar_puntos(
+                        servidor, clave_teselas("crimenes", origen_datos, clave_mapa), almacen["x"][filas],
+                        almacen["y"][filas], almacen["valores"]["tipo_crimen"][filas],
+                        almacen["categorias"]["tipo_crimen"])
+                    capa_barrios = registrar_poligonos(servidor, "barrios", gdf_barrios, ["NOMBRE"])
+                m = mapa_teselas_puntos(url_capa(servidor, capa_crimenes), url_capa(servidor, capa_barrios),
+                                        color_dict, [almacen["y"][filas].mean(), almacen["x"][filas].mean()],
+                                        area, busqueda)
+            else:
+                with medir("materializar", filas=len(filas_mapa)):
+                    gdf_mapa = materializar(almacen, filas_mapa)
+                m = mapa_puntos(gdf_mapa, gdf_barrios, color_dict, area, busqueda)
+
+            with medir("st_folium_puntos"):
+                st_data = st_folium(m, width=1200, height=600, key="mapa_puntos", **vista_mapa)
+
+            if buscar_radio and busqueda is None:
+                st.info("Haz clic en el mapa para ver los crímenes alrededor de ese punto.")
+            elif busqueda is not None:
+                st.subheader(f"Crímenes a {radio_m} m del punto ({clic['lat']:.5f}, {clic['lng']:.5f})")
+                por_tipo = tabla(almacen, busqueda["filas"], ["tipo_crimen"])["tipo_crimen"].value_counts()
+                por_tipo = por_tipo.rename_axis("Tipo de crimen").reset_index(name="Cantidad")
+                st.write(f"{len(busqueda['filas'])} crímenes con los filtros actuales.")
+                st.dataframe(por_tipo, use_container_width=True, hide_index=True)
+        else:
+            st.warning("⚠️ No hay datos disponibles con los filtros seleccionados.")
+
+@st.cache_data(max_entries=64)
+def semana_hora_cacheada(_cubo, _almacen, _filas, origen, clave_filtros):
+    # Matriz día × hora por origen de datos y filtros del mapa. Sin área dibujada sale del
+    # vector horario del cubo (el mismo que usa la predicción); con área, de las filas.
+    clave = json.loads(clave_filtros)
+    if clave["area"] is not None:
+        return conteo_semana_hora(_almacen, _filas)
+    filtros_sin_fechas = json.dumps(dict(clave["filtros"], rango_fecha=None), sort_keys=True, default=str)
+    conteos = conteos_horarios_cacheado(_cubo, origen, filtros_sin_fechas)
+    return semana_hora(conteos, _cubo, clave["filtros"]["rango_fecha"])
+
+
+@st.cache_data(max_entries=64)
+def html_semaforo_cacheado(_gdf_barrios_semaforo, _gdf_barrios, clave):
+    # Un documento por vector de conteos y origen de los datos (ver mapas.clave_semaforo)
+    return html_semaforo(_gdf_barrios_semaforo, _gdf_barrios)
+
 
 # --- PESTAÑA 2: SEMAFORIZACIÓN DE BARRIOS ---
 with tab2:
     # Crear gdf_barrios_semaforo
-    gdf_barrios_semaforo = agregar_semaforizacion(gdf_crimenes, gdf_barrios)
+    gdf_barrios_semaforo = agregar_semaforizacion(almacen, filas, gdf_barrios)
     
     # Crear mapa para semaforización
-    centro = [gdf_barrios.geometry.centroid.y.mean(), gdf_barrios.geometry.centroid.x.mean()]
-    m_semaforo = folium.Map(location=centro, zoom_start=13, tiles="CartoDB dark_matter")
-    
-    # Añadir leyenda
-    leyenda_html = """
-    <div style="position: fixed; bottom: 50px; right: 50px; background-color: rgba(0, 0, 0, 0.7); 
-                padding: 10px; border-radius: 5px; z-index: 900; color: white;">
-      <h4>Semaforización de Crímenes</h4>
-      <p><i class="fa fa-square" style="color:#5cba47;"></i> Sin crímenes</p>
-      <p><i class="fa fa-square" style="color:#ffda33;"></i> 1-5 crímenes</p>
-      <p><i class="fa fa-square" style="color:#ff9c33;"></i> 6-15 crímenes</p>
-      <p><i class="fa fa-square" style="color:#ff3333;"></i> >15 crímenes</p>
-    </div>
-    """
-    m_semaforo.get_root().html.add_child(folium.Element(leyenda_html))
-    
-    # Añadir capa de barrios semaforizados
-    folium.GeoJson(
-        gdf_barrios_semaforo,
-        name="Semaforización",
-        style_function=lambda x: {
-            'fillColor': x['properties'].get('color_semaforo', '#5cba47'),
-            'color': 'white',
-            'weight': 1,
-            'fillOpacity': 0.6
-        },
-        tooltip=folium.GeoJsonTooltip(
-            fields=['NOMBRE', 'cantidad_crimenes'],
-            aliases=['Barrio:', 'Total crímenes:'],
-            style="background-color: white; color: #333333;"
-        )
-    ).add_to(m_semaforo)
-    
-    # Mostrar el mapa de semaforización
-    st_semaforo = st_folium(m_semaforo, width=1200, height=600)
+    if usar_teselas:
+        servidor = servidor_teselas()
+        capa_semaforo = registrar_poligonos(
+            servidor, clave_semaforo(gdf_barrios_semaforo, origen_datos, teselas=True),
+            gdf_barrios_semaforo, ["NOMBRE", "cantidad_crimenes", "color_semaforo"])
+        m_semaforo = mapa_teselas_semaforo(url_capa(servidor, capa_semaforo), centro_barrios(gdf_barrios))
+        with medir("st_folium_semaforo"):
+            st_folium(m_semaforo, width=1200, height=600)
+    else:
+        # El HTML se reutiliza mientras no cambien los conteos por barrio: folium no vuelve
+        # a armar ni a serializar el mapa
+        with medir("html_semaforo"):
+            html_mapa_semaforo = html_semaforo_cacheado(gdf_barrios_semaforo, gdf_barrios,
+                                                        clave_semaforo(gdf_barrios_semaforo, origen_datos))
+        components.html(html_mapa_semaforo, width=1200, height=600)
     
     # Mostrar estadísticas de crímenes por barrio
     st.subheader("Estadísticas de Crímenes por Barrio")
@@ -279,103 +518,92 @@ with tab2:
     st.subheader("Top 10 Barrios con más Crímenes")
     top_10 = stats_df.head(10)
     
-    fig, ax = plt.subplots(figsize=(10, 6))
-    bars = ax.bar(top_10['Barrio'], top_10['Cantidad de Crímenes'], color='#2ca6c5')
-    ax.set_xlabel('Barrio', fontsize=12)
-    ax.set_ylabel('Cantidad de Crímenes', fontsize=12)
-    ax.set_xticklabels(top_10['Barrio'], rotation=45, ha='right')
-    ax.set_facecolor('#032f45')
-    ax.tick_params(colors='white')
-    ax.xaxis.label.set_color('white')
-    ax.yaxis.label.set_color('white')
-    for spine in ax.spines.values():
-        spine.set_color('white')
+    with medir("grafico_top10"):
+        fig, ax = plt.subplots(figsize=(10, 6))
+        bars = ax.bar(top_10['Barrio'], top_10['Cantidad de Crímenes'], color='#2ca6c5')
+        ax.set_xlabel('Barrio', fontsize=12)
+        ax.set_ylabel('Cantidad de Crímenes', fontsize=12)
+        ax.set_xticklabels(top_10['Barrio'], rotation=45, ha='right')
+        ax.set_facecolor('#032f45')
+        ax.tick_params(colors='white')
+        ax.xaxis.label.set_color('white')
+        ax.yaxis.label.set_color('white')
+        for spine in ax.spines.values():
+            spine.set_color('white')
     
-    # Añadir valores en las barras
-    for bar in bars:
-        height = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width()/2., height + 0.1,
-                f'{int(height)}', ha='center', va='bottom', color='white')
+        # Añadir valores en las barras
+        for bar in bars:
+            height = bar.get_height()
+            ax.text(bar.get_x() + bar.get_width()/2., height + 0.1,
+                    f'{int(height)}', ha='center', va='bottom', color='white')
     
-    plt.tight_layout()
-    st.pyplot(fig)
+        plt.tight_layout()
+        st.pyplot(fig)
+
+    # Patrón semanal: crímenes por día de la semana y hora del día con los filtros actuales
+    st.subheader("Crímenes por Día de la Semana y Hora")
+    with medir("semana_hora"):
+        matriz = semana_hora_cacheada(cubo, almacen, filas, origen_datos, clave_mapa)
+    fig_semana = go.Figure(go.Heatmap(
+        z=matriz, x=list(range(24)), y=DIAS_SEMANA,
+        colorscale=[[0, "#032f45"], [0.5, "#2ca6c5"], [1, "#f8b909"]],
+        hovertemplate="%{y}, %{x}:00 h<br>%{z:.0f} crímenes<extra></extra>"))
+    fig_semana.update_layout(xaxis_title="Hora del día", yaxis=dict(autorange="reversed"),
+                             xaxis=dict(dtick=1))
+    st.plotly_chart(fig_semana, use_container_width=True)
 
 # --- TABLA DE DATOS ---
 if st.checkbox("Mostrar tabla de crímenes filtrados"):
-    cols_to_drop = ['geometry']
-    if 'fecha_dt' in gdf.columns:
-        cols_to_drop.append('fecha_dt')
-    if 'hora_h' in gdf.columns:
-        cols_to_drop.append('hora_h')
-    st.dataframe(gdf.drop(columns=cols_to_drop, errors='ignore'))
+    st.dataframe(tabla(almacen, filas).drop(columns=['fecha_dt', 'hora_h'], errors='ignore'))
 
 
     # --- PREDICCIÓN DE CRÍMENES ---
 with tab3:
-    st.subheader("📈 Predicción de casos de criminalidad por semana")
+    st.subheader("📈 Predicción de casos de criminalidad")
+
+    granularidad = st.radio("Granularidad", list(GRANULARIDADES), horizontal=True)
+    freq = GRANULARIDADES[granularidad][0]
+    unidad = UNIDADES_GRANULARIDAD[granularidad]
+
+    # Serie con los mismos filtros del mapa (salvo el rango de fechas, que lo define la
+    # ventana de entrenamiento). El vector horario se calcula una vez por conjunto de
+    # filtros y las series diaria y semanal salen de sumarlo por bloques.
+    filtros_serie = filtros_actuales(con_fechas=False)
+    clave_filtros = json.dumps(filtros_serie, sort_keys=True, default=str)
+    conteos = conteos_horarios_cacheado(cubo, origen_datos, clave_filtros)
+    df_prophet = remuestrear(conteos, cubo, granularidad)
+    serie_actual = id_serie(filtros_serie)
+    if serie_actual != "ciudad":
+        st.caption("Serie filtrada con los filtros de la barra lateral (excepto el rango de fechas).")
+    if granularidad != "Semanal":
+        serie_actual = f"{serie_actual}@{freq}"
+
+    entrenamiento_defecto, prediccion_maxima, prediccion_defecto = PERIODOS_GRANULARIDAD[granularidad]
+    periodos_entrenamiento = st.slider(f"{unidad} para entrenar el modelo", 4, len(df_prophet)-1,
+                                       min(entrenamiento_defecto, len(df_prophet)-1))
+    periodos_prediccion = st.slider(f"{unidad} a predecir", 1, prediccion_maxima, prediccion_defecto)
 
  
-    crimenes = gpd.read_file("crimenes.geojson")
-    crimenes["fecha"] = pd.to_datetime(crimenes["fecha"])
-
-
-    df_semanal = crimenes.groupby(pd.Grouper(key="fecha", freq="W")).size().reset_index(name="casos")
-    df_prophet = df_semanal.rename(columns={"fecha": "ds", "casos": "y"})
-
-
-    semanas_entrenamiento = st.slider("Semanas para entrenar el modelo", 4, len(df_prophet)-1, 12)
-    semanas_prediccion = st.slider("Semanas a predecir", 1, 12, 4)
-
- 
-    modelo_seleccionado = st.selectbox("Selecciona el modelo de predicción", 
-                                       ["Prophet", "Regresión lineal", "Árbol de decisión"])
+    modelo_seleccionado = st.selectbox("Selecciona el modelo de predicción", MODELOS)
+
+    mostrar_bandas = st.checkbox("Mostrar bandas de cuantiles")
+    if mostrar_bandas:
+        # La mediana siempre se dibuja: la banda va de un cuantil bajo a uno alto alrededor de ella
+        col_cuantil_bajo, col_cuantil_alto = st.columns(2)
+        cuantil_bajo = col_cuantil_bajo.slider("Cuantil inferior de la banda", 0.01, 0.49, 0.1, step=0.01)
+        cuantil_alto = col_cuantil_alto.slider("Cuantil superior de la banda", 0.51, 0.99, 0.9, step=0.01)
+        n_muestras = MUESTRAS_DEFECTO
+        if modelo_seleccionado == "Prophet":
+            # Menos muestras = respuesta más rápida y bandas algo más ruidosas
+            n_muestras = st.slider("Muestras de simulación", 100, 2000, MUESTRAS_DEFECTO, step=100)
 
     # Datos de entrenamiento
-    train = df_prophet.tail(semanas_entrenamiento)
+    train = df_prophet.tail(periodos_entrenamiento)
 
-    
-    if modelo_seleccionado == "Prophet":
-        try:
-            from prophet import Prophet
-        except ImportError:
-            from fbprophet import Prophet
-
-        model = Prophet()
-        model.fit(train)
-        future = model.make_future_dataframe(periods=semanas_prediccion, freq="W")
-        forecast = model.predict(future)
-        pred_dates = forecast["ds"]
-        pred_values = forecast["yhat"]
-
-    elif modelo_seleccionado == "Regresión lineal":
-        from sklearn.linear_model import LinearRegression
-        import numpy as np
-
-        train["semana"] = np.arange(len(train))
-        X_train = train[["semana"]]
-        y_train = train["y"]
-
-        model = LinearRegression()
-        model.fit(X_train, y_train)
-
-        X_future = np.arange(len(train), len(train) + semanas_prediccion).reshape(-1, 1)
-        pred_values = model.predict(X_future)
-        pred_dates = pd.date_range(start=train["ds"].iloc[-1] + pd.Timedelta(weeks=1), periods=semanas_prediccion, freq="W")
-
-    elif modelo_seleccionado == "Árbol de decisión":
-        from sklearn.tree import DecisionTreeRegressor
-        import numpy as np
-
-        train["semana"] = np.arange(len(train))
-        X_train = train[["semana"]]
-        y_train = train["y"]
-
-        model = DecisionTreeRegressor()
-        model.fit(X_train, y_train)
-
-        X_future = np.arange(len(train), len(train) + semanas_prediccion).reshape(-1, 1)
-        pred_values = model.predict(X_future)
-        pred_dates = pd.date_range(start=train["ds"].iloc[-1] + pd.Timedelta(weeks=1), periods=semanas_prediccion, freq="W")
+    # El ajuste se reutiliza desde el registro en disco si ya existe para estos datos
+    with medir("pronostico", modelo=modelo_seleccionado):
+        pred_dates, pred_values = pronosticar(modelo_seleccionado, train, periodos_prediccion, freq=freq,
+                                              serie=serie_actual)
 
   
     import plotly.graph_objects as go
@@ -386,8 +614,71 @@ with tab3:
     fig.add_trace(go.Scatter(x=pred_dates, y=pred_values,
                              mode="lines+markers", name=f"Predicción ({modelo_seleccionado})", 
                              line=dict(color="pink", dash="dot")))
-    fig.update_layout(title="Predicción semanal de casos",
+    if mostrar_bandas:
+        # Las bandas se calculan una sola vez por ajuste y combinación de cuantiles
+        with medir("bandas_cuantiles"):
+            bandas = pronosticar_cuantiles(modelo_seleccionado, train, periodos_prediccion, freq=freq,
+                                           serie=serie_actual, n_muestras=n_muestras,
+                                           cuantiles=(cuantil_bajo, 0.5, cuantil_alto))
+        col_bajo, col_mediana, col_alto = (columna_cuantil(q) for q in (cuantil_bajo, 0.5, cuantil_alto))
+        fig.add_trace(go.Scatter(x=bandas["ds"], y=bandas[col_alto], mode="lines",
+                                 line=dict(width=0), showlegend=False, hoverinfo="skip"))
+        fig.add_trace(go.Scatter(x=bandas["ds"], y=bandas[col_bajo], mode="lines",
+                                 line=dict(width=0), fill="tonexty", fillcolor="rgba(44, 166, 197, 0.3)",
+                                 name=f"Banda {col_bajo}–{col_alto}"))
+        fig.add_trace(go.Scatter(x=bandas["ds"], y=bandas[col_mediana], mode="lines",
+                                 name="Mediana", line=dict(color="#2ca6c5", dash="dash")))
+    fig.update_layout(title=f"Predicción {granularidad.lower()} de casos",
                       xaxis_title="Fecha", yaxis_title="Número de casos",
                       legend=dict(x=0, y=1.1, orientation="h"))
 
     st.plotly_chart(fig, use_container_width=True)
+
+    # --- PRONÓSTICO JERÁRQUICO ---
+    if st.checkbox("Pronóstico jerárquico reconciliado (ciudad → zona → barrio, ciudad → tipo)"):
+        metodo_base = st.selectbox("Modelo base por serie", METODOS_BASE)
+        reconciliacion = st.radio("Reconciliación", ["MinT", "Bottom-up", "Sin reconciliar"],
+                                  horizontal=True)
+        columna_rec = {"MinT": "mint", "Bottom-up": "bottom_up", "Sin reconciliar": "base"}[reconciliacion]
+
+        with medir("pronostico_jerarquico"):
+            jerarquico = pronostico_jerarquico_cacheado(
+                cubo, origen_datos, clave_filtros, periodos_entrenamiento, periodos_prediccion,
+                metodo_base, granularidad)
+
+        ciudad = jerarquico[jerarquico["nivel"] == "ciudad"]
+        # La jerarquía cubre todos los barrios y tipos: los casos reales de la ciudad son los
+        # de esa misma serie, no los de la serie filtrada de arriba
+        filtros_ciudad = dict(filtros_serie, barrio="Todos", tipo_crimen="Todos")
+        reales_ciudad = remuestrear(conteos_horarios_cacheado(
+            cubo, origen_datos, json.dumps(filtros_ciudad, sort_keys=True, default=str)), cubo, granularidad)
+        fig_jer = go.Figure()
+        fig_jer.add_trace(go.Scatter(x=reales_ciudad["ds"], y=reales_ciudad["y"],
+                                     mode="lines+markers", name="Casos reales", line=dict(color="red")))
+        for columna, nombre, color in (("base", "Base", "gray"), ("bottom_up", "Bottom-up", "#f8b909"),
+                                       ("mint", "MinT", "#2ca6c5")):
+            fig_jer.add_trace(go.Scatter(x=ciudad["ds"], y=ciudad[columna], mode="lines+markers",
+                                         name=nombre, line=dict(color=color, dash="dot")))
+        fig_jer.update_layout(title="Total de la ciudad: pronóstico base y reconciliado",
+                              xaxis_title="Fecha", yaxis_title="Número de casos",
+                              legend=dict(x=0, y=1.1, orientation="h"))
+        st.plotly_chart(fig_jer, use_container_width=True)
+
+        nivel = st.selectbox("Nivel a detallar", ["zona", "barrio", "tipo", "barrio_tipo"])
+        detalle = jerarquico[jerarquico["nivel"] == nivel].pivot(
+            index="nombre", columns="ds", values=columna_rec)
+        formato_periodo = "%Y-%m-%d %H:00" if granularidad == "Horaria" else "%Y-%m-%d"
+        detalle.columns = [d.strftime(formato_periodo) for d in detalle.columns]
+        st.dataframe(detalle.round(2), use_container_width=True)
+
+        # Con reconciliación cada nivel suma exactamente el total de la ciudad
+        suma_nivel = jerarquico[jerarquico["nivel"] == nivel][columna_rec].sum()
+        st.caption(f"Suma del nivel: {suma_nivel:.2f} · Total ciudad: {ciudad[columna_rec].sum():.2f}")
+
+# --- PANEL DE DEPURACIÓN ---
+mostrar_tiempos = st.sidebar.checkbox("🛠️ Mostrar tiempos por etapa")
+traza = finalizar_traza()
+if mostrar_tiempos and traza is not None:
+    st.sidebar.subheader("Tiempos de este rerun")
+    st.sidebar.dataframe(pd.DataFrame(traza["etapas"]), use_container_width=True)
+    st.sidebar.caption(f"Total: {traza['total_ms']:.0f} ms · rerun {traza['rerun_id']}")
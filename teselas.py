@@ -0,0 +1,200 @@
+# Servidor local de teselas vectoriales (Mapbox Vector Tiles) para los mapas de la app
+#
+# En lugar de incrustar todo el GeoJSON en el HTML de folium en cada rerun, la app registra
+# una capa (los crímenes filtrados o los barrios con su semáforo) bajo una clave y el mapa
+# pide al servidor solo las teselas z/x/y que están a la vista. Cada tesela se arma al
+# pedirla, con el índice de rejilla para los puntos y el índice espacial de geopandas para
+# los polígonos, y queda en un caché LRU. Requiere `mapbox_vector_tile` (opcional).
+#
+#     servidor = iniciar_servidor()
+#     clave = registrar_puntos(servidor, "crimenes:...", x, y, codigos, categorias)
+#     url = url_capa(servidor, clave)  # .../{z}/{x}/{y}.pbf
+import math
+import os
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import shapely
+
+from espacial import construir_rejilla, filas_en_limites
+
+try:
+    import mapbox_vector_tile
+except ImportError:
+    mapbox_vector_tile = None
+
+DISPONIBLE = mapbox_vector_tile is not None
+PUERTO = int(os.environ.get("BARRANQUILLA_TESELAS_PUERTO", "8765"))
+# URL con la que el navegador llega al servidor, si no es localhost (p. ej. detrás de un proxy)
+URL_PUBLICA = os.environ.get("BARRANQUILLA_TESELAS_URL")
+EXTENSION = 4096
+MAX_TESELAS_EN_MEMORIA = 2048
+MAX_CAPAS = 32
+# En zooms bajos una tesela cubre toda la ciudad: se envía una muestra regular de puntos
+MAX_PUNTOS_TESELA = 10_000
+RADIO_MERCATOR = 6378137.0
+MITAD_MUNDO = math.pi * RADIO_MERCATOR
+
+
+# --- GEOMETRÍA DE LAS TESELAS ---
+def a_mercator(lon, lat):
+    x = np.radians(lon) * RADIO_MERCATOR
+    y = np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) * RADIO_MERCATOR
+    return x, y
+
+
+def limites_tesela(z, tx, ty):
+    # (xmin, ymin, xmax, ymax) en metros de Web Mercator; ty crece hacia el sur
+    tamano = 2 * MITAD_MUNDO / 2 ** z
+    xmin = -MITAD_MUNDO + tx * tamano
+    ymax = MITAD_MUNDO - ty * tamano
+    return xmin, ymax - tamano, xmin + tamano, ymax
+
+
+def _grados(limites):
+    xmin, ymin, xmax, ymax = limites
+    lon = np.degrees(np.array([xmin, xmax]) / RADIO_MERCATOR)
+    lat = np.degrees(2 * np.arctan(np.exp(np.array([ymin, ymax]) / RADIO_MERCATOR)) - np.pi / 2)
+    return lon[0], lat[0], lon[1], lat[1]
+
+
+# --- CAPAS ---
+def registrar_puntos(servidor, clave, x, y, codigos, categorias):
+    # Puntos en lon/lat con una categoría por punto (código entero en `categorias`)
+    def crear():
+        return {"tipo": "puntos", "x": np.asarray(x), "y": np.asarray(y),
+                "codigos": np.asarray(codigos), "categorias": list(categorias),
+                "rejilla": construir_rejilla(np.asarray(x), np.asarray(y))}
+    return _registrar(servidor, clave, crear)
+
+
+def registrar_poligonos(servidor, clave, gdf, propiedades):
+    # Polígonos (en cualquier CRS) con las columnas `propiedades` como atributos
+    def crear():
+        proyectado = gdf[propiedades + [gdf.geometry.name]].to_crs(epsg=3857)
+        proyectado.sindex  # el índice espacial se arma aquí y no en la primera tesela
+        return {"tipo": "poligonos", "gdf": proyectado, "propiedades": propiedades}
+    return _registrar(servidor, clave, crear)
+
+
+def _registrar(servidor, clave, crear):
+    with servidor["candado"]:
+        if clave in servidor["capas"]:
+            servidor["capas"].move_to_end(clave)
+            return clave
+    capa = crear()
+    with servidor["candado"]:
+        servidor["capas"][clave] = capa
+        if len(servidor["capas"]) > MAX_CAPAS:
+            servidor["capas"].popitem(last=False)
+    return clave
+
+
+def _capa_puntos(capa, z, tx, ty):
+    limites = limites_tesela(z, tx, ty)
+    filas = filas_en_limites(capa["rejilla"], capa["x"], capa["y"], _grados(limites))
+    if len(filas) > MAX_PUNTOS_TESELA:
+        filas = filas[::math.ceil(len(filas) / MAX_PUNTOS_TESELA)]
+    mx, my = a_mercator(capa["x"][filas], capa["y"][filas])
+    # Un punto por crimen (Leaflet.VectorGrid solo dibuja el primer punto de un MultiPoint)
+    nombres = capa["categorias"] + [None]
+    puntos = shapely.points(mx, my)
+    features = [{"geometry": punto, "properties": {"categoria": nombres[codigo]}}
+                for punto, codigo in zip(puntos, capa["codigos"][filas].tolist())]
+    return features, limites
+
+
+def _capa_poligonos(capa, z, tx, ty):
+    limites = limites_tesela(z, tx, ty)
+    xmin, ymin, xmax, ymax = limites
+    gdf = capa["gdf"]
+    indices = gdf.sindex.query(shapely.box(*limites))
+    # Recorte con un pequeño margen para que los bordes de las teselas no se noten, y
+    # simplificación a la resolución de la tesela
+    margen = (xmax - xmin) * 8 / EXTENSION
+    geometrias = shapely.clip_by_rect(gdf.geometry.values[indices], xmin - margen, ymin - margen,
+                                      xmax + margen, ymax + margen)
+    geometrias = shapely.simplify(geometrias, (xmax - xmin) / EXTENSION)
+    features = []
+    for indice, geometria in zip(indices, geometrias):
+        if geometria is None or geometria.is_empty:
+            continue
+        fila = gdf.iloc[indice]
+        propiedades = {p: (fila[p].item() if hasattr(fila[p], "item") else fila[p])
+                       for p in capa["propiedades"]}
+        features.append({"geometry": geometria, "properties": propiedades})
+    return features, limites
+
+
+def tesela(servidor, clave, z, tx, ty):
+    # Bytes de la tesela (MVT); None si la capa no está registrada
+    llave = (clave, z, tx, ty)
+    with servidor["candado"]:
+        if llave in servidor["teselas"]:
+            servidor["teselas"].move_to_end(llave)
+            return servidor["teselas"][llave]
+        capa = servidor["capas"].get(clave)
+    if capa is None:
+        return None
+
+    armar = _capa_puntos if capa["tipo"] == "puntos" else _capa_poligonos
+    features, limites = armar(capa, z, tx, ty)
+    datos = mapbox_vector_tile.encode(
+        [{"name": "capa", "features": features}],
+        default_options={"quantize_bounds": limites, "extents": EXTENSION})
+
+    with servidor["candado"]:
+        servidor["teselas"][llave] = datos
+        if len(servidor["teselas"]) > MAX_TESELAS_EN_MEMORIA:
+            servidor["teselas"].popitem(last=False)
+    return datos
+
+
+# --- SERVIDOR HTTP ---
+def _manejador(servidor):
+    class Manejador(BaseHTTPRequestHandler):
+        # GET /<clave>/<z>/<x>/<y>.pbf
+        def do_GET(self):
+            partes = self.path.split("?")[0].strip("/").split("/")
+            try:
+                clave, z, tx = partes[0], int(partes[1]), int(partes[2])
+                ty = int(partes[3].removesuffix(".pbf"))
+            except (IndexError, ValueError):
+                self.send_error(400)
+                return
+            datos = tesela(servidor, clave, z, tx, ty)
+            if datos is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-protobuf")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Cache-Control", "max-age=3600")
+            self.send_header("Content-Length", str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def log_message(self, *args):
+            pass
+
+    return Manejador
+
+
+def iniciar_servidor(puerto=PUERTO):
+    # Servidor en un hilo del proceso; si el puerto está ocupado usa uno libre
+    servidor = {"capas": OrderedDict(), "teselas": OrderedDict(), "candado": threading.Lock()}
+    try:
+        http = ThreadingHTTPServer(("127.0.0.1", puerto), _manejador(servidor))
+    except OSError:
+        http = ThreadingHTTPServer(("127.0.0.1", 0), _manejador(servidor))
+    http.daemon_threads = True
+    threading.Thread(target=http.serve_forever, daemon=True).start()
+    servidor["http"] = http
+    servidor["url"] = (URL_PUBLICA or f"http://localhost:{http.server_address[1]}").rstrip("/")
+    return servidor
+
+
+def url_capa(servidor, clave):
+    return f"{servidor['url']}/{clave}/{{z}}/{{x}}/{{y}}.pbf"
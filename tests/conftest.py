@@ -0,0 +1,35 @@
+# Las pruebas importan los módulos de la raíz del repositorio, igual que la app
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datos import RUTA_BARRIOS, RUTA_CRIMENES, leer_crimenes, leer_tabla, normalizar_crimenes
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session")
+def crimenes():
+    # Los 1000 crímenes de ejemplo del repositorio, normalizados
+    return normalizar_crimenes(leer_crimenes(os.path.join(RAIZ, RUTA_CRIMENES)))
+
+
+@pytest.fixture(scope="session")
+def tabla_crimenes():
+    # Los mismos crímenes como tabla, con las columnas de un CSV de entrada
+    tabla = leer_tabla(os.path.join(RAIZ, RUTA_CRIMENES)).drop(columns="geometry")
+    tabla["fecha"] = tabla["fecha"].astype(str).str[:10]
+    return tabla
+
+
+@pytest.fixture
+def artefactos(tmp_path):
+    # Artefactos de precomputar.py (sin pronósticos) en un directorio temporal
+    from precomputar import precalcular
+
+    directorio = str(tmp_path / "artefactos")
+    precalcular(os.path.join(RAIZ, RUTA_CRIMENES), os.path.join(RAIZ, RUTA_BARRIOS), directorio, [])
+    return directorio
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from almacen import (abrir_almacen, conteo_barrios, conteo_semana_hora, construir_almacen, cuadros_tiempo,
+                     materializar, seleccionar, valores_presentes)
+from datos import (RUTA_BARRIOS, aplicar_filtros, cargar_barrios, con_geometria, normalizar_crimenes,
+                   unir_barrios)
+from ingesta import ingerir
+from mapas import popup_crimen
+from precomputar import ALMACEN
+
+from conftest import RAIZ
+
+
+def test_semana_hora_como_pandas(crimenes):
+    almacen = construir_almacen(crimenes)
+    esperado = pd.crosstab(crimenes["fecha_dt"].dt.dayofweek, crimenes["hora_h"]) \
+        .reindex(index=range(7), columns=range(24), fill_value=0).to_numpy()
+    np.testing.assert_array_equal(conteo_semana_hora(almacen, np.arange(almacen["n"])), esperado)
+
+
+def test_semana_hora_ignora_horas_faltantes_del_lote(artefactos, tabla_crimenes, tmp_path):
+    # Las horas faltantes de un lote agregado se guardan como -1 en la columna entera
+    antes = abrir_almacen(os.path.join(artefactos, ALMACEN))
+    matriz_antes = conteo_semana_hora(antes, np.arange(antes["n"]))
+
+    lote = tabla_crimenes.head(2).copy()
+    lote["id"] = [900_001, 900_002]
+    lote["fecha"] = ["2024-06-03", "2024-06-04"]  # lunes y martes
+    lote["dia_semana"] = [0, 1]
+    lote["hora"] = np.nan
+    lote["edad"] = [30, 31]
+    ruta = str(tmp_path / "lote.csv")
+    lote.to_csv(ruta, index=False)
+    assert ingerir(ruta, artefactos)["nuevos"] == 2
+
+    despues = abrir_almacen(os.path.join(artefactos, ALMACEN))
+    assert (despues["valores"]["hora_h"][-2:] == -1).all()
+    np.testing.assert_array_equal(conteo_semana_hora(despues, np.arange(despues["n"])), matriz_antes)
+
+
+def test_cuadros_tiempo(crimenes):
+    almacen = construir_almacen(crimenes)
+    filas = seleccionar(almacen, {})
+    fechas = pd.to_datetime(almacen["valores"]["fecha_dt"])
+    for granularidad in ("Diaria", "Semanal"):
+        cuadros = cuadros_tiempo(almacen, filas, granularidad)
+        inicios = cuadros["inicios"]
+        assert inicios[-1] == len(filas) and len(inicios) == len(cuadros["fechas"]) + 1
+        assert np.array_equal(np.sort(cuadros["filas"]), filas)
+        for i, etiqueta in enumerate(cuadros["fechas"]):
+            del_cuadro = fechas[cuadros["filas"][inicios[i]:inicios[i + 1]]].normalize()
+            if granularidad == "Diaria":
+                assert (del_cuadro == etiqueta).all()
+            else:
+                # Semanas de lunes a domingo etiquetadas con el domingo
+                assert etiqueta.dayofweek == 6
+                assert ((etiqueta - del_cuadro).days.isin(range(7))).all()
+
+
+def test_materializar_y_valores_presentes(crimenes):
+    almacen = construir_almacen(crimenes)
+    filas = seleccionar(almacen, {"sexo": "F"})
+    gdf = materializar(almacen, filas)
+    assert list(gdf.index) == list(filas)
+    assert valores_presentes(almacen, filas, "tipo_crimen") == sorted(gdf["tipo_crimen"].dropna().unique())
+    assert valores_presentes(almacen, filas[:0], "tipo_crimen") == []
+
+
+def test_subida_sin_barrio_sexo_ni_edad(tabla_crimenes):
+    # Solo las columnas requeridas: el barrio sale de los polígonos y los filtros o el
+    # popup de columnas que no vienen no fallan
+    tabla = tabla_crimenes[["id", "fecha", "hora", "tipo_crimen", "longitud", "latitud"]]
+    gdf = normalizar_crimenes(unir_barrios(con_geometria(tabla), cargar_barrios(os.path.join(RAIZ, RUTA_BARRIOS))))
+    almacen = construir_almacen(gdf)
+    filtros = {"sexo": "F", "tipo_crimen": "Hurto simple"}
+    filas = seleccionar(almacen, filtros)
+    np.testing.assert_array_equal(filas, aplicar_filtros(gdf, filtros).index)
+    assert len(conteo_barrios(almacen, filas)) > 0
+    assert "N/A" in popup_crimen(materializar(almacen, filas[:1]).iloc[0]).html.render()
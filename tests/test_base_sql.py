@@ -0,0 +1,125 @@
+import datetime
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import base_sql
+from almacen import abrir_almacen, conteo_barrios, construir_almacen, seleccionar
+from base_sql import BASE_SQL, abrir_base, conteo_barrios_sql, crear_base, seleccionar_sql
+from datos import RUTA_BARRIOS, RUTA_CRIMENES, cargar_barrios, unir_barrios
+from ingesta import ingerir
+from precomputar import ALMACEN, precalcular
+
+from conftest import RAIZ
+
+FILTROS = [
+    {},
+    {"barrio": "La Chinita", "tipo_crimen": "Hurto simple"},
+    # Un valor con comilla va como parámetro, no dentro del texto de la consulta
+    {"barrio": "O'Hara"},
+    {"sexo": "M", "horas": (20, 23)},
+    {"rango_fecha": (datetime.date(2024, 9, 1), datetime.date(2024, 12, 31))},
+    {"sociales": {"lgtbi": True, "habitante_calle": False}},
+]
+
+
+@pytest.fixture(scope="module")
+def con_barrios(crimenes):
+    return unir_barrios(crimenes, cargar_barrios(os.path.join(RAIZ, RUTA_BARRIOS))).reset_index(drop=True)
+
+
+@pytest.fixture(scope="module")
+def base(con_barrios, tmp_path_factory):
+    ruta = str(tmp_path_factory.mktemp("sql") / BASE_SQL)
+    crear_base(con_barrios, ruta)
+    return abrir_base(ruta)
+
+
+@pytest.mark.parametrize("filtros", FILTROS)
+def test_mismas_filas_y_conteos_que_el_almacen(con_barrios, base, filtros):
+    almacen = construir_almacen(con_barrios)
+    filas = seleccionar(almacen, filtros)
+    np.testing.assert_array_equal(seleccionar_sql(base, filtros), filas)
+    pd.testing.assert_frame_equal(
+        conteo_barrios_sql(base, filtros).sort_values("barrio", ignore_index=True),
+        conteo_barrios(almacen, filas).sort_values("barrio", ignore_index=True),
+        check_dtype=False)
+
+
+def test_ingesta_anexa_con_los_mismos_numeros_de_fila(tmp_path, tabla_crimenes):
+    directorio = str(tmp_path / "artefactos")
+    precalcular(os.path.join(RAIZ, RUTA_CRIMENES), os.path.join(RAIZ, RUTA_BARRIOS), directorio, [],
+                sql=True)
+    lote = tabla_crimenes.head(30).assign(id=lambda t: t["id"] + 800_000, fecha="2025-04-07")
+    lote.to_csv(tmp_path / "lote.csv", index=False)
+    assert ingerir(str(tmp_path / "lote.csv"), directorio)["nuevos"] == 30
+
+    almacen = abrir_almacen(os.path.join(directorio, ALMACEN))
+    base = abrir_base(os.path.join(directorio, BASE_SQL))
+    for filtros in FILTROS + [{"rango_fecha": (datetime.date(2025, 4, 7), datetime.date(2025, 4, 7))}]:
+        np.testing.assert_array_equal(seleccionar_sql(base, filtros), seleccionar(almacen, filtros))
+
+
+def test_consultas_acotadas_al_almacen_abierto(base):
+    # Filas agregadas a la base por una ingesta que aún no publica su `n` no se ven
+    acotada = abrir_base(base["ruta"], filas=600)
+    np.testing.assert_array_equal(seleccionar_sql(acotada, {}), np.arange(600))
+    assert conteo_barrios_sql(acotada, {})["cantidad_crimenes"].sum() <= 600
+
+
+class DuckDBFalso:
+    # Imita la restricción de DuckDB: en un proceso no conviven una conexión de solo
+    # lectura y una de escritura al mismo archivo
+    class Error(Exception):
+        pass
+
+    def __init__(self):
+        self.abiertas = []
+        self.candado = threading.Lock()
+
+    def connect(self, ruta, read_only=False):
+        with self.candado:
+            if any(modo != read_only for modo in self.abiertas):
+                raise self.Error("Can't open a connection to same database file with a different configuration")
+            self.abiertas.append(read_only)
+        time.sleep(0.002)
+        abiertas, candado = self.abiertas, self.candado
+
+        class Conexion:
+            def execute(self, *args):
+                return self
+
+            def commit(self):
+                pass
+
+            def close(self):
+                with candado:
+                    abiertas.remove(read_only)
+
+        return Conexion()
+
+
+def test_conexiones_duckdb_no_se_cruzan_en_el_proceso(monkeypatch):
+    falso = DuckDBFalso()
+    monkeypatch.setattr(base_sql, "duckdb", falso)
+    monkeypatch.setattr(base_sql, "MOTOR", "duckdb")
+    errores = []
+
+    def usar(solo_lectura):
+        for _ in range(20):
+            try:
+                with base_sql._conexion("base.db", solo_lectura=solo_lectura) as con:
+                    con.execute("SELECT 1")
+            except falso.Error as error:
+                errores.append(error)
+
+    hilos = [threading.Thread(target=usar, args=(i > 0,)) for i in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert errores == [] and falso.abiertas == []
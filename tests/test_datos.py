@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from datos import (FILTROS_VACIOS, GRANULARIDADES, aplicar_filtros, conteos_horarios, cubo_conteos,
+                   rango_periodos, remuestrear, serie_filtrada)
+
+FILTROS = [
+    {},
+    {"tipo_crimen": "Hurto simple"},
+    {"sexo": "F", "horas": (6, 18)},
+    {"sociales": {"habitante_calle": True}},
+]
+
+
+def serie_pandas(crimenes, filtros, granularidad):
+    # La misma serie agrupando las filas crudas, para comparar con el cubo
+    sub = aplicar_filtros(crimenes, dict(FILTROS_VACIOS, **filtros))
+    momento = sub["fecha_dt"].dt.normalize() + pd.to_timedelta(sub["hora_h"], unit="h")
+    freq = GRANULARIDADES[granularidad][0]
+    return pd.Series(1, index=momento).groupby(pd.Grouper(freq=freq)).sum()
+
+
+@pytest.mark.parametrize("granularidad", list(GRANULARIDADES))
+@pytest.mark.parametrize("filtros", FILTROS)
+def test_serie_del_cubo_como_pandas(crimenes, filtros, granularidad):
+    cubo = cubo_conteos(crimenes)
+    serie = serie_filtrada(cubo, filtros, granularidad)
+    esperado = serie_pandas(crimenes, filtros, granularidad)
+
+    _, fechas = rango_periodos(cubo, granularidad)
+    pd.testing.assert_index_equal(pd.DatetimeIndex(serie["ds"]), fechas, check_names=False)
+    assert serie["y"].sum() == esperado.sum()
+    np.testing.assert_array_equal(
+        serie.set_index("ds")["y"].reindex(esperado.index).to_numpy(), esperado.to_numpy())
+
+
+def test_semanas_de_lunes_a_domingo(crimenes):
+    cubo = cubo_conteos(crimenes)
+    assert cubo.attrs["origen"].dayofweek == 0
+    _, fechas = rango_periodos(cubo, "Semanal")
+    assert (fechas.dayofweek == 6).all()
+
+
+def test_cubo_incremental_se_suma_al_base(crimenes):
+    corte = crimenes["fecha_dt"].quantile(0.7)
+    base = cubo_conteos(crimenes[crimenes["fecha_dt"] < corte])
+    lote = cubo_conteos(crimenes[crimenes["fecha_dt"] >= corte], origen=base.attrs["origen"])
+    total = pd.concat([base, lote], ignore_index=True)
+    total.attrs.update(origen=base.attrs["origen"], n_horas=lote.attrs["n_horas"])
+
+    completo = cubo_conteos(crimenes)
+    for filtros in FILTROS:
+        np.testing.assert_array_equal(conteos_horarios(total, filtros), conteos_horarios(completo, filtros))
+
+
+def test_remuestrear_conserva_el_total():
+    cubo = pd.DataFrame({"hora_idx": [5, 30, 200, 24 * 7 * 3 - 1], "y": [1, 2, 3, 4]})
+    cubo.attrs.update(origen=pd.Timestamp("2024-01-01"), n_horas=24 * 7 * 3)
+    conteos = conteos_horarios(cubo, {})
+    for granularidad in GRANULARIDADES:
+        assert remuestrear(conteos, cubo, granularidad)["y"].sum() == 10
+    semanal = remuestrear(conteos, cubo, "Semanal")
+    assert semanal["y"].tolist() == [3, 3, 4]
+    assert semanal["ds"].iloc[0] == pd.Timestamp("2024-01-07")
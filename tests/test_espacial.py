@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import Point, box, shape
+
+from espacial import (RADIO_TIERRA_M, TAMANOS_HEX, ampliar, area_dibujada, construir_arbol, construir_rejilla,
+                      contiene, conteo_hex, densidad_kde, filas_en_area, filas_en_limites, filas_en_radio,
+                      filas_en_rectangulo, indice_hex, limites_datos, limites_mapa)
+
+
+@pytest.fixture(scope="module")
+def puntos():
+    # Puntos al azar en Barranquilla, con algunos sin coordenadas
+    rng = np.random.default_rng(7)
+    x = rng.uniform(-74.90, -74.75, 20_000)
+    y = rng.uniform(10.90, 11.05, 20_000)
+    x[::997] = np.nan
+    y[::1009] = np.nan
+    return x, y
+
+
+def dentro_fuerza_bruta(geometria, x, y):
+    validos = ~(np.isnan(x) | np.isnan(y))
+    return np.flatnonzero(validos & shapely.intersects_xy(geometria, np.nan_to_num(x), np.nan_to_num(y)))
+
+
+@pytest.mark.parametrize("geometria", [
+    Point(-74.82, 10.98).buffer(0.02),
+    box(-74.90, 10.90, -74.89, 11.05),
+    Point(-74.80, 11.00).buffer(0.01) | Point(-74.86, 10.93).buffer(0.015),
+    box(-74.60, 10.90, -74.55, 11.00),
+])
+def test_area_como_fuerza_bruta(puntos, geometria):
+    x, y = puntos
+    rejilla = construir_rejilla(x, y)
+    np.testing.assert_array_equal(filas_en_area(rejilla, x, y, geometria), dentro_fuerza_bruta(geometria, x, y))
+
+
+def test_rejilla_con_cada_fila_una_vez(puntos):
+    x, y = puntos
+    rejilla = construir_rejilla(x, y)
+    validos = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+    np.testing.assert_array_equal(np.sort(rejilla["orden"]), validos)
+    todo = filas_en_rectangulo(rejilla, -180, -90, 180, 90)
+    np.testing.assert_array_equal(np.sort(todo), validos)
+
+
+def test_area_dibujada_une_solo_figuras_con_area():
+    dibujos = [
+        {"geometry": shapely.geometry.mapping(box(0, 0, 2, 2))},
+        {"geometry": shapely.geometry.mapping(box(1, 1, 3, 3))},
+        {"geometry": {"type": "Point", "coordinates": [5, 5]}},
+    ]
+    assert area_dibujada(dibujos).area == pytest.approx(7)
+    assert area_dibujada([dibujos[2]]) is None and area_dibujada(None) is None
+
+
+def haversine_m(lon, lat, x, y):
+    lon, lat, x, y = map(np.radians, (lon, lat, x, y))
+    a = np.sin((y - lat) / 2) ** 2 + np.cos(lat) * np.cos(y) * np.sin((x - lon) / 2) ** 2
+    return 2 * RADIO_TIERRA_M * np.arcsin(np.sqrt(a))
+
+
+@pytest.mark.parametrize("radio_m", [50, 500, 2000])
+def test_radio_como_fuerza_bruta(puntos, radio_m):
+    x, y = puntos
+    arbol = construir_arbol(x, y)
+    filas, distancias = filas_en_radio(arbol, -74.82, 10.98, radio_m)
+    todas = haversine_m(-74.82, 10.98, x, y)
+    np.testing.assert_array_equal(filas, np.flatnonzero(todas <= radio_m))
+    np.testing.assert_allclose(distancias, todas[filas], rtol=1e-9)
+
+
+def test_radio_sin_puntos():
+    vacio = construir_arbol(np.array([np.nan]), np.array([np.nan]))
+    filas, distancias = filas_en_radio(vacio, -74.82, 10.98, 1000)
+    assert len(filas) == 0 and len(distancias) == 0
+
+
+@pytest.mark.parametrize("limites", [
+    (-74.83, 10.97, -74.81, 10.99),
+    (-74.95, 10.85, -74.85, 10.95),
+    (-74.80001, 11.0, -74.8, 11.00001),
+    (-74.60, 10.90, -74.55, 11.00),
+])
+def test_limites_como_fuerza_bruta(puntos, limites):
+    x, y = puntos
+    xmin, ymin, xmax, ymax = limites
+    esperado = np.flatnonzero((x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax))
+    np.testing.assert_array_equal(filas_en_limites(construir_rejilla(x, y), x, y, limites), esperado)
+
+
+def test_limites_del_mapa():
+    bounds = {"_southWest": {"lng": -74.9, "lat": 10.9}, "_northEast": {"lng": -74.7, "lat": 11.1}}
+    limites = limites_mapa(bounds)
+    assert limites == (-74.9, 10.9, -74.7, 11.1)
+    assert limites_mapa(None) is None and limites_mapa({}) is None
+    assert limites_mapa({"_southWest": bounds["_northEast"], "_northEast": bounds["_southWest"]}) is None
+
+    amplio = ampliar(limites, 0.5)
+    assert amplio == pytest.approx((-75.0, 10.8, -74.6, 11.2))
+    assert contiene(amplio, limites) and not contiene(limites, amplio)
+
+
+def test_densidad_conserva_los_crimenes(puntos):
+    x, y = puntos
+    kde = densidad_kde(x, y, limites_datos(x, y))
+    area_celda_km2 = (kde["celda_m"] / 1000) ** 2
+    validos = ~(np.isnan(x) | np.isnan(y))
+    assert kde["densidad"].sum(dtype=np.float64) * area_celda_km2 == pytest.approx(validos.sum(), rel=1e-4)
+
+
+def test_densidad_de_un_punto():
+    x, y = np.array([-74.8]), np.array([11.0])
+    kde = densidad_kde(x, y, (-74.85, 10.95, -74.75, 11.05), ancho_banda_m=250, celda_m=25)
+    densidad = kde["densidad"]
+    fila, columna = np.unravel_index(np.argmax(densidad), densidad.shape)
+    xmin, ymin, xmax, ymax = kde["limites"]
+    ancho, alto = (xmax - xmin) / densidad.shape[1], (ymax - ymin) / densidad.shape[0]
+    # El máximo está en la celda del punto y vale lo de una gaussiana de 250 m, por km²
+    assert int((x[0] - xmin) // ancho) == columna and int((y[0] - ymin) // alto) == fila
+    assert densidad.max() == pytest.approx(1e6 / (2 * np.pi * 250 ** 2), rel=0.05)
+
+
+def test_cada_punto_cae_en_su_hexagono(puntos):
+    x, y = puntos[0][:3000], puntos[1][:3000]
+    indice = indice_hex(x, y)
+    validos = ~(np.isnan(x) | np.isnan(y))
+    for tamano in TAMANOS_HEX:
+        celdas = indice[tamano]
+        codigos = celdas["codigos"]
+        assert (codigos[~validos] == -1).all() and (codigos[validos] >= 0).all()
+        hexagonos = np.array([shape(g) for g in celdas["geometrias"]], dtype=object)
+        # Tolerancia por el redondeo de los vértices a 6 decimales
+        cerca = shapely.dwithin(hexagonos[codigos[validos]], shapely.points(x[validos], y[validos]), 1e-5)
+        assert cerca.all()
+        # Todas las celdas guardadas tienen algún punto
+        assert (np.bincount(codigos[validos], minlength=len(hexagonos)) > 0).all()
+
+
+def test_conteo_hex_de_unas_filas(puntos):
+    x, y = puntos
+    celdas = indice_hex(x, y, tamanos=[500])[500]
+    filas = np.arange(0, len(x), 3)
+    resto = np.setdiff1d(np.arange(len(x)), filas)
+    todas = conteo_hex(celdas, np.arange(len(x)))
+    assert todas.sum() == (~(np.isnan(x) | np.isnan(y))).sum()
+    assert len(todas) == len(celdas["geometrias"])
+    np.testing.assert_array_equal(conteo_hex(celdas, filas) + conteo_hex(celdas, resto), todas)
@@ -0,0 +1,41 @@
+import os
+
+import pandas as pd
+import pytest
+import shapely
+
+from datos import RUTA_BARRIOS, RUTA_CRIMENES, cargar_barrios
+from generar_sintetico import COLUMNAS, generar
+from validacion import validar
+
+from conftest import RAIZ
+
+
+def sinteticos(n, semilla=0, tamano_bloque=1000):
+    return pd.concat(list(generar(n, semilla=semilla, ruta_barrios=os.path.join(RAIZ, RUTA_BARRIOS),
+                                  ruta_referencia=os.path.join(RAIZ, RUTA_CRIMENES),
+                                  tamano_bloque=tamano_bloque)), ignore_index=True)
+
+
+@pytest.fixture(scope="module")
+def tabla():
+    return sinteticos(2500)
+
+
+def test_misma_semilla_mismos_crimenes(tabla):
+    pd.testing.assert_frame_equal(sinteticos(2500), tabla)
+    assert not sinteticos(2500, semilla=1).equals(tabla)
+    assert list(tabla.columns) == COLUMNAS and tabla["id"].is_unique
+
+
+def test_pasa_la_validacion(tabla, tabla_crimenes):
+    informe, validas = validar(tabla, tabla_crimenes["tipo_crimen"].unique())
+    assert validas.all()
+    assert (informe["severidad"] != "error").all()
+
+
+def test_cada_punto_dentro_de_su_barrio(tabla):
+    # Algunos nombres se repiten en varios polígonos: basta con caer en uno de ellos
+    poligonos = cargar_barrios(os.path.join(RAIZ, RUTA_BARRIOS)).dissolve("NOMBRE").geometry
+    geometrias = poligonos.reindex(tabla["barrio"]).to_numpy()
+    assert shapely.contains_xy(geometrias, tabla["longitud"].to_numpy(), tabla["latitud"].to_numpy()).all()
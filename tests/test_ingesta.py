@@ -0,0 +1,125 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingesta
+from almacen import abrir_almacen
+from base_sql import BASE_SQL, abrir_base, seleccionar_sql
+from datos import RUTA_BARRIOS, RUTA_CRIMENES
+from ingesta import HUELLAS, INDICES, VACIO, buscar, crear_indice, ingerir, insertar, preparar_indices
+from precomputar import ALMACEN, precalcular
+
+from conftest import RAIZ
+
+
+def test_indice_hash_con_redimensionado():
+    rng = np.random.default_rng(0)
+    claves = rng.choice(np.iinfo(np.int64).max, size=5000, replace=False).astype(np.uint64)
+    indice = crear_indice(16)
+    for inicio in range(0, len(claves), 700):
+        lote = claves[inicio:inicio + 700]
+        indice = insertar(indice, lote, np.arange(inicio, inicio + len(lote)))
+    assert indice["n"] == len(claves)
+    assert len(indice["filas"]) >= 2 * len(claves)
+    np.testing.assert_array_equal(buscar(indice, claves), np.arange(len(claves)))
+    ausentes = np.arange(1, 1001, dtype=np.uint64) * np.uint64(7919)
+    ausentes = ausentes[~np.isin(ausentes, claves)]
+    assert (buscar(indice, ausentes) == VACIO).all()
+
+
+def test_indice_hash_claves_en_la_misma_ranura():
+    # Claves consecutivas en un índice chico compiten por las mismas ranuras
+    indice = insertar(crear_indice(64), np.arange(20, dtype=np.uint64), np.arange(20) * 10)
+    np.testing.assert_array_equal(buscar(indice, np.arange(20, dtype=np.uint64)), np.arange(20) * 10)
+
+
+def escribir_lote(tabla, ruta):
+    tabla.to_csv(ruta, index=False)
+    return ruta
+
+
+def test_duplicados_en_el_lote_y_en_el_almacen(artefactos, tabla_crimenes, tmp_path):
+    existentes = tabla_crimenes.head(3)
+    nuevo = tabla_crimenes.iloc[[3]].assign(id=500_000, fecha="2025-01-15")
+    # Mismo id que un crimen cargado pero otro contenido: decide la huella
+    choca = tabla_crimenes.iloc[[4]].assign(fecha="2025-02-01")
+    lote = pd.concat([existentes, nuevo, nuevo, choca], ignore_index=True)
+
+    resumen = ingerir(escribir_lote(lote, str(tmp_path / "lote.csv")), artefactos)
+    assert (resumen["nuevos"], resumen["duplicados"], resumen["colisiones_id"]) == (2, 4, 1)
+
+    # El mismo lote otra vez: todo es duplicado
+    resumen = ingerir(escribir_lote(lote, str(tmp_path / "lote.csv")), artefactos)
+    assert (resumen["nuevos"], resumen["duplicados"]) == (0, 6)
+    assert abrir_almacen(os.path.join(artefactos, ALMACEN))["n"] == 1002
+
+
+def test_lote_que_agranda_los_indices(artefactos, tabla_crimenes, tmp_path):
+    directorio_almacen = os.path.join(artefactos, ALMACEN)
+    capacidad = len(preparar_indices(directorio_almacen)["id"]["filas"])
+    copias = []
+    for anio in (1, 2):
+        copia = tabla_crimenes.copy()
+        copia["id"] = copia["id"] + anio * 100_000
+        copia["fecha"] = (pd.to_datetime(copia["fecha"]) + pd.DateOffset(years=anio)).dt.strftime("%Y-%m-%d")
+        copias.append(copia)
+    lote = escribir_lote(pd.concat(copias, ignore_index=True), str(tmp_path / "lote.csv"))
+
+    assert ingerir(lote, artefactos)["nuevos"] == 2000
+    indices = preparar_indices(directorio_almacen)
+    assert len(indices["id"]["filas"]) > capacidad and indices["id"]["n"] == 3000
+    assert ingerir(lote, artefactos)["nuevos"] == 0
+
+
+def test_ingestas_simultaneas(artefactos, tabla_crimenes, tmp_path):
+    lote = tabla_crimenes.head(50).assign(id=lambda t: t["id"] + 700_000, fecha="2025-03-03")
+    rutas = [escribir_lote(lote, str(tmp_path / f"lote{i}.csv")) for i in range(3)]
+    resumenes = []
+    hilos = [threading.Thread(target=lambda r=r: resumenes.append(ingerir(r, artefactos))) for r in rutas]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert sorted(r["nuevos"] for r in resumenes) == [0, 0, 50]
+    almacen = abrir_almacen(os.path.join(artefactos, ALMACEN))
+    assert almacen["n"] == 1050
+    assert len(np.unique(almacen["valores"]["id"])) == 1050
+
+
+@pytest.mark.parametrize("falla", ["anexar_base", "escribir_esquema", "insertar"])
+def test_ingesta_fallida_no_deja_filas_a_medias(tmp_path, tabla_crimenes, monkeypatch, falla):
+    directorio = str(tmp_path / "artefactos")
+    precalcular(os.path.join(RAIZ, RUTA_CRIMENES), os.path.join(RAIZ, RUTA_BARRIOS), directorio, [],
+                sql=True)
+    directorio_almacen = os.path.join(directorio, ALMACEN)
+    preparar_indices(directorio_almacen)
+    lote = escribir_lote(tabla_crimenes.head(20).assign(id=lambda t: t["id"] + 600_000, fecha="2025-03-03"),
+                         str(tmp_path / "lote.csv"))
+
+    def romper(*args, **kwargs):
+        raise OSError("disco lleno")
+
+    with monkeypatch.context() as m:
+        m.setattr(ingesta, falla, romper)
+        with pytest.raises(OSError):
+            ingerir(lote, directorio)
+    almacen = abrir_almacen(directorio_almacen)
+    assert almacen["n"] == 1000
+    base = abrir_base(os.path.join(directorio, BASE_SQL))
+    assert len(seleccionar_sql(base, {})) == 1000
+
+    # Reintentar agrega el lote una sola vez y las huellas siguen alineadas con las filas
+    assert ingerir(lote, directorio)["nuevos"] == 20
+    assert ingerir(lote, directorio)["nuevos"] == 0
+    almacen = abrir_almacen(directorio_almacen)
+    assert almacen["n"] == 1020
+    np.testing.assert_array_equal(seleccionar_sql(abrir_base(os.path.join(directorio, BASE_SQL)), {}),
+                                  np.arange(1020))
+    guardadas = np.fromfile(os.path.join(directorio_almacen, HUELLAS), dtype=np.uint64)
+    os.remove(os.path.join(directorio_almacen, INDICES))
+    preparar_indices(directorio_almacen)
+    np.testing.assert_array_equal(guardadas, np.fromfile(os.path.join(directorio_almacen, HUELLAS), dtype=np.uint64))
@@ -0,0 +1,93 @@
+import json
+import threading
+
+import pytest
+
+import instrumentacion
+from instrumentacion import finalizar_traza, iniciar_traza, medido, medir, traza_actual
+
+
+@pytest.fixture(autouse=True)
+def sin_traza():
+    yield
+    instrumentacion._traza_actual.set(None)
+
+
+def test_medir_sin_traza_no_registra():
+    with medir("etapa"):
+        pass
+    assert traza_actual() is None and finalizar_traza() is None
+
+
+def test_medir_registra_etapas_y_detalles():
+    traza = iniciar_traza("sesion", rerun_id="r1")
+
+    @medido("decorada")
+    def sumar(a, b):
+        return a + b
+
+    with medir("filtrar", filas=10):
+        assert sumar(1, 2) == 3
+    with pytest.raises(ValueError), medir("falla"):
+        raise ValueError
+    # La etapa interna termina primero; una etapa que falla también queda registrada
+    assert [e["etapa"] for e in traza["etapas"]] == ["decorada", "filtrar", "falla"]
+    assert traza["etapas"][1]["filas"] == 10
+    assert all(e["ms"] >= 0 for e in traza["etapas"])
+
+
+def test_finalizar_agrega_una_linea_jsonl(tmp_path):
+    ruta = str(tmp_path / "trazas.jsonl")
+    for rerun in ("r1", "r2"):
+        iniciar_traza("sesion", rerun_id=rerun)
+        with medir("carga_datos"):
+            pass
+        registro = finalizar_traza(ruta)
+        assert traza_actual() is None
+
+    lineas = [json.loads(linea) for linea in open(ruta, encoding="utf-8")]
+    assert [linea["rerun_id"] for linea in lineas] == ["r1", "r2"]
+    assert lineas[-1] == registro
+    assert set(registro) == {"rerun_id", "sesion_id", "inicio", "etapas", "total_ms"}
+    assert registro["sesion_id"] == "sesion" and registro["etapas"][0]["etapa"] == "carga_datos"
+
+
+def test_ruta_vacia_no_escribe(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    iniciar_traza()
+    assert finalizar_traza("")["etapas"] == []
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_archivo_rota_al_pasar_el_limite(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentacion, "MAX_BYTES_TRAZAS", 1000)
+    ruta = tmp_path / "trazas.jsonl"
+    for i in range(50):
+        iniciar_traza(rerun_id=f"r{i}")
+        finalizar_traza(str(ruta))
+    assert ruta.stat().st_size < 1000 + 200
+    assert (tmp_path / "trazas.jsonl.1").stat().st_size < 1000 + 200
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["trazas.jsonl", "trazas.jsonl.1"]
+    # La última traza queda en el archivo actual
+    assert json.loads(ruta.read_text(encoding="utf-8").splitlines()[-1])["rerun_id"] == "r49"
+
+
+def test_cada_hilo_tiene_su_traza(tmp_path):
+    ruta = str(tmp_path / "trazas.jsonl")
+    iniciar_traza("principal")
+
+    def sesion(nombre):
+        iniciar_traza(nombre)
+        with medir(nombre):
+            pass
+        finalizar_traza(ruta)
+
+    hilos = [threading.Thread(target=sesion, args=(f"s{i}",)) for i in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    lineas = [json.loads(linea) for linea in open(ruta, encoding="utf-8")]
+    assert sorted(linea["sesion_id"] for linea in lineas) == ["s0", "s1", "s2", "s3"]
+    assert all([e["etapa"] for e in linea["etapas"]] == [linea["sesion_id"]] for linea in lineas)
+    assert traza_actual()["sesion_id"] == "principal" and traza_actual()["etapas"] == []
@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pytest
+
+from datos import FILTROS_VACIOS, RUTA_BARRIOS, cargar_barrios, cubo_conteos, unir_barrios
+from jerarquia import construir_jerarquia, pronostico_jerarquico, reconciliar_bottom_up, reconciliar_mint
+
+from conftest import RAIZ
+
+BARRIOS = ["A", "B", "C"]
+TIPOS = ["hurto", "riña"]
+ZONAS = {"A": "Norte", "B": "Norte", "C": "Sur"}
+
+
+def test_matriz_de_suma():
+    S, etiquetas = construir_jerarquia(BARRIOS, TIPOS, ZONAS)
+    assert S.shape == (1 + 2 + 3 + 2 + 6, 6)
+    assert list(etiquetas["nivel"].value_counts().sort_index()) == [3, 6, 1, 2, 2]
+    inferior = np.arange(1.0, 7.0)
+    total = dict(zip(etiquetas["nombre"], S @ inferior))
+    assert total["Barranquilla"] == inferior.sum()
+    assert total["Norte"] == inferior[:4].sum() and total["Sur"] == inferior[4:].sum()
+    assert total["hurto"] == inferior[::2].sum()
+
+
+def test_mint_como_la_formula_densa():
+    rng = np.random.default_rng(1)
+    S, _ = construir_jerarquia(BARRIOS, TIPOS, ZONAS)
+    base = rng.normal(10, 3, size=(S.shape[0], 4))
+    residuos = rng.normal(0, rng.uniform(0.5, 3, size=(S.shape[0], 1)), size=(S.shape[0], 20))
+
+    Sd = S.toarray()
+    W_inv = np.diag(1 / residuos.var(axis=1))
+    esperado = Sd @ np.linalg.solve(Sd.T @ W_inv @ Sd, Sd.T @ W_inv @ base)
+    mint = reconciliar_mint(S, base, residuos)
+    np.testing.assert_allclose(mint, esperado, rtol=1e-6)
+    np.testing.assert_allclose(reconciliar_bottom_up(S, mint), mint, rtol=1e-9)
+
+
+@pytest.mark.parametrize("metodo", ["Tendencia lineal", "Promedio"])
+def test_pronostico_coherente_y_no_negativo(crimenes, metodo):
+    gdf_barrios = cargar_barrios(os.path.join(RAIZ, RUTA_BARRIOS))
+    cubo = cubo_conteos(unir_barrios(crimenes, gdf_barrios))
+    resultado = pronostico_jerarquico(cubo, FILTROS_VACIOS, gdf_barrios, 8, 4, metodo=metodo)
+
+    for columna in ("bottom_up", "mint"):
+        assert (resultado[columna] >= 0).all()
+        por_nivel = resultado.groupby(["nivel", "ds"])[columna].sum().unstack("nivel")
+        for nivel in ("zona", "barrio", "tipo", "barrio_tipo"):
+            np.testing.assert_allclose(por_nivel[nivel], por_nivel["ciudad"], rtol=1e-9, atol=1e-9)
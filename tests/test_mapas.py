@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from almacen import conteo_barrios, construir_almacen, seleccionar
+from datos import RUTA_BARRIOS, cargar_barrios, unir_barrios
+from mapas import LEYENDA_SEMAFORO, clave_semaforo, html_semaforo, semaforizar_conteos
+
+from conftest import RAIZ
+
+
+@pytest.fixture(scope="module")
+def barrios():
+    return cargar_barrios(os.path.join(RAIZ, RUTA_BARRIOS))
+
+
+@pytest.fixture(scope="module")
+def almacen(crimenes, barrios):
+    return construir_almacen(unir_barrios(crimenes, barrios).reset_index(drop=True))
+
+
+def semaforo(almacen, barrios, filtros):
+    # Como la app: cada rerun arma un GeoDataFrame nuevo con los conteos de los filtros
+    return semaforizar_conteos(conteo_barrios(almacen, seleccionar(almacen, filtros)), barrios)
+
+
+def test_clave_semaforo(almacen, barrios):
+    base = clave_semaforo(semaforo(almacen, barrios, {}), "base:1")
+    # Mismos filtros, o filtros distintos con los mismos conteos: el mismo mapa
+    assert clave_semaforo(semaforo(almacen, barrios, {}), "base:1") == base
+    assert clave_semaforo(semaforo(almacen, barrios, {"sociales": {"lgtbi": False}}), "base:1") == base
+    # Cambian los conteos, la marca de los datos o el modo: otra clave
+    claves = {
+        base,
+        clave_semaforo(semaforo(almacen, barrios, {"tipo_crimen": "Hurto simple"}), "base:1"),
+        clave_semaforo(semaforo(almacen, barrios, {"horas": (20, 23)}), "base:1"),
+        clave_semaforo(semaforo(almacen, barrios, {}), "base:2"),
+        clave_semaforo(semaforo(almacen, barrios, {}), "subida:abc"),
+        clave_semaforo(semaforo(almacen, barrios, {}), "base:1", teselas=True),
+    }
+    assert len(claves) == 6
+
+
+def test_html_semaforo(almacen, barrios):
+    gdf = semaforo(almacen, barrios, {"tipo_crimen": "Hurto simple"})
+    html = html_semaforo(gdf, barrios)
+    assert html.startswith("<!DOCTYPE html>") and "Semaforización de Crímenes" in html
+    assert LEYENDA_SEMAFORO.strip() in html
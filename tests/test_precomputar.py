@@ -0,0 +1,91 @@
+import os
+import shutil
+
+import pandas as pd
+
+import precomputar
+from datos import RUTA_BARRIOS, con_geometria, id_serie, leer_crimenes
+from precomputar import cargar_artefactos, precalcular
+
+from conftest import RAIZ
+
+
+def crimenes_copiados(tmp_path):
+    ruta = str(tmp_path / "crimenes.geojson")
+    shutil.copyfile(os.path.join(RAIZ, "crimenes.geojson"), ruta)
+    return ruta
+
+
+def test_abrir_no_lee_el_archivo_de_crimenes(tmp_path, monkeypatch):
+    ruta = crimenes_copiados(tmp_path)
+    directorio = str(tmp_path / "artefactos")
+    precalcular(ruta, os.path.join(RAIZ, RUTA_BARRIOS), directorio, [])
+
+    def prohibido(ruta):
+        raise AssertionError("no se debe calcular el hash al abrir")
+
+    monkeypatch.setattr(precomputar, "hash_archivo", prohibido)
+    artefactos = cargar_artefactos(ruta, directorio)
+    assert artefactos is not None and artefactos["almacen"]["n"] == 1000
+
+
+def test_firma_distinta_compara_el_hash(tmp_path):
+    ruta = crimenes_copiados(tmp_path)
+    directorio = str(tmp_path / "artefactos")
+    precalcular(ruta, os.path.join(RAIZ, RUTA_BARRIOS), directorio, [])
+
+    # Mismo contenido con otra fecha: los artefactos siguen sirviendo
+    os.utime(ruta, (0, 0))
+    assert cargar_artefactos(ruta, directorio) is not None
+
+    # Otro contenido: hay que volver a precalcular
+    with open(ruta, "a", encoding="utf-8") as f:
+        f.write("\n")
+    assert cargar_artefactos(ruta, directorio) is None
+
+
+def test_pronosticos_solo_en_el_registro(tmp_path, monkeypatch, tabla_crimenes):
+    from ingesta import ingerir
+    from registro_modelos import ultimo_modelo
+
+    monkeypatch.chdir(tmp_path)
+    ruta = crimenes_copiados(tmp_path)
+    manifiesto = precalcular(ruta, os.path.join(RAIZ, RUTA_BARRIOS), "artefactos", ["Regresión lineal"])
+    assert manifiesto["series_pronosticadas"] > 0
+    assert not [a for a in os.listdir("artefactos") if a.endswith(".csv")]
+    assert ultimo_modelo(id_serie({}), "Regresión lineal") is not None
+
+    lote = tabla_crimenes.head(20).assign(id=lambda t: t["id"] + 900_000, fecha="2025-03-03")
+    lote.to_csv("lote.csv", index=False)
+    resumen = ingerir("lote.csv", "artefactos", os.path.join(RAIZ, RUTA_BARRIOS))
+    assert id_serie({}) in resumen["series_actualizadas"]
+    assert not [a for a in os.listdir("artefactos") if a.endswith(".csv")]
+
+
+def test_reconstruir_conserva_los_lotes_ingeridos(tmp_path, tabla_crimenes):
+    from ingesta import ingerir
+
+    ruta = crimenes_copiados(tmp_path)
+    directorio = str(tmp_path / "artefactos")
+    barrios = os.path.join(RAIZ, RUTA_BARRIOS)
+    precalcular(ruta, barrios, directorio, [])
+    lote = tabla_crimenes.head(20).assign(id=lambda t: t["id"] + 900_000, fecha="2025-03-03")
+    lote.loc[lote.index[:5], "hora"] = None
+    lote.to_csv(tmp_path / "lote.csv", index=False)
+    assert ingerir(str(tmp_path / "lote.csv"), directorio, barrios)["nuevos"] == 20
+
+    # La reconstrucción nocturna solo lee el archivo original, pero no pierde el lote
+    manifiesto = precalcular(ruta, barrios, directorio, [])
+    assert (manifiesto["filas"], manifiesto["filas_origen"], len(manifiesto["ingestas"])) == (1020, 1000, 1)
+    assert cargar_artefactos(ruta, directorio)["almacen"]["n"] == 1020
+    assert precalcular(ruta, barrios, directorio, [])["filas"] == 1020
+    assert ingerir(str(tmp_path / "lote.csv"), directorio, barrios)["nuevos"] == 0
+
+    # Si el lote se incorpora al archivo, no queda dos veces
+    crimenes = leer_crimenes(ruta)
+    agregados = con_geometria(lote)
+    agregados["fecha"] = pd.to_datetime(agregados["fecha"])
+    pd.concat([crimenes, agregados], ignore_index=True).to_file(ruta, driver="GeoJSON")
+    assert precalcular(ruta, barrios, directorio, [])["filas"] == 1020
+
+    assert precalcular(ruta, barrios, directorio, [], conservar_ingestas=False)["ingestas"] == []
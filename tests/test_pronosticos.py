@@ -0,0 +1,116 @@
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pronosticos
+import registro_modelos
+from pronosticos import (_importar_prophet, _muestras_predictivas, columna_cuantil, predecir,
+                         pronosticar_cuantiles)
+
+logging.getLogger("cmdstanpy").disabled = True
+
+
+@pytest.fixture(autouse=True)
+def registro_temporal(tmp_path, monkeypatch):
+    monkeypatch.setattr(registro_modelos, "DIRECTORIO_MODELOS", str(tmp_path / "modelos"))
+    monkeypatch.setattr(registro_modelos, "_en_memoria", type(registro_modelos._en_memoria)())
+
+
+def serie(n=60, semilla=1):
+    rng = np.random.default_rng(semilla)
+    return pd.DataFrame({"ds": pd.date_range("2023-01-01", periods=n, freq="W"),
+                         "y": 50 + np.arange(n) * 0.5 + rng.normal(0, 5, n)})
+
+
+@pytest.fixture(scope="module")
+def prophet():
+    try:
+        Prophet = _importar_prophet()
+    except ImportError:
+        pytest.skip("prophet no está instalado")
+    return Prophet().fit(serie())
+
+
+def test_columnas_por_nombre_con_cualquier_orden():
+    bandas = pronosticar_cuantiles("Regresión lineal", serie(), 4, cuantiles=(0.9, 0.5, 0.1))
+    assert list(bandas.columns) == ["ds", "q10", "q50", "q90"]
+    assert columna_cuantil(0.5) == "q50" and columna_cuantil(0.05) == "q05"
+    assert (bandas["q10"] <= bandas["q50"]).all() and (bandas["q50"] <= bandas["q90"]).all()
+
+
+def test_muestras_sin_estado_global(prophet):
+    futuro = prophet.make_future_dataframe(periods=8, freq="W", include_history=False)
+    estado = np.random.get_state()[1].copy()
+    previas = prophet.uncertainty_samples
+
+    a = _muestras_predictivas(prophet, futuro, 500, np.random.default_rng(3))
+    b = _muestras_predictivas(prophet, futuro, 500, np.random.default_rng(3))
+
+    assert a.shape == (8, 500)
+    np.testing.assert_array_equal(a, b)
+    np.testing.assert_array_equal(np.random.get_state()[1], estado)
+    assert prophet.uncertainty_samples == previas
+
+
+def test_muestras_como_las_de_prophet(prophet):
+    futuro = prophet.make_future_dataframe(periods=8, freq="W", include_history=False)
+    propias = _muestras_predictivas(prophet, futuro, 4000, np.random.default_rng(0))
+    copia = copy.copy(prophet)
+    copia.uncertainty_samples = 4000
+    np.random.seed(0)
+    de_prophet = copia.predictive_samples(futuro)["yhat"]
+    np.testing.assert_allclose(np.quantile(propias, [0.1, 0.5, 0.9], axis=1),
+                               np.quantile(de_prophet, [0.1, 0.5, 0.9], axis=1), atol=1.0)
+
+
+def test_predecir_no_modifica_el_modelo(prophet):
+    previas = prophet.uncertainty_samples
+    fechas, valores = predecir("Prophet", prophet, serie(), 4)
+    assert len(valores) == 64
+    assert prophet.uncertainty_samples == previas
+
+
+class CacheLenta(OrderedDict):
+    # Se demora después de cada consulta para que otro hilo alcance a desalojar la entrada
+    def __contains__(self, clave):
+        presente = super().__contains__(clave)
+        time.sleep(0.001)
+        return presente
+
+    def get(self, clave, defecto=None):
+        valor = super().get(clave, defecto)
+        time.sleep(0.001)
+        return valor
+
+
+def test_bandas_en_memoria_entre_hilos(monkeypatch):
+    # Las sesiones piden bandas desde hilos distintos sobre una caché acotada
+    monkeypatch.setattr(pronosticos, "_bandas_en_memoria", CacheLenta())
+    monkeypatch.setattr(pronosticos, "MAX_BANDAS_EN_MEMORIA", 3)
+    monkeypatch.setattr(pronosticos, "_cuantiles_regresion", lambda nombre, train, periodos, freq, cuantiles, semilla: (
+        pd.date_range(train["ds"].iloc[-1], periods=periodos + 1, freq=freq)[1:],
+        np.zeros((len(cuantiles), periodos))))
+    datos = serie()
+    errores = []
+
+    def pedir():
+        try:
+            for i in range(40):
+                bandas = pronosticar_cuantiles("Regresión lineal", datos, 1 + i % 5)
+                assert len(bandas) == 1 + i % 5
+        except Exception as error:
+            errores.append(error)
+
+    hilos = [threading.Thread(target=pedir) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert errores == []
+    assert len(pronosticos._bandas_en_memoria) == 3
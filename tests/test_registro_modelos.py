@@ -0,0 +1,79 @@
+import os
+import time
+
+import pytest
+from sklearn.linear_model import LinearRegression
+
+import registro_modelos
+from registro_modelos import (_rutas, cargar_modelo, eliminar_modelo, guardar_modelo, purgar_registro,
+                              ultimo_modelo)
+
+
+@pytest.fixture
+def directorio(tmp_path, monkeypatch):
+    monkeypatch.setattr(registro_modelos, "_en_memoria", type(registro_modelos._en_memoria)())
+    return str(tmp_path / "modelos")
+
+
+def guardar(clave, directorio, serie="ciudad", **metadata):
+    modelo = LinearRegression().fit([[0], [1]], [0, 1])
+    return guardar_modelo(clave, modelo, dict({"modelo": "Regresión lineal", "serie": serie}, **metadata),
+                          directorio)
+
+
+def envejecer(clave, directorio, segundos):
+    ruta = _rutas(clave, directorio)[1]
+    antes = time.time() - segundos
+    os.utime(ruta, (antes, antes))
+    return antes
+
+
+def test_uso_desde_memoria_renueva_la_fecha(directorio):
+    guardar("a", directorio)
+    antes = envejecer("a", directorio, 3600)
+    assert cargar_modelo("a", directorio) is not None
+    assert os.path.getmtime(_rutas("a", directorio)[1]) > antes
+
+
+def test_desalojo_por_tamano_respeta_el_ultimo_uso(directorio):
+    for clave in ("a", "b", "c"):
+        guardar(clave, directorio)
+    for i, clave in enumerate(("a", "b", "c")):
+        envejecer(clave, directorio, 300 - i)
+    # "a" era el más antiguo, pero se acaba de usar (desde memoria)
+    cargar_modelo("a", directorio)
+    tamano = sum(os.path.getsize(r) for clave in ("a", "c") for r in _rutas(clave, directorio))
+    eliminados = purgar_registro(directorio, max_bytes=tamano)
+    assert eliminados == ["b"]
+
+
+def test_memoria_acotada(directorio, monkeypatch):
+    monkeypatch.setattr(registro_modelos, "MAX_MODELOS_EN_MEMORIA", 2)
+    for clave in ("a", "b", "c"):
+        guardar(clave, directorio)
+    assert list(registro_modelos._en_memoria) == ["b", "c"]
+    # El desalojado de memoria se vuelve a leer del disco
+    assert cargar_modelo("a", directorio) is not None
+    assert list(registro_modelos._en_memoria) == ["c", "a"]
+
+
+def test_ultimo_modelo_sin_leer_todo_el_registro(directorio, monkeypatch):
+    guardar("viejo", directorio, ventana={"periodos": 12})
+    guardar("otra_serie", directorio, serie="barrio:X", ventana={"periodos": 12})
+    guardar("nuevo", directorio, ventana={"periodos": 8})
+
+    def prohibido(*args, **kwargs):
+        raise AssertionError("ultimo_modelo no debe recorrer el registro")
+
+    monkeypatch.setattr(registro_modelos, "listar_modelos", prohibido)
+
+    assert ultimo_modelo("ciudad", "Regresión lineal", directorio)[1]["clave"] == "nuevo"
+    con_ventana = ultimo_modelo("ciudad", "Regresión lineal", directorio,
+                                filtro=lambda m: m["ventana"]["periodos"] == 12)
+    assert con_ventana[1]["clave"] == "viejo"
+    assert ultimo_modelo("barrio:X", "Regresión lineal", directorio)[1]["clave"] == "otra_serie"
+    assert ultimo_modelo("tipo:Y", "Regresión lineal", directorio) is None
+
+    # Un modelo desalojado se salta y se usa el anterior
+    eliminar_modelo("nuevo", directorio)
+    assert ultimo_modelo("ciudad", "Regresión lineal", directorio)[1]["clave"] == "viejo"
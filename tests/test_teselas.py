@@ -0,0 +1,129 @@
+import math
+import os
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+import teselas
+from datos import RUTA_BARRIOS, cargar_barrios
+from teselas import (_grados, a_mercator, iniciar_servidor, limites_tesela, registrar_poligonos,
+                     registrar_puntos, tesela, url_capa)
+
+from conftest import RAIZ
+
+# Las pruebas que arman teselas necesitan el paquete opcional
+con_mvt = pytest.mark.skipif(not teselas.DISPONIBLE, reason="requiere mapbox_vector_tile")
+
+
+def indice_tesela(lon, lat, z):
+    n = 2 ** z
+    tx = int((lon + 180) / 360 * n)
+    ty = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return tx, ty
+
+
+@pytest.fixture(scope="module")
+def servidor():
+    servidor = iniciar_servidor(puerto=0)
+    yield servidor
+    servidor["http"].shutdown()
+
+
+@pytest.fixture(scope="module")
+def puntos():
+    rng = np.random.default_rng(3)
+    x = rng.uniform(-74.90, -74.75, 5000)
+    y = rng.uniform(10.90, 11.05, 5000)
+    codigos = rng.integers(-1, 3, 5000)
+    return x, y, codigos
+
+
+def test_limites_de_las_teselas():
+    xmin, ymin, xmax, ymax = limites_tesela(0, 0, 0)
+    assert (xmin, xmax) == pytest.approx((-teselas.MITAD_MUNDO, teselas.MITAD_MUNDO))
+    assert (ymin, ymax) == pytest.approx((-teselas.MITAD_MUNDO, teselas.MITAD_MUNDO))
+
+    tx, ty = indice_tesela(-74.8, 11.0, 14)
+    lon_min, lat_min, lon_max, lat_max = _grados(limites_tesela(14, tx, ty))
+    assert lon_min <= -74.8 < lon_max and lat_min <= 11.0 < lat_max
+    mx, my = a_mercator(np.array([lon_min, lon_max]), np.array([lat_min, lat_max]))
+    np.testing.assert_allclose([mx[0], my[0], mx[1], my[1]], limites_tesela(14, tx, ty), atol=1e-6)
+
+
+@con_mvt
+@pytest.mark.parametrize("z", [11, 13, 15])
+def test_tesela_de_puntos_con_los_de_sus_limites(servidor, puntos, z):
+    import mapbox_vector_tile
+
+    x, y, codigos = puntos
+    clave = registrar_puntos(servidor, "puntos", x, y, codigos, ["a", "b", "c"])
+    tx, ty = indice_tesela(-74.82, 10.98, z)
+    lon_min, lat_min, lon_max, lat_max = _grados(limites_tesela(z, tx, ty))
+    dentro = (x >= lon_min) & (x <= lon_max) & (y >= lat_min) & (y <= lat_max)
+
+    datos = tesela(servidor, clave, z, tx, ty)
+    features = mapbox_vector_tile.decode(datos)["capa"]["features"] if dentro.any() else []
+    assert len(features) == dentro.sum()
+    nombres = np.array(["a", "b", "c", None], dtype=object)
+    assert sorted(map(str, (f["properties"].get("categoria") for f in features))) == \
+        sorted(map(str, nombres[codigos[dentro]]))
+    # La segunda vez sale del caché
+    assert tesela(servidor, clave, z, tx, ty) is datos
+
+
+@con_mvt
+def test_tesela_con_muestra_de_puntos(servidor, puntos, monkeypatch):
+    import mapbox_vector_tile
+
+    monkeypatch.setattr(teselas, "MAX_PUNTOS_TESELA", 100)
+    x, y, codigos = puntos
+    clave = registrar_puntos(servidor, "muestra", x, y, codigos, ["a", "b", "c"])
+    tx, ty = indice_tesela(-74.82, 10.98, 8)
+    features = mapbox_vector_tile.decode(tesela(servidor, clave, 8, tx, ty))["capa"]["features"]
+    assert 0 < len(features) <= 100
+
+
+@con_mvt
+def test_tesela_de_barrios(servidor):
+    import mapbox_vector_tile
+
+    gdf_barrios = cargar_barrios(os.path.join(RAIZ, RUTA_BARRIOS))
+    clave = registrar_poligonos(servidor, "barrios", gdf_barrios, ["NOMBRE"])
+    tx, ty = indice_tesela(-74.82, 10.98, 12)
+    features = mapbox_vector_tile.decode(tesela(servidor, clave, 12, tx, ty))["capa"]["features"]
+    nombres = {f["properties"]["NOMBRE"] for f in features}
+    assert nombres and nombres <= set(gdf_barrios["NOMBRE"])
+
+
+def test_capas_acotadas(monkeypatch):
+    monkeypatch.setattr(teselas, "MAX_CAPAS", 2)
+    servidor = iniciar_servidor(puerto=0)
+    for clave in ("uno", "dos", "uno", "tres"):
+        registrar_puntos(servidor, clave, np.array([-74.8]), np.array([11.0]), np.array([0]), ["a"])
+    servidor["http"].shutdown()
+    # Registrar otra vez "uno" lo marca como usado: el desalojado es "dos"
+    assert list(servidor["capas"]) == ["uno", "tres"]
+    assert tesela(servidor, "dos", 12, 0, 0) is None
+
+
+def pedir(url):
+    try:
+        with urllib.request.urlopen(url, timeout=10) as respuesta:
+            return respuesta.status, respuesta.headers, respuesta.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.headers, b""
+
+
+def test_servidor_http(servidor, puntos):
+    x, y, codigos = puntos
+    clave = registrar_puntos(servidor, "http", x, y, codigos, ["a", "b", "c"])
+    assert pedir(f"{servidor['url']}/no-existe/12/0/0.pbf")[0] == 404
+    assert pedir(f"{servidor['url']}/{clave}/doce/0/0.pbf")[0] == 400
+    if teselas.DISPONIBLE:
+        tx, ty = indice_tesela(-74.82, 10.98, 13)
+        url = url_capa(servidor, clave).format(z=13, x=tx, y=ty)
+        estado, cabeceras, datos = pedir(url)
+        assert estado == 200 and cabeceras["Content-Type"] == "application/x-protobuf"
+        assert datos == tesela(servidor, clave, 13, tx, ty)
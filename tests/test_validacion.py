@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+
+from datos import RUTA_CRIMENES, leer_tabla
+from validacion import validar
+
+from conftest import RAIZ
+
+
+def reglas(informe):
+    return dict(zip(informe["regla"], informe["filas"]))
+
+
+def test_datos_de_ejemplo_sin_errores(tabla_crimenes):
+    informe, validas = validar(tabla_crimenes, tabla_crimenes["tipo_crimen"].unique())
+    assert validas.all()
+    assert (informe["severidad"] != "error").all()
+
+
+def test_con_geometria_igual_que_con_coordenadas(tabla_crimenes):
+    con_geometria = leer_tabla(os.path.join(RAIZ, RUTA_CRIMENES))
+    np.testing.assert_array_equal(validar(con_geometria)[1], validar(tabla_crimenes)[1])
+
+
+def test_cada_regla_cuenta_sus_filas(tabla_crimenes):
+    lote = tabla_crimenes.head(10).copy().reset_index(drop=True)
+    lote = lote.astype(object)
+    lote.loc[0, "id"] = "abc"
+    lote.loc[1, "id"] = lote.loc[2, "id"]
+    lote.loc[3, "longitud"] = -75.5
+    lote.loc[4, "latitud"] = np.nan
+    lote.loc[5, "fecha"] = "2024-02-30"
+    lote.loc[6, "hora"] = "25:00"
+    lote.loc[7, "edad"] = 150
+    lote.loc[7, "sexo"] = "X"
+    lote.loc[8, "tipo_crimen"] = "Hurto simpel"
+    lote.loc[9, "tipo_crimen"] = None
+
+    informe, validas = validar(lote, ["Hurto simple"] + list(tabla_crimenes["tipo_crimen"].unique()))
+    conteos = reglas(informe)
+    assert conteos["id_invalido"] == 1 and conteos["id_repetido"] == 2
+    assert conteos["fuera_de_barranquilla"] == 1 and conteos["coordenadas_invalidas"] == 1
+    assert conteos["fecha_invalida"] == 1 and conteos["hora_invalida"] == 1
+    assert conteos["edad_fuera_de_rango"] == 1 and conteos["sexo_desconocido"] == 1
+    assert conteos["tipo_crimen_faltante"] == 1 and conteos["tipo_crimen_desconocido"] == 1
+    assert "'Hurto simpel' → 'Hurto simple'" in informe.set_index("regla").loc["tipo_crimen_desconocido", "detalle"]
+    # Solo los errores descartan la fila; las advertencias no
+    np.testing.assert_array_equal(np.flatnonzero(~validas), [0, 3, 4, 5, 9])
+
+
+def test_columnas_faltantes(tabla_crimenes):
+    informe, validas = validar(tabla_crimenes.drop(columns=["fecha", "latitud"]))
+    assert not validas.any()
+    assert informe["regla"].tolist() == ["columna_faltante"]
+    assert informe["columna"].iloc[0] == "fecha, latitud"
@@ -0,0 +1,141 @@
+# Validación de archivos de crímenes antes de construir geometrías o normalizar
+#
+# Cada regla es una comprobación vectorizada sobre columnas completas, así que validar es
+# una sola pasada lineal aunque el archivo tenga millones de filas. El resultado es un
+# informe por regla (cuántas filas fallan y algunos ids de ejemplo) y la máscara de filas
+# utilizables: las reglas de severidad "error" descartan la fila, las "advertencia" no.
+import difflib
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from datos import GRUPOS_SOCIALES
+
+# lon mínima, lat mínima, lon máxima, lat máxima (los barrios con un margen)
+BBOX_BARRANQUILLA = (-74.95, 10.85, -74.70, 11.15)
+COLUMNAS_REQUERIDAS = ["id", "fecha", "tipo_crimen"]
+SEXOS = ["M", "F"]
+EDAD_MAXIMA = 110
+EJEMPLOS = 5
+
+
+def _coordenadas(df):
+    # (x, y) desde la geometría si existe, si no desde longitud/latitud; NaN si no se puede
+    if "geometry" in df.columns:
+        geometrias = np.asarray(df["geometry"].values, dtype=object)
+        return shapely.get_x(geometrias), shapely.get_y(geometrias)
+    return (pd.to_numeric(df["longitud"], errors="coerce").to_numpy(dtype=np.float64),
+            pd.to_numeric(df["latitud"], errors="coerce").to_numpy(dtype=np.float64))
+
+
+def _fechas(serie, formato=None):
+    # Fechas y horas se repiten mucho: se interpreta cada valor distinto una sola vez
+    codigos, unicos = pd.factorize(serie)
+    interpretados = pd.to_datetime(pd.Series(unicos, dtype=object).astype(str).str.strip(),
+                                   format=formato, errors="coerce").to_numpy()
+    resultado = np.full(len(serie), np.datetime64("NaT"), dtype=interpretados.dtype)
+    validos = codigos >= 0
+    resultado[validos] = interpretados[codigos[validos]]
+    return pd.Series(resultado, index=serie.index)
+
+
+def _sugerencias(desconocidos, validos):
+    pares = []
+    for valor in desconocidos[:EJEMPLOS]:
+        parecido = difflib.get_close_matches(str(valor), validos, n=1, cutoff=0.6)
+        pares.append(f"'{valor}' → '{parecido[0]}'" if parecido else f"'{valor}'")
+    return ", ".join(pares)
+
+
+def validar(df, tipos_validos=None, bbox=BBOX_BARRANQUILLA):
+    # Devuelve (informe, validas). Si faltan columnas requeridas ninguna fila es válida.
+    n = len(df)
+    reglas = []
+
+    def agregar(regla, columna, severidad, mascara, detalle=""):
+        mascara = np.asarray(mascara, dtype=bool)
+        if mascara.any():
+            reglas.append((regla, columna, severidad, mascara, detalle))
+
+    faltantes = [c for c in COLUMNAS_REQUERIDAS if c not in df.columns]
+    if "geometry" not in df.columns:
+        faltantes += [c for c in ("longitud", "latitud") if c not in df.columns]
+    if faltantes:
+        agregar("columna_faltante", ", ".join(faltantes), "error", np.ones(n, dtype=bool),
+                "Columnas requeridas: " + ", ".join(COLUMNAS_REQUERIDAS + ["longitud", "latitud"]))
+        return _informe(df, reglas), np.zeros(n, dtype=bool)
+
+    ids = pd.to_numeric(df["id"], errors="coerce")
+    agregar("id_invalido", "id", "error", ids.isna())
+    agregar("id_repetido", "id", "advertencia", ids.notna() & ids.duplicated(keep=False))
+
+    x, y = _coordenadas(df)
+    sin_coordenadas = np.isnan(x) | np.isnan(y)
+    agregar("coordenadas_invalidas", "longitud/latitud", "error", sin_coordenadas)
+    lon_min, lat_min, lon_max, lat_max = bbox
+    afuera = ~sin_coordenadas & ((x < lon_min) | (x > lon_max) | (y < lat_min) | (y > lat_max))
+    agregar("fuera_de_barranquilla", "longitud/latitud", "error", afuera,
+            f"Fuera de lon [{lon_min}, {lon_max}], lat [{lat_min}, {lat_max}]")
+
+    fechas = _fechas(df["fecha"])
+    agregar("fecha_invalida", "fecha", "error", fechas.isna())
+
+    if "hora" in df.columns:
+        horas = _fechas(df["hora"], formato="%H:%M")
+        agregar("hora_invalida", "hora", "advertencia", horas.isna(), "Formato esperado H:MM (0:00 a 23:59)")
+
+    if "edad" in df.columns:
+        edades = pd.to_numeric(df["edad"], errors="coerce")
+        agregar("edad_fuera_de_rango", "edad", "advertencia",
+                df["edad"].notna() & ~edades.between(0, EDAD_MAXIMA), f"Entre 0 y {EDAD_MAXIMA}")
+
+    if "sexo" in df.columns:
+        agregar("sexo_desconocido", "sexo", "advertencia",
+                df["sexo"].notna() & ~df["sexo"].isin(SEXOS), "Valores permitidos: " + ", ".join(SEXOS))
+
+    agregar("tipo_crimen_faltante", "tipo_crimen", "error", df["tipo_crimen"].isna())
+    if tipos_validos:
+        desconocido = df["tipo_crimen"].notna() & ~df["tipo_crimen"].isin(list(tipos_validos))
+        if desconocido.any():
+            valores = pd.unique(df["tipo_crimen"][desconocido])
+            agregar("tipo_crimen_desconocido", "tipo_crimen", "advertencia", desconocido,
+                    _sugerencias(list(valores), list(tipos_validos)))
+
+    for grupo in GRUPOS_SOCIALES:
+        if grupo in df.columns:
+            valor = pd.to_numeric(df[grupo], errors="coerce")
+            agregar("grupo_social_invalido", grupo, "advertencia",
+                    df[grupo].notna() & ~valor.isin([0, 1]), "Valores permitidos: 0, 1")
+
+    if "dia_semana" in df.columns:
+        dia = pd.to_numeric(df["dia_semana"], errors="coerce")
+        agregar("dia_semana_inconsistente", "dia_semana", "advertencia",
+                fechas.notna() & (dia != fechas.dt.dayofweek), "0 = lunes, según la fecha")
+
+    errores = np.zeros(n, dtype=bool)
+    for _, _, severidad, mascara, _ in reglas:
+        if severidad == "error":
+            errores |= mascara
+    return _informe(df, reglas), ~errores
+
+
+def _informe(df, reglas):
+    # Una fila por regla que falló, con ids de ejemplo (o el número de fila si no hay id)
+    if "id" in df.columns:
+        etiquetas = df["id"].to_numpy()
+    else:
+        etiquetas = np.arange(len(df))
+    filas = []
+    for regla, columna, severidad, mascara, detalle in reglas:
+        posiciones = np.flatnonzero(mascara)[:EJEMPLOS]
+        ejemplos = [f"fila {p}" if pd.isna(etiquetas[p]) else etiquetas[p] for p in posiciones]
+        filas.append({
+            "regla": regla,
+            "columna": columna,
+            "severidad": severidad,
+            "filas": int(mascara.sum()),
+            "ejemplos": ", ".join(str(e) for e in ejemplos),
+            "detalle": detalle,
+        })
+    return pd.DataFrame(filas, columns=["regla", "columna", "severidad", "filas", "ejemplos", "detalle"])